@@ -0,0 +1,136 @@
+# Description:  This file contains the queries of the admin dashboard.
+# Path:         app/admin.py
+# Author:       Capucinoxx
+# Date:         2024
+
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.models import Challenge, Submission, Team, User
+
+
+def team_names(team_ids: Iterable[Any]) -> Dict[Any, str]:
+  """
+    Loads the names of teams with a single query.
+
+    Args:
+      team_ids (Iterable[Any]): The IDs of the teams.
+
+    Returns:
+      Dict[Any, str]: The name of each team, keyed by ID.
+  """
+  team_ids = list({team_id for team_id in team_ids if team_id is not None})
+  if not team_ids:
+    return {}
+
+  cursor = Team._get_collection().find({'_id': {'$in': team_ids}}, {'name': 1})
+  return {document['_id']: document.get('name') for document in cursor}
+
+
+
+def list_users() -> List[dict]:
+  """
+    Lists the users with the name of their team, in two queries.
+
+    Returns:
+      List[dict]: The username and the team of each user.
+  """
+  users = list(User._get_collection().find({}, {'username': 1, 'team': 1}).sort('username', 1))
+  names = team_names(user.get('team') for user in users)
+
+  return [{
+    'id': str(user['_id']),
+    'username': user.get('username'),
+    'team': {'id': str(user['team']), 'name': names.get(user['team'])} if user.get('team') else None,
+  } for user in users]
+
+
+
+def list_challenges() -> List[dict]:
+  """
+    Lists the challenges without their image.
+
+    Returns:
+      List[dict]: The ID and the name of each challenge.
+  """
+  cursor = Challenge._get_collection().find({}, {'name': 1}).sort('_id', 1)
+  return [{'id': challenge['_id'], 'name': challenge.get('name')} for challenge in cursor]
+
+
+
+def encode_cursor(round_number: int, team_id: Any) -> str:
+  return f'{round_number}:{team_id}'
+
+
+
+def decode_cursor(cursor: Union[str, None]) -> Union[Tuple[int, ObjectId], None]:
+  """
+    Parses a pagination cursor.
+
+    Args:
+      cursor (Union[str, None]): The cursor returned with the previous page.
+
+    Returns:
+      Union[Tuple[int, ObjectId], None]: The round number and the team of the last submission
+                                         of the previous page, or None for the first page.
+  """
+  if not cursor:
+    return None
+
+  try:
+    round_number, team_id = cursor.split(':', 1)
+    return int(round_number), ObjectId(team_id)
+  except (ValueError, InvalidId):
+    return None
+
+
+
+def list_submissions(cursor: Union[str, None] = None, round_number: Union[int, None] = None,
+                     limit: int = 50) -> Tuple[List[dict], Union[str, None]]:
+  """
+    Lists a page of submissions, from the latest round to the first, without their code.
+    The pages follow the (-round_number, team) index: a page starts after the last
+    submission of the previous one instead of skipping the previous pages.
+
+    Args:
+      cursor (Union[str, None]): The cursor returned with the previous page.
+      round_number (Union[int, None]): Only lists the submissions of this round.
+      limit (int): The maximum number of submissions of the page.
+
+    Returns:
+      Tuple[List[dict], Union[str, None]]: The submissions, and the cursor of the next page.
+  """
+  query: Dict[str, Any] = {}
+  if round_number is not None:
+    query['round_number'] = round_number
+
+  after = decode_cursor(cursor)
+  if after is not None:
+    last_round, last_team = after
+    query['$or'] = [
+      {'round_number': {'$lt': last_round}},
+      {'round_number': last_round, 'team': {'$gt': last_team}},
+    ]
+
+  projection = {'team': 1, 'round_number': 1, 'timestamp': 1, 'score': 1, 'points': 1, 'rank': 1}
+  submissions = list(Submission._get_collection().find(query, projection)
+                     .sort([('round_number', -1), ('team', 1)])
+                     .limit(limit + 1))
+
+  next_cursor = None
+  if len(submissions) > limit:
+    submissions = submissions[:limit]
+    next_cursor = encode_cursor(submissions[-1]['round_number'], submissions[-1]['team'])
+
+  names = team_names(submission.get('team') for submission in submissions)
+  return [{
+    'id': str(submission['_id']),
+    'team': {'id': str(submission.get('team')), 'name': names.get(submission.get('team'))},
+    'round_number': submission.get('round_number'),
+    'timestamp': submission['timestamp'].isoformat() if submission.get('timestamp') else None,
+    'score': submission.get('score'),
+    'points': submission.get('points'),
+    'rank': submission.get('rank'),
+  } for submission in submissions], next_cursor
@@ -0,0 +1,459 @@
+# Description:  This file contains the backend sharing the round state between the workers.
+# Path:         app/backend.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import os
+import socket
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Union
+
+import eventlet
+from eventlet.semaphore import Semaphore
+from flask import Flask
+
+from app.cmd.app import app
+
+try:
+  import redis
+except ImportError:
+  redis = None
+
+
+class LocalBackend:
+  """
+    An in-process stand-in for the subset of Redis used by the workers: keys with an
+    expiration, hashes and publish/subscribe, with the semantics of the Redis commands.
+    It only shares the state within a single worker.
+  """
+  shared = False
+
+  def __init__(self):
+    self.__values: Dict[str, Any] = {}
+    self.__expires: Dict[str, float] = {}
+    self.__subscribers: Dict[str, List[Callable]] = {}
+    self.__lock = Semaphore()
+
+
+  def get(self, key: str) -> Union[str, None]:
+    with self.__lock:
+      return self.__get(key)
+
+
+  def set(self, key: str, value: str, nx: bool = False, px: Union[int, None] = None) -> bool:
+    """
+      Sets a key, as `SET key value [NX] [PX milliseconds]`.
+
+      Returns:
+        bool: False if `nx` is set and the key already exists, otherwise True.
+    """
+    with self.__lock:
+      if nx and self.__get(key) is not None:
+        return False
+
+      self.__values[key] = value
+      if px is None:
+        self.__expires.pop(key, None)
+      else:
+        self.__expires[key] = time.monotonic() + px / 1000
+      return True
+
+
+  def renew(self, key: str, value: str, px: int) -> bool:
+    """
+      Extends the expiration of a key if it still holds the value.
+
+      Returns:
+        bool: True if the key was renewed, otherwise False.
+    """
+    with self.__lock:
+      if self.__get(key) != value:
+        return False
+      self.__expires[key] = time.monotonic() + px / 1000
+      return True
+
+
+  def release(self, key: str, value: str) -> bool:
+    """
+      Deletes a key if it still holds the value.
+
+      Returns:
+        bool: True if the key was deleted, otherwise False.
+    """
+    with self.__lock:
+      if self.__get(key) != value:
+        return False
+      self.__delete(key)
+      return True
+
+
+  def delete(self, key: str) -> None:
+    with self.__lock:
+      self.__delete(key)
+
+
+  def hset(self, key: str, field: str, value: str) -> None:
+    with self.__lock:
+      fields = self.__get(key)
+      if fields is None:
+        fields = self.__values[key] = {}
+      fields[field] = value
+
+
+  def hset_if(self, key: str, field: str, value: str, guard: str, expected: str) -> bool:
+    """
+      Sets a field of a hash if another key holds the expected value, atomically.
+
+      Returns:
+        bool: True if the field was set, otherwise False.
+    """
+    with self.__lock:
+      if self.__get(guard) != expected:
+        return False
+
+      fields = self.__get(key)
+      if fields is None:
+        fields = self.__values[key] = {}
+      fields[field] = value
+      return True
+
+
+  def hmget(self, key: str, fields: List[str]) -> List[Union[str, None]]:
+    with self.__lock:
+      values = self.__get(key) or {}
+      return [values.get(field) for field in fields]
+
+
+  def hgetall(self, key: str) -> Dict[str, str]:
+    with self.__lock:
+      return dict(self.__get(key) or {})
+
+
+  def hdrain(self, key: str) -> Dict[str, str]:
+    """
+      Reads and deletes a hash atomically.
+
+      Returns:
+        Dict[str, str]: The fields of the hash.
+    """
+    with self.__lock:
+      fields = self.__get(key) or {}
+      self.__delete(key)
+      return dict(fields)
+
+
+  def publish(self, channel: str, message: str) -> None:
+    """
+      Delivers a message to the subscribers of a channel, each in its own green thread.
+    """
+    with self.__lock:
+      callbacks = list(self.__subscribers.get(channel, []))
+    for callback in callbacks:
+      eventlet.spawn(callback, message)
+
+
+  def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+    with self.__lock:
+      self.__subscribers.setdefault(channel, []).append(callback)
+
+
+  def __get(self, key: str) -> Any:
+    expires = self.__expires.get(key)
+    if expires is not None and expires <= time.monotonic():
+      self.__delete(key)
+    return self.__values.get(key)
+
+
+  def __delete(self, key: str) -> None:
+    self.__values.pop(key, None)
+    self.__expires.pop(key, None)
+
+
+
+class RedisBackend:
+  """
+    The backend shared by the workers through a Redis server.
+  """
+  shared = True
+
+  # Compare-and-renew and compare-and-delete, so a lease is only touched by its holder
+  RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+  RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+  # Compare-and-hset, so a field is only set while the guard key holds the expected value
+  HSET_IF = "if redis.call('get', KEYS[2]) == ARGV[3] then redis.call('hset', KEYS[1], ARGV[1], ARGV[2]) return 1 end return 0"
+
+  def __init__(self, url: str):
+    self.__client = redis.Redis.from_url(url, decode_responses=True)
+    self.__renew = self.__client.register_script(self.RENEW)
+    self.__release = self.__client.register_script(self.RELEASE)
+    self.__hset_if = self.__client.register_script(self.HSET_IF)
+    self.__pubsub = None
+
+
+  def get(self, key: str) -> Union[str, None]:
+    return self.__client.get(key)
+
+
+  def set(self, key: str, value: str, nx: bool = False, px: Union[int, None] = None) -> bool:
+    return bool(self.__client.set(key, value, nx=nx, px=px))
+
+
+  def renew(self, key: str, value: str, px: int) -> bool:
+    return bool(self.__renew(keys=[key], args=[value, px]))
+
+
+  def release(self, key: str, value: str) -> bool:
+    return bool(self.__release(keys=[key], args=[value]))
+
+
+  def delete(self, key: str) -> None:
+    self.__client.delete(key)
+
+
+  def hset(self, key: str, field: str, value: str) -> None:
+    self.__client.hset(key, field, value)
+
+
+  def hset_if(self, key: str, field: str, value: str, guard: str, expected: str) -> bool:
+    return bool(self.__hset_if(keys=[key, guard], args=[field, value, expected]))
+
+
+  def hmget(self, key: str, fields: List[str]) -> List[Union[str, None]]:
+    return self.__client.hmget(key, fields)
+
+
+  def hgetall(self, key: str) -> Dict[str, str]:
+    return self.__client.hgetall(key)
+
+
+  def hdrain(self, key: str) -> Dict[str, str]:
+    pipeline = self.__client.pipeline(transaction=True)
+    pipeline.hgetall(key)
+    pipeline.delete(key)
+    return pipeline.execute()[0]
+
+
+  def publish(self, channel: str, message: str) -> None:
+    self.__client.publish(channel, message)
+
+
+  def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+    """
+      Subscribes to a channel. The messages are read by a single green thread shared by
+      the subscriptions, and each is handled in its own green thread.
+    """
+    listen = self.__pubsub is None
+    if listen:
+      self.__pubsub = self.__client.pubsub(ignore_subscribe_messages=True)
+
+    self.__pubsub.subscribe(**{channel: lambda message: eventlet.spawn(callback, message['data'])})
+    if listen:
+      eventlet.spawn(self.__listen)
+
+
+  def __listen(self) -> None:
+    while True:
+      try:
+        self.__pubsub.get_message(timeout=1)
+      except redis.RedisError as e:
+        app.logger.error(f'Lost the subscriptions of the backend: {e!r}')
+        eventlet.sleep(1)
+
+
+
+class Backend:
+  """
+    The store and the message bus shared by the workers. Without `BACKEND_URL`, an
+    in-process stand-in is used and the app must run as a single worker.
+  """
+  def __init__(self):
+    self.__backend: Union[LocalBackend, RedisBackend] = LocalBackend()
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the Backend with the configurations of the Flask app.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    url = app.config.get('BACKEND_URL')
+    if not url:
+      return
+
+    if redis is None:
+      raise RuntimeError('BACKEND_URL requires the redis package')
+    self.__backend = RedisBackend(url)
+
+
+  @property
+  def shared(self) -> bool:
+    return self.__backend.shared
+
+
+  def get(self, key: str) -> Union[str, None]:
+    return self.__backend.get(key)
+
+
+  def set(self, key: str, value: str, nx: bool = False, px: Union[int, None] = None) -> bool:
+    return self.__backend.set(key, value, nx=nx, px=px)
+
+
+  def renew(self, key: str, value: str, px: int) -> bool:
+    return self.__backend.renew(key, value, px)
+
+
+  def release(self, key: str, value: str) -> bool:
+    return self.__backend.release(key, value)
+
+
+  def delete(self, key: str) -> None:
+    self.__backend.delete(key)
+
+
+  def hset(self, key: str, field: str, value: str) -> None:
+    self.__backend.hset(key, field, value)
+
+
+  def hset_if(self, key: str, field: str, value: str, guard: str, expected: str) -> bool:
+    return self.__backend.hset_if(key, field, value, guard, expected)
+
+
+  def hmget(self, key: str, fields: List[str]) -> List[Union[str, None]]:
+    return self.__backend.hmget(key, fields)
+
+
+  def hgetall(self, key: str) -> Dict[str, str]:
+    return self.__backend.hgetall(key)
+
+
+  def hdrain(self, key: str) -> Dict[str, str]:
+    return self.__backend.hdrain(key)
+
+
+  def publish(self, channel: str, message: str) -> None:
+    self.__backend.publish(channel, message)
+
+
+  def subscribe(self, channel: str, callback: Callable[[str], None]) -> None:
+    self.__backend.subscribe(channel, callback)
+
+
+
+class LeaderElection:
+  """
+    Elects the worker driving the round transitions, with a lease stored in the backend:
+    the leader renews it every third of its TTL, and another worker takes it over once it
+    expires.
+
+    Without a shared backend, the single worker leads for good: a lease which expires
+    when the hub stalls would only interrupt its own rounds.
+  """
+  KEY = 'round:leader'
+
+  def __init__(self):
+    self.__id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    self.__ttl = 5
+    self.__is_leader = False
+    self.__on_elected = None
+    self.__on_demoted = None
+    self.__thread = None
+
+    self.elections = 0
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the LeaderElection with the configurations of the Flask app.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    self.__ttl = app.config.get('LEADER_TTL', 5)
+
+
+  @property
+  def id(self) -> str:
+    return self.__id
+
+
+  @property
+  def is_leader(self) -> bool:
+    return self.__is_leader
+
+
+  def start(self, on_elected: Callable[[], None], on_demoted: Callable[[], None]) -> None:
+    """
+      Campaigns for the lease, once right away then in the background.
+
+      Args:
+        on_elected (Callable[[], None]): Called when this worker becomes the leader.
+        on_demoted (Callable[[], None]): Called when this worker loses the lease.
+    """
+    self.__on_elected, self.__on_demoted = on_elected, on_demoted
+    if not backend.shared:
+      if not self.__is_leader:
+        self.__is_leader = True
+        self.elections += 1
+        on_elected()
+      return
+
+    self.__campaign()
+    if self.__thread is None:
+      self.__thread = eventlet.spawn(self.__run)
+
+
+  def stop(self) -> None:
+    """
+      Stops campaigning and releases the lease, so another worker takes over right away.
+    """
+    thread, self.__thread = self.__thread, None
+    if thread is not None:
+      thread.kill()
+
+    if self.__is_leader:
+      self.__is_leader = False
+      backend.release(self.KEY, self.__id)
+
+
+  def stats(self) -> dict:
+    return {'leader': self.__is_leader, 'elections': self.elections}
+
+
+  def __run(self) -> None:
+    while True:
+      eventlet.sleep(self.__ttl / 3)
+      self.__campaign()
+
+
+  def __campaign(self) -> None:
+    """
+      Renews the lease of the leader, or tries to acquire it.
+    """
+    ttl = int(self.__ttl * 1000)
+    try:
+      if self.__is_leader:
+        elected = backend.renew(self.KEY, self.__id, ttl)
+      else:
+        elected = backend.set(self.KEY, self.__id, nx=True, px=ttl)
+    except Exception as e:
+      app.logger.error(f'Unable to reach the backend: {e!r}')
+      elected = False
+
+    if elected == self.__is_leader:
+      return
+
+    self.__is_leader = elected
+    if elected:
+      self.elections += 1
+      app.logger.warning(f'Worker {self.__id} elected to drive the rounds')
+      self.__on_elected()
+    else:
+      app.logger.warning(f'Worker {self.__id} lost the lead of the rounds')
+      self.__on_demoted()
+
+
+
+backend = Backend()
+election = LeaderElection()
@@ -0,0 +1,171 @@
+# Description:  This file contains the content-addressed store of the submission bodies.
+# Path:         app/blobstore.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import hashlib
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from flask import Flask
+from pymongo import UpdateOne
+
+from app.database import db
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+
+class Blob(db.Document):
+  """
+    Class used to represent a compressed submission body, keyed by the hash of its content.
+    A blob is shared by every submission with the same body and counts its references.
+  """
+  meta = {'collection': 'blobs'}
+
+  digest   = db.StringField(primary_key=True)
+  data     = db.BinaryField()
+  encoding = db.StringField()
+  size     = db.IntField()
+  refs     = db.IntField(default=0)
+
+
+
+def body_digest(body: str) -> str:
+  """
+    Computes the key of a submission body.
+
+    Args:
+      body (str): The body.
+
+    Returns:
+      str: The SHA-256 hex digest of the body.
+  """
+  return hashlib.sha256(body.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+
+class BlobStore:
+  """
+    Stores the submission bodies once per distinct content, compressed with zlib (or zstd,
+    if installed). Each reference held by a submission is counted, and a blob is deleted
+    when its last reference is released.
+  """
+  def __init__(self):
+    self.__compression = 'zlib'
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the BlobStore with the configurations of the Flask app.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    compression = app.config.get('BLOB_COMPRESSION', 'zlib')
+    self.__compression = compression if compression != 'zstd' or zstandard is not None else 'zlib'
+
+
+  def put_many(self, bodies: List[str]) -> List[str]:
+    """
+      Stores bodies with a single bulk write, adding one reference per body.
+
+      Args:
+        bodies (List[str]): The bodies to store.
+
+      Returns:
+        List[str]: The digest of each body, in the same order.
+    """
+    digests = [body_digest(body) for body in bodies]
+    if not bodies:
+      return digests
+
+    counts = Counter(digests)
+    contents = dict(zip(digests, bodies))
+    requests = []
+    for digest, count in counts.items():
+      data, encoding = self.__compress(contents[digest])
+      requests.append(UpdateOne(
+        {'_id': digest},
+        {
+          '$setOnInsert': {'data': data, 'encoding': encoding, 'size': len(contents[digest])},
+          '$inc': {'refs': count},
+        },
+        upsert=True,
+      ))
+
+    Blob._get_collection().bulk_write(requests, ordered=False)
+    return digests
+
+
+  def release(self, digests: Iterable[str]) -> None:
+    """
+      Releases one reference per digest, deleting the blobs no longer referenced.
+
+      Args:
+        digests (Iterable[str]): The digests of the released bodies.
+    """
+    counts = Counter(digest for digest in digests if digest)
+    if not counts:
+      return
+
+    collection = Blob._get_collection()
+    collection.bulk_write([
+      UpdateOne({'_id': digest}, {'$inc': {'refs': -count}}) for digest, count in counts.items()
+    ], ordered=False)
+    collection.delete_many({'_id': {'$in': list(counts)}, 'refs': {'$lte': 0}})
+
+
+  def get_many(self, digests: Iterable[str]) -> Dict[str, str]:
+    """
+      Reads and decompresses bodies with a single query.
+
+      Args:
+        digests (Iterable[str]): The digests of the bodies.
+
+      Returns:
+        Dict[str, str]: The bodies found, keyed by digest.
+    """
+    digests = list({digest for digest in digests if digest})
+    if not digests:
+      return {}
+
+    cursor = Blob._get_collection().find({'_id': {'$in': digests}}, {'data': 1, 'encoding': 1})
+    return {document['_id']: self.__decompress(document['data'], document.get('encoding')) for document in cursor}
+
+
+  def get(self, digest: str, default: str = '') -> str:
+    """
+      Reads and decompresses a body.
+
+      Args:
+        digest (str): The digest of the body.
+        default (str): The value returned if the body is not stored.
+
+      Returns:
+        str: The body.
+    """
+    return self.get_many([digest]).get(digest, default)
+
+
+  def __compress(self, body: str) -> Tuple[bytes, str]:
+    data = body.encode('utf-8', 'surrogatepass')
+    if self.__compression == 'zstd':
+      return zstandard.ZstdCompressor().compress(data), 'zstd'
+    return zlib.compress(data), 'zlib'
+
+
+  @staticmethod
+  def __decompress(data: bytes, encoding: str) -> str:
+    if encoding == 'zstd':
+      data = zstandard.ZstdDecompressor().decompress(data)
+    elif encoding == 'zlib':
+      data = zlib.decompress(data)
+    return data.decode('utf-8', 'surrogatepass')
+
+
+
+blob_store = BlobStore()
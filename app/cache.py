@@ -0,0 +1,406 @@
+# Description:  This file contains the content-addressed caches of the renders and scores.
+# Path:         app/cache.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import hashlib
+import os
+import pickle
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+from flask import Flask
+
+from app.cmd.config import CACHE_FOLDER, RENDER_CACHE_SIZE, RENDER_CACHE_SPILL_SIZE, SCORE_CACHE_SIZE
+
+
+# Age in seconds past which a temporary file is left over, even if its process id was reused
+STALE_TEMPORARY_AGE = 3600
+
+
+def content_key(challenge_id: int, html: str, css: str) -> str:
+  """
+    Computes the cache key of a submission: the hash of the cleaned code and of the challenge.
+
+    Args:
+      challenge_id (int): The ID of the challenge.
+      html (str): The cleaned HTML code.
+      css (str): The cleaned CSS code.
+
+    Returns:
+      str: The SHA-256 hex digest identifying the submission.
+  """
+  digest = hashlib.sha256(f'{challenge_id}\0'.encode('utf-8'))
+  digest.update(html.encode('utf-8'))
+  digest.update(b'\0')
+  digest.update(css.encode('utf-8'))
+  return digest.hexdigest()
+
+
+
+def sizeof(value: Any) -> int:
+  """
+    Estimates the memory used by a cached value.
+
+    Args:
+      value (Any): The cached value.
+
+    Returns:
+      int: The size of the value in bytes.
+  """
+  if isinstance(value, np.ndarray):
+    return value.nbytes
+  return sys.getsizeof(value)
+
+
+
+class LRUCache:
+  """
+    A thread-safe LRU cache bounded by the size of its values. The least recently used
+    entries are spilled to disk when the memory is full, and promoted back on access; the
+    spill folder is itself bounded and drops its oldest entries.
+
+    The spilled entries are pickled, read and removed in the native threads of tpool,
+    without the lock: the hub and the other lookups do not wait for the disk. An entry
+    being written is still served from memory.
+  """
+  def __init__(self, max_size: int, folder: Union[str, None] = None, max_spill_size: int = 0):
+    self.__data: 'OrderedDict[str, Tuple[Any, int]]' = OrderedDict()
+    self.__spilled: 'OrderedDict[str, int]' = OrderedDict()
+    self.__spilling: Dict[str, Any] = {}
+    self.__lock = Semaphore()
+    self.__max_size = max_size
+    self.__max_spill_size = max_spill_size if folder else 0
+    self.__folder = folder
+    self.__size = 0
+    self.__spill_size = 0
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.spills = 0
+    self.disk_hits = 0
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the LRUCache, indexing the entries spilled before a restart so they are
+      reused and counted in the size of the spill folder, the oldest ones first.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    if self.__max_spill_size <= 0:
+      return
+
+    entries = tpool.execute(self.__scan)
+    with self.__lock:
+      for key, size in entries:
+        if key not in self.__spilled:
+          self.__spilled[key] = size
+          self.__spill_size += size
+      dropped = self.__trim()
+    self.__remove(dropped)
+
+
+  def get(self, key: str, default: Any = None) -> Any:
+    """
+      Retrieves a value from the cache, from memory first and then from the spill folder.
+
+      Args:
+        key (str): The key to look up.
+        default (Any): The default value to return if the key is not found.
+
+      Returns:
+        Any: The cached value or the default value.
+    """
+    with self.__lock:
+      entry = self.__data.get(key)
+      if entry is not None:
+        self.__data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+      if key in self.__spilling:
+        value = self.__spilling.pop(key)
+        spilled = self.__insert(key, value)
+        self.hits += 1
+      elif key not in self.__spilled:
+        self.misses += 1
+        return default
+      else:
+        value, spilled = None, None
+
+    if spilled is None:
+      try:
+        value = tpool.execute(self.__read, key)
+      except (OSError, pickle.PickleError, EOFError):
+        value = None
+
+      with self.__lock:
+        self.__drop_spilled(key)
+        if value is None:
+          self.misses += 1
+          spilled = []
+        else:
+          spilled = self.__insert(key, value)
+          self.hits += 1
+          self.disk_hits += 1
+      self.__remove([key])
+      if value is None:
+        return default
+
+    self.__spill(spilled)
+    return value
+
+
+  def set(self, key: str, value: Any) -> None:
+    """
+      Sets the value for a key in the cache, evicting the least recently used entries
+      if the cache exceeds its size.
+
+      Args:
+        key (str): The key for the value.
+        value (Any): The value to set.
+    """
+    with self.__lock:
+      dropped = [key] if self.__drop_spilled(key) else []
+      self.__spilling.pop(key, None)
+      spilled = self.__insert(key, value)
+    self.__remove(dropped)
+    self.__spill(spilled)
+
+
+  def contains(self, key: str) -> bool:
+    """
+      Checks if a key is cached, in memory or on disk.
+
+      Args:
+        key (str): The key to check.
+
+      Returns:
+        bool: True if the key exists, False otherwise.
+    """
+    with self.__lock:
+      return key in self.__data or key in self.__spilling or key in self.__spilled
+
+
+  def stats(self) -> dict:
+    """
+      Returns the counters of the cache.
+
+      Returns:
+        dict: The hits, misses, evictions and sizes of the cache.
+    """
+    with self.__lock:
+      return {
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'spills': self.spills,
+        'disk_hits': self.disk_hits,
+        'entries': len(self.__data),
+        'size': self.__size,
+        'spilled_entries': len(self.__spilled),
+        'spilled_size': self.__spill_size,
+      }
+
+
+  def __path(self, key: str) -> str:
+    return os.path.join(self.__folder, f'{key}.pkl')
+
+
+  def __insert(self, key: str, value: Any) -> List[Tuple[str, Any]]:
+    """
+      Inserts a value in memory and evicts the entries exceeding the size of the cache.
+      Must be called with the lock held.
+
+      Returns:
+        List[Tuple[str, Any]]: The evicted entries to spill once the lock is released.
+    """
+    size = sizeof(value)
+    previous = self.__data.pop(key, None)
+    if previous is not None:
+      self.__size -= previous[1]
+
+    self.__data[key] = (value, size)
+    self.__size += size
+
+    evicted = []
+    while self.__size > self.__max_size and len(self.__data) > 1:
+      old_key, (old_value, old_size) = self.__data.popitem(last=False)
+      self.__size -= old_size
+      self.evictions += 1
+      if self.__max_spill_size > 0:
+        self.__spilling[old_key] = old_value
+        evicted.append((old_key, old_value))
+    return evicted
+
+
+  def __spill(self, entries: List[Tuple[str, Any]]) -> None:
+    """
+      Writes the evicted entries in the spill folder, dropping the oldest spilled entries
+      if the folder exceeds its size. Must be called without the lock.
+    """
+    for key, value in entries:
+      try:
+        size = tpool.execute(self.__write, key, value)
+      except (OSError, pickle.PickleError):
+        size = None
+
+      with self.__lock:
+        # The entry was promoted back or replaced while it was written
+        if self.__spilling.get(key) is not value:
+          dropped = [key] if size is not None and key not in self.__spilled else []
+        elif size is None:
+          del self.__spilling[key]
+          dropped = []
+        else:
+          del self.__spilling[key]
+          self.__drop_spilled(key)
+          self.__spilled[key] = size
+          self.__spill_size += size
+          self.spills += 1
+          dropped = self.__trim()
+      self.__remove(dropped)
+
+
+  def __trim(self) -> List[str]:
+    """
+      Drops the oldest spilled entries exceeding the size of the folder from the index.
+      Must be called with the lock held.
+
+      Returns:
+        List[str]: The keys of the files to remove once the lock is released.
+    """
+    dropped = []
+    while self.__spill_size > self.__max_spill_size and self.__spilled:
+      key = next(iter(self.__spilled))
+      self.__drop_spilled(key)
+      dropped.append(key)
+    return dropped
+
+
+  def __drop_spilled(self, key: str) -> bool:
+    """
+      Removes an entry from the index of the spill folder. Must be called with the lock held.
+
+      Returns:
+        bool: Whether the entry was spilled, its file having to be removed.
+    """
+    size = self.__spilled.pop(key, None)
+    if size is None:
+      return False
+    self.__spill_size -= size
+    return True
+
+
+  def __remove(self, keys: List[str]) -> None:
+    """
+      Removes the files of entries dropped from the spill folder. Must be called without the lock.
+    """
+    if keys:
+      tpool.execute(self.__unlink, [self.__path(key) for key in keys])
+
+
+  def __read(self, key: str) -> Any:
+    with open(self.__path(key), 'rb') as f:
+      return pickle.load(f)
+
+
+  def __write(self, key: str, value: Any) -> int:
+    """
+      Pickles a value in the spill folder, through a temporary file so a concurrent reader
+      or another process sharing the folder never sees a partial entry.
+
+      Returns:
+        int: The size of the file.
+    """
+    os.makedirs(self.__folder, exist_ok=True)
+    path = self.__path(key)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+      with open(temporary, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = f.tell()
+      os.replace(temporary, path)
+    except BaseException:
+      self.__unlink([temporary])
+      raise
+    return size
+
+
+  def __scan(self) -> List[Tuple[str, int]]:
+    """
+      Lists the entries of the spill folder, the oldest first, removing the temporary
+      files left by an interrupted write. The files being written by another process
+      sharing the folder are kept.
+    """
+    try:
+      names = os.listdir(self.__folder)
+    except OSError:
+      return []
+
+    entries = []
+    for name in names:
+      path = os.path.join(self.__folder, name)
+      try:
+        if name.endswith('.tmp'):
+          if self.__is_stale(name, os.stat(path).st_mtime):
+            os.remove(path)
+        elif name.endswith('.pkl'):
+          stat = os.stat(path)
+          entries.append((stat.st_mtime, name[:-len('.pkl')], stat.st_size))
+      except OSError:
+        continue
+    return [(key, size) for _, key, size in sorted(entries)]
+
+
+  @staticmethod
+  def __is_stale(name: str, mtime: float) -> bool:
+    """
+      Checks whether a temporary file of the spill folder was left by an interrupted write:
+      its writer is no longer running, or it is older than any write.
+
+      Args:
+        name (str): The name of the file, `{key}.pkl.{pid}.tmp`.
+        mtime (float): The last modification time of the file.
+
+      Returns:
+        bool: True if the file can be removed, False otherwise.
+    """
+    if time.time() - mtime > STALE_TEMPORARY_AGE:
+      return True
+
+    try:
+      pid = int(name[:-len('.tmp')].rsplit('.', 1)[1])
+    except (IndexError, ValueError):
+      return False
+
+    try:
+      os.kill(pid, 0)
+    except ProcessLookupError:
+      return True
+    except PermissionError:
+      # The process exists but belongs to another user
+      pass
+    return False
+
+
+  @staticmethod
+  def __unlink(paths: List[str]) -> None:
+    for path in paths:
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+
+
+
+render_cache = LRUCache(RENDER_CACHE_SIZE, os.path.join(CACHE_FOLDER, 'renders'), RENDER_CACHE_SPILL_SIZE)
+score_cache = LRUCache(SCORE_CACHE_SIZE)
@@ -9,6 +9,71 @@ ROUND_DURATION = 35 * 60
 BREAK_DURATION = 5 * 60
 
 IMAGES_FOLDER = 'app/challenges-img'
+FEATURES_FOLDER = 'app/challenges-features'
+
+RENDER_WORKERS = 4
+RENDER_TIMEOUT = 10
+CHROMIUM_PATH = '/usr/bin/chromium'
+CHROMEDRIVER_PATH = '/usr/bin/chromedriver'
+
+CACHE_FOLDER = 'app/cache'
+RENDER_CACHE_SIZE = 256 * 1024 * 1024
+RENDER_CACHE_SPILL_SIZE = 1024 * 1024 * 1024
+SCORE_CACHE_SIZE = 16 * 1024 * 1024
+
+LIVE_SCORE_INTERVAL = 10
+LIVE_SCORE_CONCURRENCY = 4
+
+SANITIZE_WORKERS = 4
+SANITIZE_QUEUE_DEPTH = 256
+
+# Syncs processed per second for each user, the syncs over it being coalesced
+SYNC_RATE = 2
+SYNC_BURST = 5
+# Seconds over which the throttled syncs of each user are reported
+SYNC_THROTTLE_WINDOW = 60
+
+# Opt-in sync of the edits as patches against the last acknowledged version of the code
+DELTA_SYNC = os.environ.get('DELTA_SYNC') == '1'
+
+LEAK_INTERVAL = 3
+LEAK_BATCH_SIZE = 256 * 1024
+LEAK_COMPRESSION_THRESHOLD = 4 * 1024
+
+LOG_FILE = 'round_manager.log'
+# Characters of the log records waiting to be written
+LOG_BUFFER_SIZE = 16 * 1024 * 1024
+LOG_FLUSH_INTERVAL = 1
+LOG_MAX_BYTES = 64 * 1024 * 1024
+LOG_ROTATE_INTERVAL = 0
+LOG_BACKUP_COUNT = 10
+LOG_COMPRESSION = 'gzip'
+
+JOURNAL_FILE = 'app/journal/submissions.journal'
+JOURNAL_COMPACT_SIZE = 64 * 1024 * 1024
+
+BLOB_COMPRESSION = 'zlib'
+
+ADMIN_PAGE_SIZE = 50
+
+IDENTITY_TTL = 300
+
+# Without a backend, the app must run as a single worker
+BACKEND_URL = os.environ.get('BACKEND_URL')
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', BACKEND_URL)
+LEADER_TTL = 5
+
+SUBMISSION_SHARDS = 64
+
+# Interval at which the delay of the eventlet hub is measured, in seconds
+METRICS_LAG_INTERVAL = 0.5
+
+# Opt-in detection of the code blocking the eventlet hub for more than the threshold, in seconds
+DIAGNOSTICS = os.environ.get('DIAGNOSTICS') == '1'
+DIAGNOSTICS_BLOCK_THRESHOLD = 0.05
+DIAGNOSTICS_TOP = 20
+DIAGNOSTICS_STACK_DEPTH = 64
+DIAGNOSTICS_SAMPLE_INTERVAL = 0.005
 
 FLASK_DEBUG = False
 FLASK_ENV='production'
\ No newline at end of file
@@ -0,0 +1,21 @@
+# The hooks of gunicorn: the components are started in each worker, once it forked and
+# eventlet patched the standard library, and stopped when the worker exits.
+
+import os
+
+
+def on_starting(server) -> None:
+  if server.cfg.workers > 1 and not os.environ.get('BACKEND_URL'):
+    raise RuntimeError('More than one worker requires BACKEND_URL')
+
+
+
+def post_worker_init(worker) -> None:
+  from app.cmd.run import app, init_app
+  init_app(app)
+
+
+
+def worker_exit(server, worker) -> None:
+  from app.cmd.run import close
+  close()
@@ -1,24 +1,83 @@
 from app.cmd.app import app
 
+from typing import Callable, Union
+
+from flask import Flask
+
+from app.backend import backend, election
+from app.blobstore import blob_store
+from app.cache import render_cache, score_cache
+from app.cmd.seed import seed
 from app.database import db
-from app.models import seed_users, seed_challenges
+from app.diagnostics import diagnostics
+from app.identity import identity_cache
+from app.journal import journal
+from app.leaks import leak_broadcaster
+from app.live_scoring import live_scorer
+from app.metrics import metrics
+from app.ratelimit import sync_limiter
 from app.routes import socketio
+from app.renderer import render_pool
 from app.round_manager import round_manager
-from app.utils import consum_creds
+from app.store import submission_store
+from app.utils import logger
+from app.workers import sanitizer_pool
 
 import logging
 
 
-try:
+def init_app(app: Flask, seed: Union[Callable[[], None], None] = None) -> None:
+  """
+    Initializes the components of the app, starting their green threads. Called once in
+    each process serving the app, after it forked: the green threads of a process are
+    not inherited by its children.
+
+    Args:
+      app (Flask): The Flask app instance.
+      seed (Union[Callable[[], None], None]): Seeds the database, before the rounds are loaded.
+  """
   db.init_app(app)
+  if seed is not None:
+    seed()
+
+  backend.init_app(app)
+  election.init_app(app)
+  submission_store.init_app(app)
+  journal.init_app(app)
+  blob_store.init_app(app)
+  render_cache.init_app(app)
+  score_cache.init_app(app)
   round_manager.init_app(app, socketio)
-  seed_challenges()
-  seed_users(consum_creds('app/creds.csv'))
+  render_pool.init_app(app)
+  live_scorer.init_app(app, socketio)
+  sanitizer_pool.init_app(app)
+  sync_limiter.init_app(app)
+  leak_broadcaster.init_app(app, socketio)
+  identity_cache.init_app(app)
+  metrics.init_app(app)
+  diagnostics.init_app(app)
+
+  socketio.init_app(app, async_mode='eventlet', message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
 
 
-  socketio.init_app(app, async_mode='eventlet')
-  socketio.run(app, host='0.0.0.0', port=5000, debug=True)
-except KeyboardInterrupt:
+
+def close() -> None:
+  """
+    Stops the components of the app, releasing the leadership of the rounds.
+  """
   round_manager.stop()
-  socketio.stop()
-  exit(0)
\ No newline at end of file
+  election.stop()
+  render_pool.stop()
+  logger.close()
+
+
+
+if __name__ == '__main__':
+  try:
+    init_app(app, seed)
+
+    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+  except KeyboardInterrupt:
+    close()
+    socketio.stop()
+    exit(0)
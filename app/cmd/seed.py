@@ -0,0 +1,22 @@
+from app.cmd.app import app
+
+from app.database import db
+from app.identity import identity_cache
+from app.models import seed_users, seed_challenges
+from app.utils import consum_creds
+
+
+def seed() -> None:
+  """
+    Seeds the challenges and the users of the contest.
+  """
+  seed_challenges()
+  seed_users(consum_creds('app/creds.csv'))
+  identity_cache.clear()
+
+
+
+# Run once before the workers start, so they do not seed the database concurrently
+if __name__ == '__main__':
+  db.init_app(app)
+  seed()
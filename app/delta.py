@@ -0,0 +1,289 @@
+# Description:  This file contains the versioned documents of the delta sync protocol.
+# Path:         app/delta.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import json
+from typing import Any, Dict, Set, Tuple, Union
+
+from eventlet.semaphore import Semaphore
+
+from app.backend import backend
+
+# The hash of the code broadcast to the teams during a round, read by the teammates of
+# a user connected to another worker
+PUBLISHED_KEY = 'documents:{}'
+
+
+class Patch:
+  """
+    Replaces the characters [start, end) of a document by a text. The offsets are in
+    code points, the client converting them from and to its UTF-16 offsets.
+
+    Attributes:
+      start (int): The offset of the first replaced character.
+      end (int): The offset following the last replaced character.
+      text (str): The inserted text.
+  """
+  def __init__(self, start: int, end: int, text: str):
+    self.start = start
+    self.end = end
+    self.text = text
+
+
+  @classmethod
+  def parse(cls, data: Any) -> Union['Patch', None]:
+    """
+      Validates a patch received from a client.
+
+      Args:
+        data (Any): The patch as sent by the client.
+
+      Returns:
+        Union[Patch, None]: The patch, or None if it is malformed.
+    """
+    if not isinstance(data, dict):
+      return None
+
+    start, end, text = data.get('start'), data.get('end'), data.get('text', '')
+    if type(start) is not int or type(end) is not int or not isinstance(text, str):
+      return None
+    if start < 0 or end < start:
+      return None
+    return cls(start, end, text)
+
+
+  @classmethod
+  def diff(cls, old: str, new: str) -> 'Patch':
+    """
+      Computes the patch turning a document into another, replacing the span between
+      their common prefix and their common suffix.
+
+      Args:
+        old (str): The previous document.
+        new (str): The next document.
+
+      Returns:
+        Patch: The patch from the previous to the next document.
+    """
+    limit = min(len(old), len(new))
+    start = common_length(old, new, limit, lambda s, n: s[:n])
+    end = common_length(old, new, limit - start, lambda s, n: s[len(s) - n:])
+    return cls(start, len(old) - end, new[start:len(new) - end])
+
+
+  def apply(self, document: str) -> Union[str, None]:
+    """
+      Applies the patch to a document.
+
+      Args:
+        document (str): The document the patch was computed against.
+
+      Returns:
+        Union[str, None]: The patched document, or None if the patch does not fit in it.
+    """
+    if self.end > len(document):
+      return None
+    return document[:self.start] + self.text + document[self.end:]
+
+
+  def to_dict(self) -> dict:
+    return {'start': self.start, 'end': self.end, 'text': self.text}
+
+
+
+def common_length(a: str, b: str, limit: int, part) -> int:
+  """
+    Finds the length of the longest common prefix (or suffix) of two strings by a binary
+    search, comparing slices instead of characters one by one.
+
+    Args:
+      a (str): The first string.
+      b (str): The second string.
+      limit (int): The maximum length to consider.
+      part (Callable[[str, int], str]): Returns the prefix (or suffix) of a given length.
+
+    Returns:
+      int: The length of the common part.
+  """
+  low, high = 0, limit
+  while low < high:
+    middle = (low + high + 1) // 2
+    if part(a, middle) == part(b, middle):
+      low = middle
+    else:
+      high = middle - 1
+  return low
+
+
+
+class DocumentStore:
+  """
+    Keeps the canonical document of each (team, role) of the current round, along with
+    its version, the last sanitized code broadcast to the team and whether the next one
+    leaks.
+
+    A client patches the version it last had acknowledged; a patch against another
+    version is rejected and the client must send its whole document again.
+
+    The documents are kept by the worker of their user, the websocket of a client staying
+    on one worker. The broadcast code is also kept in the backend when it is shared, so a
+    teammate connected to another worker can resync from it.
+  """
+  def __init__(self):
+    self.__documents: Dict[Tuple[Any, Any], Tuple[int, str]] = {}
+    self.__published: Dict[Tuple[Any, Any], Tuple[int, str]] = {}
+    self.__leaks: Set[Tuple[Any, Any]] = set()
+    self.__round = None
+    self.__lock = Semaphore()
+
+
+  def replace(self, round_number: int, key: Tuple[Any, Any], document: str) -> int:
+    """
+      Replaces a whole document, on a full sync.
+
+      Args:
+        round_number (int): The current round number.
+        key (Tuple[Any, Any]): The team and the role of the document.
+        document (str): The new document.
+
+      Returns:
+        int: The new version of the document.
+    """
+    with self.__lock:
+      self.__check_round(round_number)
+      version = self.__documents.get(key, (0, ''))[0] + 1
+      self.__documents[key] = (version, document)
+      return version
+
+
+  def patch(self, round_number: int, key: Tuple[Any, Any], version: Any, patch: Patch) -> Union[Tuple[int, str], None]:
+    """
+      Applies a patch to a document.
+
+      Args:
+        round_number (int): The current round number.
+        key (Tuple[Any, Any]): The team and the role of the document.
+        version (Any): The version the patch was computed against.
+        patch (Patch): The patch to apply.
+
+      Returns:
+        Union[Tuple[int, str], None]: The new version and document, or None if the versions diverged.
+    """
+    with self.__lock:
+      self.__check_round(round_number)
+      current, document = self.__documents.get(key, (0, ''))
+      if version != current:
+        return None
+
+      document = patch.apply(document)
+      if document is None:
+        return None
+
+      self.__documents[key] = (current + 1, document)
+      return current + 1, document
+
+
+  def publish(self, round_number: int, key: Tuple[Any, Any], version: int, code: str) -> Union[Tuple[int, Patch], None]:
+    """
+      Records the sanitized code broadcast for a document.
+
+      Args:
+        round_number (int): The round of the code.
+        key (Tuple[Any, Any]): The team and the role of the document.
+        version (int): The version of the document the code was sanitized from.
+        code (str): The sanitized code.
+
+      Returns:
+        Union[Tuple[int, Patch], None]: The previously broadcast version and the patch from its
+                                        code, or None if the code is outdated.
+    """
+    with self.__lock:
+      if self.__round != round_number:
+        return None
+
+      base, previous = self.__load(round_number, key)
+      if version <= base:
+        return None
+
+      if backend.shared:
+        backend.hset(PUBLISHED_KEY.format(round_number), f'{key[0]}:{key[1]}', json.dumps([version, code]))
+      else:
+        self.__published[key] = (version, code)
+      return base, Patch.diff(previous, code)
+
+
+  def leak(self, round_number: int, key: Tuple[Any, Any]) -> None:
+    """
+      Marks the next code published for a document as leaked.
+
+      Args:
+        round_number (int): The current round number.
+        key (Tuple[Any, Any]): The team and the role of the document.
+    """
+    with self.__lock:
+      self.__check_round(round_number)
+      self.__leaks.add(key)
+
+
+  def take_leak(self, round_number: int, key: Tuple[Any, Any]) -> bool:
+    """
+      Checks whether the code published for a document leaks, clearing the mark.
+
+      Args:
+        round_number (int): The round of the code.
+        key (Tuple[Any, Any]): The team and the role of the document.
+
+      Returns:
+        bool: True if the code leaks, False otherwise.
+    """
+    with self.__lock:
+      if self.__round != round_number or key not in self.__leaks:
+        return False
+      self.__leaks.discard(key)
+      return True
+
+
+  def published(self, round_number: int, key: Tuple[Any, Any]) -> Tuple[int, str]:
+    """
+      Returns the last sanitized code broadcast for a document, to resync a client.
+
+      Args:
+        round_number (int): The current round number.
+        key (Tuple[Any, Any]): The team and the role of the document.
+
+      Returns:
+        Tuple[int, str]: The version and the sanitized code.
+    """
+    with self.__lock:
+      return self.__load(round_number, key)
+
+
+  def __load(self, round_number: int, key: Tuple[Any, Any]) -> Tuple[int, str]:
+    """
+      Reads the last code broadcast for a document. Must be called with the lock held.
+    """
+    if backend.shared:
+      value = backend.hmget(PUBLISHED_KEY.format(round_number), [f'{key[0]}:{key[1]}'])[0]
+      return tuple(json.loads(value)) if value is not None else (0, '')
+
+    if self.__round != round_number:
+      return 0, ''
+    return self.__published.get(key, (0, ''))
+
+
+  def __check_round(self, round_number: int) -> None:
+    """
+      Drops the documents of the previous round. Must be called with the lock held.
+    """
+    if self.__round != round_number:
+      if self.__round is not None and backend.shared:
+        backend.delete(PUBLISHED_KEY.format(self.__round))
+      self.__round = round_number
+      self.__documents.clear()
+      self.__published.clear()
+      self.__leaks.clear()
+
+
+
+documents = DocumentStore()
@@ -0,0 +1,253 @@
+# Description:  This file contains the opt-in detector of the code blocking the eventlet hub, and its sampling profiler.
+# Path:         app/diagnostics.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import os
+import sys
+import time
+from types import FrameType
+from typing import Dict, List, Tuple, Union
+
+import eventlet
+from eventlet import patcher
+from flask import Flask
+
+# The watchdog runs in a native thread, so it keeps running while the hub is blocked.
+threading = patcher.original('threading')
+sleep = patcher.original('time').sleep
+
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+ROOT_FOLDER = os.path.dirname(APP_FOLDER)
+
+
+def describe(frame: FrameType) -> str:
+  code = frame.f_code
+  return f'{os.path.relpath(code.co_filename, ROOT_FOLDER)}:{frame.f_lineno} in {code.co_name}'
+
+
+
+def walk(frame: Union[FrameType, None], limit: int) -> List[FrameType]:
+  """
+    Lists the frames of a stack, from the innermost one.
+  """
+  frames = []
+  while frame is not None and len(frames) < limit:
+    frames.append(frame)
+    frame = frame.f_back
+  return frames
+
+
+
+class Offender:
+  """
+    The code found blocking the hub at a call site of the app, with the time it blocked
+    the hub and the last stack captured there.
+  """
+  __slots__ = ('site', 'stack', 'count', 'total', 'max', 'last')
+
+  def __init__(self, site: str):
+    self.site = site
+    self.stack: List[str] = []
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.last = 0.0
+
+
+  def to_dict(self) -> dict:
+    return {
+      'site': self.site,
+      'count': self.count,
+      'total': self.total,
+      'max': self.max,
+      'last': self.last,
+      'stack': self.stack,
+    }
+
+
+
+class Diagnostics:
+  """
+    Detects the code holding the eventlet hub without yielding. A green thread beats at
+    a fixed interval, and a native thread watches the beats: when a beat is late by more
+    than the threshold, it captures the stack running on the hub. Once the hub yields,
+    the time it was blocked is added to the offender, identified by the innermost frame
+    of the app in the stack. Only the offenders which blocked the hub the longest are kept.
+
+    The native thread also samples the stack of the hub while profiling, and counts the
+    samples by stack in the collapsed format of the flamegraph tools.
+
+    Disabled unless `DIAGNOSTICS` is set.
+  """
+  def __init__(self):
+    self.__enabled = False
+    self.__threshold = 0.05
+    self.__interval = 0.025
+    self.__top = 20
+    self.__depth = 64
+    self.__sample_interval = 0.005
+    self.__hub_thread = None
+    self.__beat = 0.0
+    self.__blocking: Union[Tuple[float, str, List[str]], None] = None
+    self.__offenders: Dict[str, Offender] = {}
+    self.__samples: Dict[str, int] = {}
+    self.__profile_until = 0.0
+    self.__lock = threading.Lock()
+
+    self.blocks = 0
+    self.blocked = 0.0
+    self.samples = 0
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the Diagnostics with the configurations of the Flask app, and starts
+      the watchdog when they are enabled. Must be called from the thread of the hub.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    if not app.config.get('DIAGNOSTICS') or self.__enabled:
+      return
+
+    self.__threshold = app.config.get('DIAGNOSTICS_BLOCK_THRESHOLD', 0.05)
+    self.__interval = self.__threshold / 2
+    self.__top = app.config.get('DIAGNOSTICS_TOP', 20)
+    self.__depth = app.config.get('DIAGNOSTICS_STACK_DEPTH', 64)
+    self.__sample_interval = app.config.get('DIAGNOSTICS_SAMPLE_INTERVAL', 0.005)
+    self.__hub_thread = threading.get_ident()
+    self.__beat = time.monotonic()
+    self.__enabled = True
+
+    eventlet.spawn(self.__heartbeat)
+    threading.Thread(target=self.__watch, name='hub-watchdog', daemon=True).start()
+
+
+  @property
+  def enabled(self) -> bool:
+    return self.__enabled
+
+
+  def offenders(self) -> List[dict]:
+    """
+      Returns the offenders, the ones which blocked the hub the longest first.
+    """
+    with self.__lock:
+      offenders = sorted(self.__offenders.values(), key=lambda offender: offender.total, reverse=True)
+      return [offender.to_dict() for offender in offenders]
+
+
+  def start_profile(self, seconds: float) -> bool:
+    """
+      Starts sampling the stack of the hub, discarding the previous profile. The profiler
+      stops by itself after the given duration.
+
+      Args:
+        seconds (float): The duration of the profile.
+
+      Returns:
+        bool: Whether the profiler was started, False if the diagnostics are disabled.
+    """
+    if not self.__enabled:
+      return False
+
+    with self.__lock:
+      self.__samples = {}
+      self.__profile_until = time.monotonic() + seconds
+    return True
+
+
+  def stop_profile(self) -> None:
+    self.__profile_until = 0.0
+
+
+  def profile(self) -> str:
+    """
+      Returns the samples of the last profile in the collapsed stack format, a line
+      `outer;...;inner count` per stack, read by flamegraph.pl, speedscope or inferno.
+    """
+    with self.__lock:
+      samples = sorted(self.__samples.items())
+    return ''.join(f'{stack} {count}\n' for stack, count in samples)
+
+
+  def stats(self) -> dict:
+    return {
+      'enabled': self.__enabled,
+      'profiling': time.monotonic() < self.__profile_until,
+      'blocks': self.blocks,
+      'blocked_seconds': self.blocked,
+      'samples': self.samples,
+    }
+
+
+  def __heartbeat(self) -> None:
+    while True:
+      self.__beat = time.monotonic()
+      eventlet.sleep(self.__interval)
+
+
+  def __watch(self) -> None:
+    """
+      Watches the beats of the hub, and samples its stack while profiling.
+    """
+    while True:
+      profiling = time.monotonic() < self.__profile_until
+      sleep(self.__sample_interval if profiling else self.__interval / 2)
+
+      beat = self.__beat
+      if self.__blocking is not None and self.__blocking[0] != beat:
+        self.__record(beat - self.__blocking[0] - self.__interval)
+
+      frame = None
+      if self.__blocking is None and time.monotonic() - beat > self.__interval + self.__threshold:
+        frame = sys._current_frames().get(self.__hub_thread)
+        self.__capture(beat, frame)
+
+      if profiling:
+        frame = frame or sys._current_frames().get(self.__hub_thread)
+        self.__sample(frame)
+      frame = None
+
+
+  def __capture(self, beat: float, frame: Union[FrameType, None]) -> None:
+    frames = walk(frame, self.__depth)
+    site = next((frame for frame in frames if frame.f_code.co_filename.startswith(APP_FOLDER)), None)
+    site = describe(site or frames[0]) if frames else 'unknown'
+    self.__blocking = (beat, site, [describe(frame) for frame in reversed(frames)])
+
+
+  def __record(self, duration: float) -> None:
+    _, site, stack = self.__blocking
+    self.__blocking = None
+
+    with self.__lock:
+      offender = self.__offenders.get(site)
+      if offender is None:
+        offender = self.__offenders[site] = Offender(site)
+
+      offender.stack = stack
+      offender.count += 1
+      offender.total += duration
+      offender.max = max(offender.max, duration)
+      offender.last = time.time()
+
+      if len(self.__offenders) > self.__top:
+        del self.__offenders[min(self.__offenders, key=lambda key: self.__offenders[key].total)]
+
+    self.blocks += 1
+    self.blocked += duration
+
+
+  def __sample(self, frame: Union[FrameType, None]) -> None:
+    frames = walk(frame, self.__depth)
+    stack = ';'.join(f'{frame.f_code.co_name} ({os.path.relpath(frame.f_code.co_filename, ROOT_FOLDER)}:{frame.f_code.co_firstlineno})'
+                     for frame in reversed(frames))
+    with self.__lock:
+      self.__samples[stack or 'idle'] = self.__samples.get(stack or 'idle', 0) + 1
+    self.samples += 1
+
+
+
+diagnostics = Diagnostics()
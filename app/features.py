@@ -0,0 +1,250 @@
+# Description:  This file contains the feature store of the challenges, the reference side of the scoring.
+# Path:         app/features.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from app.cmd.config import FEATURES_FOLDER
+
+
+# Constants of the structural similarity index (Wang et al., 2004) for 8-bit images.
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+SSIM_WINDOW = (11, 11)
+SSIM_SIGMA = 1.5
+
+PYRAMID_LEVELS = 4
+PYRAMID_MIN_SIZE = 16
+
+
+def decode_image(data: bytes) -> np.ndarray:
+  """
+    Decodes an encoded image (e.g. PNG) into a RGB array. Transparent pixels are
+    composited over a white background, like a browser would display them.
+
+    Args:
+      data (bytes): The encoded image.
+
+    Returns:
+      np.ndarray: The decoded image as an (H, W, 3) uint8 array.
+  """
+  image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+  if image is None:
+    raise ValueError('unable to decode image')
+
+  if image.ndim == 2:
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+
+  if image.shape[2] == 4:
+    alpha = image[..., 3:].astype(np.float32) / 255
+    blended = image[..., :3].astype(np.float32) * alpha + 255 * (1 - alpha)
+    image = np.rint(blended).astype(np.uint8)
+
+  return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+
+def blur(stack: np.ndarray) -> np.ndarray:
+  """
+    Applies the SSIM gaussian window over every channel of a stack of images.
+
+    Args:
+      stack (np.ndarray): An (H, W, C) float32 array.
+
+    Returns:
+      np.ndarray: The filtered array.
+  """
+  return cv2.GaussianBlur(stack, SSIM_WINDOW, SSIM_SIGMA)
+
+
+
+def reference_statistics(reference: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+  """
+    Computes the local means and variances of the reference image.
+
+    Args:
+      reference (np.ndarray): The (H, W, 3) reference image.
+
+    Returns:
+      Tuple[np.ndarray, np.ndarray]: The local means and the local variances.
+  """
+  x = reference.astype(np.float32)
+  mu = blur(x)
+  return mu, blur(x * x) - mu * mu
+
+
+
+def image_digest(data: bytes) -> str:
+  """
+    Returns the content hash used to key the features of an image.
+
+    Args:
+      data (bytes): The encoded image.
+
+    Returns:
+      str: The SHA-256 hex digest of the image.
+  """
+  return hashlib.sha256(data).hexdigest()
+
+
+
+class ChallengeFeatures:
+  """
+    The precomputed features of a challenge image. When loaded from the store, every
+    array is a read-only memory map shared by all the processes mapping the same file.
+
+    Attributes:
+      digest (str): The content hash of the image.
+      rgb (np.ndarray): The decoded (H, W, 3) uint8 image.
+      gray (np.ndarray): The (H, W) uint8 grayscale image.
+      mu (np.ndarray): The (H, W, 3) float32 local means.
+      sigma (np.ndarray): The (H, W, 3) float32 local variances.
+      pyramid (List[np.ndarray]): The grayscale pyramid, halving the resolution at each level.
+  """
+  def __init__(self, digest: str, rgb: np.ndarray, gray: np.ndarray, mu: np.ndarray,
+               sigma: np.ndarray, pyramid: List[np.ndarray]):
+    self.digest = digest
+    self.rgb = rgb
+    self.gray = gray
+    self.mu = mu
+    self.sigma = sigma
+    self.pyramid = pyramid
+
+
+  @property
+  def statistics(self) -> Tuple[np.ndarray, np.ndarray]:
+    return self.mu, self.sigma
+
+
+  @classmethod
+  def compute(cls, data: bytes) -> 'ChallengeFeatures':
+    """
+      Computes the features of an encoded image.
+
+      Args:
+        data (bytes): The encoded image.
+
+      Returns:
+        ChallengeFeatures: The features of the image.
+    """
+    rgb = decode_image(data)
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    mu, sigma = reference_statistics(rgb)
+
+    pyramid = []
+    level = gray
+    for _ in range(PYRAMID_LEVELS):
+      if min(level.shape) < PYRAMID_MIN_SIZE * 2:
+        break
+      level = cv2.pyrDown(level)
+      pyramid.append(level)
+
+    return cls(image_digest(data), rgb, gray, mu, sigma, pyramid)
+
+
+  def arrays(self) -> Dict[str, np.ndarray]:
+    """
+      Returns the arrays of the features keyed by their file name in the store.
+
+      Returns:
+        Dict[str, np.ndarray]: The arrays of the features.
+    """
+    arrays = {'rgb': self.rgb, 'gray': self.gray, 'mu': self.mu, 'sigma': self.sigma}
+    for i, level in enumerate(self.pyramid, start=1):
+      arrays[f'pyramid_{i}'] = level
+    return arrays
+
+
+
+class FeatureStore:
+  """
+    A content-addressed store of challenge features, saved as `.npy` files under one
+    folder per image hash. The arrays are mapped in memory on load instead of being read,
+    and the mapped features are kept for the lifetime of the process.
+  """
+  def __init__(self, folder: str):
+    self.__folder = folder
+    self.__loaded: Dict[str, ChallengeFeatures] = {}
+
+
+  def path(self, digest: str) -> str:
+    return os.path.join(self.__folder, digest)
+
+
+  def contains(self, digest: str) -> bool:
+    return os.path.isdir(self.path(digest))
+
+
+  def build(self, data: bytes) -> str:
+    """
+      Computes and saves the features of an image unless they are already stored.
+      The files are written in a temporary folder renamed at the end, so concurrent
+      builders and readers never see a partial entry.
+
+      Args:
+        data (bytes): The encoded image.
+
+      Returns:
+        str: The content hash of the image.
+    """
+    digest = image_digest(data)
+    if self.contains(digest):
+      return digest
+
+    os.makedirs(self.__folder, exist_ok=True)
+    features = ChallengeFeatures.compute(data)
+
+    tmp = tempfile.mkdtemp(prefix=f'.{digest}-', dir=self.__folder)
+    try:
+      for name, array in features.arrays().items():
+        np.save(os.path.join(tmp, f'{name}.npy'), np.ascontiguousarray(array))
+      os.rename(tmp, self.path(digest))
+    except OSError:
+      if not self.contains(digest):
+        raise
+    finally:
+      shutil.rmtree(tmp, ignore_errors=True)
+
+    return digest
+
+
+  def load(self, data: bytes) -> ChallengeFeatures:
+    """
+      Maps the features of an image, building them first if they are missing.
+
+      Args:
+        data (bytes): The encoded image.
+
+      Returns:
+        ChallengeFeatures: The memory-mapped features of the image.
+    """
+    digest = image_digest(data)
+    features = self.__loaded.get(digest)
+    if features is not None:
+      return features
+
+    self.build(data)
+    path = self.path(digest)
+
+    def mmap(name: str) -> np.ndarray:
+      return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+    pyramid = []
+    while os.path.exists(os.path.join(path, f'pyramid_{len(pyramid) + 1}.npy')):
+      pyramid.append(mmap(f'pyramid_{len(pyramid) + 1}'))
+
+    features = ChallengeFeatures(digest, mmap('rgb'), mmap('gray'), mmap('mu'), mmap('sigma'), pyramid)
+    self.__loaded[digest] = features
+    return features
+
+
+
+feature_store = FeatureStore(FEATURES_FOLDER)
@@ -0,0 +1,152 @@
+# Description:  This file contains the cache of the identities of the logged in users.
+# Path:         app/identity.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import time
+from typing import Any, Dict, Tuple, Union
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from eventlet.semaphore import Semaphore
+from flask import Flask
+from flask_login import UserMixin
+
+from app.models import Team, User
+
+
+class TeamIdentity:
+  """
+    The identity of the team of a user.
+  """
+  def __init__(self, id: Any, name: str):
+    self.id = id
+    self.name = name
+
+
+
+class Identity(UserMixin):
+  """
+    A read-only snapshot of a user, with the fields the handlers need: it stands for the
+    user as `current_user` without holding a database document.
+  """
+  def __init__(self, id: Any, username: str, is_admin: bool, number: int, team: Union[TeamIdentity, None]):
+    self.id = id
+    self.username = username
+    self.is_admin = is_admin
+    self.team = team
+    self.__number = number
+
+
+  def __repr__(self) -> str:
+    return f'<User: {self.username}>'
+
+
+  def get_id(self) -> str:
+    return str(self.id)
+
+
+  def get_id_in_team(self) -> int:
+    return self.__number
+
+
+  def retrieve_number(self) -> int:
+    return self.__number
+
+
+
+class IdentityCache:
+  """
+    Caches the identity of the users for a limited time, so authenticating a request or a
+    socket event does not query the database in the steady state.
+  """
+  def __init__(self):
+    self.__identities: Dict[str, Tuple[Identity, float]] = {}
+    self.__lock = Semaphore()
+    self.__ttl = 300
+
+    self.hits = 0
+    self.misses = 0
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the IdentityCache with the configurations of the Flask app.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    self.__ttl = app.config.get('IDENTITY_TTL', 300)
+
+
+  def get(self, user_id: str) -> Union[Identity, None]:
+    """
+      Retrieves the identity of a user, loading it if it is missing or expired.
+
+      Args:
+        user_id (str): The ID of the user, as stored in the session.
+
+      Returns:
+        Union[Identity, None]: The identity of the user, or None if the user does not exist.
+    """
+    now = time.monotonic()
+    with self.__lock:
+      entry = self.__identities.get(user_id)
+      if entry is not None and entry[1] > now:
+        self.hits += 1
+        return entry[0]
+      self.misses += 1
+
+    identity = self.__load(user_id)
+    with self.__lock:
+      if identity is None:
+        self.__identities.pop(user_id, None)
+      else:
+        self.__identities[user_id] = (identity, now + self.__ttl)
+    return identity
+
+
+  def clear(self) -> None:
+    """
+      Drops every identity, after the users or the teams changed. They only change
+      when the database is seeded.
+    """
+    with self.__lock:
+      self.__identities.clear()
+
+
+  def stats(self) -> dict:
+    """
+      Returns the counters of the cache.
+
+      Returns:
+        dict: The hits, misses and entries of the cache.
+    """
+    with self.__lock:
+      return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.__identities)}
+
+
+  @staticmethod
+  def __load(user_id: str) -> Union[Identity, None]:
+    """
+      Loads the identity of a user and the name of its team.
+    """
+    try:
+      key = ObjectId(user_id)
+    except (InvalidId, TypeError):
+      return None
+
+    user = User._get_collection().find_one({'_id': key}, {'username': 1, 'is_admin': 1, '_id_in_team': 1, 'team': 1})
+    if user is None:
+      return None
+
+    team = None
+    if user.get('team') is not None:
+      document = Team._get_collection().find_one({'_id': user['team']}, {'name': 1})
+      team = TeamIdentity(user['team'], document.get('name') if document else None)
+
+    return Identity(user['_id'], user.get('username'), user.get('is_admin', False), user.get('_id_in_team'), team)
+
+
+
+identity_cache = IdentityCache()
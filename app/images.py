@@ -0,0 +1,114 @@
+# Description:  This file contains the cache of the challenge images served over HTTP.
+# Path:         app/images.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import struct
+from typing import Dict, Tuple, Union
+
+from eventlet.semaphore import Semaphore
+
+from app.features import decode_image, image_digest
+from app.models import Challenge
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def image_size(data: bytes) -> Tuple[int, int]:
+  """
+    Reads the dimensions of an image, from the header of a PNG or by decoding it.
+
+    Args:
+      data (bytes): The encoded image.
+
+    Returns:
+      Tuple[int, int]: The width and the height of the image.
+  """
+  if data[:8] == PNG_SIGNATURE and data[12:16] == b'IHDR':
+    return struct.unpack('>II', data[16:24])
+
+  height, width = decode_image(data).shape[:2]
+  return width, height
+
+
+
+class ChallengeImage:
+  """
+    The image of a challenge with everything needed to serve it: its content hash, used
+    as strong ETag and to version its URL, and its dimensions.
+  """
+  def __init__(self, challenge_id: int, data: bytes):
+    self.challenge_id = challenge_id
+    self.data = data
+    self.digest = image_digest(data)
+    self.width, self.height = image_size(data)
+
+
+  @property
+  def url(self) -> str:
+    return f'/challenges/{self.challenge_id}/image?v={self.digest[:16]}'
+
+
+  def to_dict(self) -> dict:
+    return {'url': self.url, 'width': self.width, 'height': self.height}
+
+
+
+class ChallengeImages:
+  """
+    Keeps the images of the challenges in memory, each loaded once from the database.
+  """
+  def __init__(self):
+    self.__images: Dict[int, ChallengeImage] = {}
+    self.__lock = Semaphore()
+
+
+  def get(self, challenge_id: int) -> Union[ChallengeImage, None]:
+    """
+      Retrieves the image of a challenge.
+
+      Args:
+        challenge_id (int): The ID of the challenge.
+
+      Returns:
+        Union[ChallengeImage, None]: The image, or None if the challenge does not exist.
+    """
+    with self.__lock:
+      image = self.__images.get(challenge_id)
+    if image is not None:
+      return image
+
+    challenge = Challenge.objects(_id=challenge_id).only('image').first()
+    if challenge is None or not challenge.image:
+      return None
+    return self.__store(challenge_id, challenge.image)
+
+
+  def describe(self, challenge: Challenge) -> dict:
+    """
+      Describes a challenge for the clients, its image being referenced by URL.
+
+      Args:
+        challenge (Challenge): The challenge.
+
+      Returns:
+        dict: The ID and name of the challenge, and the URL and dimensions of its image.
+    """
+    with self.__lock:
+      image = self.__images.get(challenge._id)
+    if image is None:
+      image = self.__store(challenge._id, challenge.image)
+
+    return {**challenge.to_dict(), 'image': image.to_dict()}
+
+
+  def __store(self, challenge_id: int, data: bytes) -> ChallengeImage:
+    image = ChallengeImage(challenge_id, data)
+    with self.__lock:
+      self.__images[challenge_id] = image
+    return image
+
+
+
+challenge_images = ChallengeImages()
@@ -0,0 +1,377 @@
+# Description:  This file contains the write-ahead journal of the submissions of the running round.
+# Path:         app/journal.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import hashlib
+import os
+import pickle
+import struct
+import zlib
+from typing import Any, Dict, List, Tuple, Union
+
+import eventlet
+from eventlet import tpool
+from eventlet.event import Event
+from eventlet.semaphore import Semaphore
+from flask import Flask
+
+from app.cmd.app import app
+
+
+# Every record is framed by its length and its CRC-32, so a torn write at the end of the
+# journal is detected and truncated on replay.
+FRAME = struct.Struct('<II')
+
+
+class JournalState:
+  """
+    The state rebuilt from the journal on startup.
+
+    Attributes:
+      round (Union[Tuple[int, float], None]): The number and start time of the last started round.
+      closed (Union[int, None]): The number of the last round persisted to the database.
+      submissions (Dict[int, Dict[Any, Dict[str, str]]]): The latest content of each team and role,
+                                                          for the rounds not persisted yet.
+  """
+  def __init__(self):
+    self.round: Union[Tuple[int, float], None] = None
+    self.closed: Union[int, None] = None
+    self.submissions: Dict[int, Dict[Any, Dict[str, str]]] = {}
+
+
+  def pending_round(self) -> Union[Tuple[int, float], None]:
+    """
+      Returns the last started round if it was not persisted before the shutdown.
+
+      Returns:
+        Union[Tuple[int, float], None]: The number and start time of the round, or None.
+    """
+    if self.round is None or self.round[0] == self.closed:
+      return None
+    return self.round
+
+
+
+class SubmissionJournal:
+  """
+    An append-only journal of the synced code, written before the sync is acknowledged.
+
+    The records are committed in groups: the syncs arriving while a batch is written and
+    synced to disk are written together by the next batch, with a single fsync. A sync
+    identical to the latest record of its team and role is not written again.
+
+    The journal only keeps the latest record of each key: when it grows past its compaction
+    size and is mostly made of overwritten records, it is rewritten with the live records.
+  """
+  def __init__(self):
+    self.__path = None
+    self.__file = None
+    self.__size = 0
+    self.__compact_size = 64 * 1024 * 1024
+    self.__queue: List[Tuple[Tuple, bytes, Union[str, None], Event]] = []
+    self.__offsets: Dict[Tuple, Tuple[int, int]] = {}
+    self.__digests: Dict[Tuple, str] = {}
+    self.__closed = set()
+    self.__committing = False
+    self.__lock = Semaphore()
+
+    self.records = 0
+    self.commits = 0
+    self.skipped = 0
+    self.compactions = 0
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the SubmissionJournal with the configurations of the Flask app.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    self.__path = app.config.get('JOURNAL_FILE', 'app/submissions.journal')
+    # The workers sharing a backend keep the submissions of the running round in it
+    if app.config.get('BACKEND_URL'):
+      self.__path = None
+    self.__compact_size = app.config.get('JOURNAL_COMPACT_SIZE', 64 * 1024 * 1024)
+
+
+  def replay(self) -> JournalState:
+    """
+      Reads the journal, truncating its torn tail, and opens it for appending.
+
+      Returns:
+        JournalState: The state recorded in the journal.
+    """
+    state = JournalState()
+    if self.__path is None:
+      return state
+
+    os.makedirs(os.path.dirname(self.__path) or '.', exist_ok=True)
+
+    with open(self.__path, 'a+b') as f:
+      f.seek(0)
+      data = f.read()
+
+    offset = 0
+    while offset + FRAME.size <= len(data):
+      length, checksum = FRAME.unpack_from(data, offset)
+      start, end = offset + FRAME.size, offset + FRAME.size + length
+      if end > len(data) or zlib.crc32(data[start:end]) != checksum:
+        break
+
+      try:
+        record = pickle.loads(data[start:end])
+      except Exception:
+        break
+
+      key = self.__apply(state, record)
+      self.__offsets[key] = (offset, end - offset)
+      offset = end
+
+    if offset < len(data):
+      app.logger.warning(f'Truncating the journal at {offset} of {len(data)} bytes')
+      with open(self.__path, 'r+b') as f:
+        f.truncate(offset)
+
+    self.__file = open(self.__path, 'ab')
+    self.__size = offset
+    return state
+
+
+  def start_round(self, round_number: int, start: float) -> None:
+    """
+      Records the start of a round.
+
+      Args:
+        round_number (int): The number of the round.
+        start (float): The start time of the round.
+    """
+    with self.__lock:
+      self.__closed.discard(round_number)
+    self.__append(('round', round_number, start))
+
+
+  def record(self, round_number: int, team_id: Any, role: str, content: str) -> None:
+    """
+      Records the synced code of a team, waiting until it is on disk.
+
+      Args:
+        round_number (int): The current round number.
+        team_id (Any): The ID of the team.
+        role (str): The role of the code.
+        content (str): The raw code.
+    """
+    # A str may hold lone surrogates, which only encode in UTF-8 with surrogatepass
+    digest = hashlib.sha256(content.encode('utf-8', 'surrogatepass')).hexdigest()
+    self.__append(('submission', round_number, team_id, role, digest, content))
+
+
+  def close_round(self, round_number: int) -> None:
+    """
+      Records that a round is persisted to the database; its submissions are dropped on
+      the next compaction.
+
+      Args:
+        round_number (int): The number of the round.
+    """
+    self.__append(('closed', round_number))
+    with self.__lock:
+      self.__closed.add(round_number)
+      for key in [key for key in self.__offsets if key[0] == 'submission' and key[1] == round_number]:
+        del self.__offsets[key]
+        self.__digests.pop(key, None)
+
+
+  def stats(self) -> dict:
+    """
+      Returns the counters of the journal.
+
+      Returns:
+        dict: The records written, the group commits and the size of the journal.
+    """
+    with self.__lock:
+      return {
+        'records': self.records,
+        'commits': self.commits,
+        'skipped': self.skipped,
+        'compactions': self.compactions,
+        'size': self.__size,
+        'live_records': len(self.__offsets),
+      }
+
+
+  @staticmethod
+  def __key(record: tuple) -> Tuple:
+    if record[0] == 'submission':
+      return ('submission', record[1], record[2], record[3])
+    return (record[0],)
+
+
+  def __apply(self, state: JournalState, record: tuple) -> Tuple:
+    """
+      Applies a replayed record to the state.
+
+      Returns:
+        Tuple: The key of the record.
+    """
+    kind = record[0]
+    if kind == 'round':
+      state.round = (record[1], record[2])
+      self.__closed.discard(record[1])
+    elif kind == 'closed':
+      state.closed = record[1]
+      state.submissions.pop(record[1], None)
+      self.__closed.add(record[1])
+      for key in [key for key in self.__offsets if key[0] == 'submission' and key[1] == record[1]]:
+        del self.__offsets[key]
+        self.__digests.pop(key, None)
+    elif kind == 'submission':
+      _, round_number, team_id, role, digest, content = record
+      state.submissions.setdefault(round_number, {}).setdefault(team_id, {})[role] = content
+      self.__digests[self.__key(record)] = digest
+    return self.__key(record)
+
+
+  def __append(self, record: tuple) -> None:
+    """
+      Queues a record for the next group commit and waits until it is committed.
+    """
+    if self.__file is None:
+      return
+
+    key = self.__key(record)
+    digest = record[4] if record[0] == 'submission' else None
+    with self.__lock:
+      # Only the digests of the committed records are known, so a record whose commit
+      # failed is written again
+      if digest is not None and self.__digests.get(key) == digest:
+        self.skipped += 1
+        return
+
+      payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+      event = Event()
+      self.__queue.append((key, FRAME.pack(len(payload), zlib.crc32(payload)) + payload, digest, event))
+
+      committing, self.__committing = self.__committing, True
+
+    if not committing:
+      eventlet.spawn(self.__commit)
+    event.wait()
+
+
+  def __commit(self) -> None:
+    """
+      Writes the queued records in batches, each batch with a single fsync.
+    """
+    while True:
+      with self.__lock:
+        batch, self.__queue = self.__queue, []
+        if not batch:
+          self.__committing = False
+          return
+
+      try:
+        offset = self.__size
+        tpool.execute(self.__write, offset, b''.join(frame for _, frame, _, _ in batch))
+      except Exception as e:
+        for _, _, _, event in batch:
+          event.send_exception(e)
+        continue
+
+      with self.__lock:
+        for key, frame, digest, _ in batch:
+          # The submissions of a round closed meanwhile are not live anymore
+          if key[0] != 'submission' or key[1] not in self.__closed:
+            self.__offsets[key] = (offset, len(frame))
+            if digest is not None:
+              self.__digests[key] = digest
+          offset += len(frame)
+        self.__size = offset
+        self.records += len(batch)
+        self.commits += 1
+
+      for _, _, _, event in batch:
+        event.send()
+
+      self.__compact_if_needed()
+
+
+  def __write(self, offset: int, data: bytes) -> None:
+    """
+      Appends a batch at the given offset, the end of the committed records. A batch that
+      fails is truncated, so the next one does not follow a torn frame ending the replay.
+    """
+    try:
+      self.__file.write(data)
+      self.__file.flush()
+      os.fsync(self.__file.fileno())
+    except BaseException:
+      self.__truncate(offset)
+      raise
+
+
+  def __truncate(self, offset: int) -> None:
+    """
+      Drops the bytes written past an offset, reopening the journal so the data left in
+      the buffer of the failed write is not flushed after them.
+    """
+    try:
+      self.__file.close()
+    except OSError:
+      pass
+
+    try:
+      os.truncate(self.__path, offset)
+    except OSError as e:
+      app.logger.error(f'Unable to truncate the journal at {offset} bytes: {e!r}')
+    self.__file = open(self.__path, 'ab')
+
+
+  def __compact_if_needed(self) -> None:
+    """
+      Rewrites the journal with its live records when it is mostly made of overwritten
+      records. Runs in the committer, so no batch is written meanwhile.
+    """
+    with self.__lock:
+      live = sum(length for _, length in self.__offsets.values())
+      if self.__size < self.__compact_size or live * 2 > self.__size:
+        return
+      offsets = sorted(self.__offsets.items(), key=lambda item: item[1][0])
+
+    try:
+      moved = tpool.execute(self.__rewrite, offsets)
+    except OSError as e:
+      app.logger.warning(f'Unable to compact the journal: {e!r}')
+      return
+
+    with self.__lock:
+      for key, (offset, length) in moved.items():
+        if key in self.__offsets:
+          self.__offsets[key] = (offset, length)
+      self.__size = sum(length for _, length in moved.values())
+      self.compactions += 1
+
+
+  def __rewrite(self, offsets: List[Tuple[Tuple, Tuple[int, int]]]) -> Dict[Tuple, Tuple[int, int]]:
+    """
+      Copies the live records in a new journal replacing the current one.
+    """
+    moved = {}
+    tmp = f'{self.__path}.compact'
+    with open(self.__path, 'rb') as src, open(tmp, 'wb') as dst:
+      for key, (offset, length) in offsets:
+        src.seek(offset)
+        moved[key] = (dst.tell(), length)
+        dst.write(src.read(length))
+      dst.flush()
+      os.fsync(dst.fileno())
+
+    os.replace(tmp, self.__path)
+    self.__file.close()
+    self.__file = open(self.__path, 'ab')
+    return moved
+
+
+
+journal = SubmissionJournal()
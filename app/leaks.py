@@ -0,0 +1,124 @@
+# Description:  This file contains the broadcaster batching the leaked code sent to every client.
+# Path:         app/leaks.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import json
+import zlib
+from collections import OrderedDict
+
+import eventlet
+from eventlet.semaphore import Semaphore
+from flask import Flask
+from flask_socketio import SocketIO
+
+
+class LeakBroadcaster:
+  """
+    Coalesces the leaks into one 'leak_batch' message sent to every client at a fixed
+    interval, instead of one broadcast per leak.
+
+    A code leaked several times in the same interval is sent once. When the batch exceeds
+    its size, the oldest leaks are dropped, the newest being always kept. A batch larger
+    than the compression threshold is sent deflated.
+  """
+  def __init__(self):
+    self.__batch: 'OrderedDict[str, None]' = OrderedDict()
+    self.__size = 0
+    self.__scheduled = False
+    self.__lock = Semaphore()
+    self.__socket = None
+    self.__interval = 3
+    self.__max_size = 256 * 1024
+    self.__compression_threshold = 4 * 1024
+
+    self.queued = 0
+    self.deduplicated = 0
+    self.dropped = 0
+    self.batches = 0
+
+
+  def init_app(self, app: Flask, socketio: SocketIO) -> None:
+    """
+      Initializes the LeakBroadcaster with the Flask app and SocketIO instance.
+
+      Args:
+        app (Flask): The Flask app instance.
+        socketio (SocketIO): The SocketIO instance.
+    """
+    self.__socket = socketio
+    self.__interval = app.config.get('LEAK_INTERVAL', 3)
+    self.__max_size = app.config.get('LEAK_BATCH_SIZE', 256 * 1024)
+    self.__compression_threshold = app.config.get('LEAK_COMPRESSION_THRESHOLD', 4 * 1024)
+
+
+  def queue(self, code: str) -> None:
+    """
+      Queues a leaked code for the next batch.
+
+      Args:
+        code (str): The sanitized code that leaked.
+    """
+    with self.__lock:
+      self.queued += 1
+      if code in self.__batch:
+        self.__batch.move_to_end(code)
+        self.deduplicated += 1
+        return
+
+      self.__batch[code] = None
+      self.__size += len(code)
+      while self.__size > self.__max_size and len(self.__batch) > 1:
+        oldest, _ = self.__batch.popitem(last=False)
+        self.__size -= len(oldest)
+        self.dropped += 1
+
+      if self.__scheduled:
+        return
+      self.__scheduled = True
+
+    eventlet.spawn_after(self.__interval, self.flush)
+
+
+  def flush(self) -> None:
+    """
+      Sends the queued leaks to every client.
+    """
+    with self.__lock:
+      leaks = list(self.__batch)
+      self.__batch.clear()
+      self.__size = 0
+      self.__scheduled = False
+
+    if not leaks:
+      return
+
+    payload = json.dumps(leaks).encode('utf-8')
+    if 0 < self.__compression_threshold <= len(payload):
+      message = {'encoding': 'deflate', 'data': zlib.compress(payload)}
+    else:
+      message = {'encoding': None, 'leaks': leaks}
+
+    self.batches += 1
+    self.__socket.emit('leak_batch', message)
+
+
+  def stats(self) -> dict:
+    """
+      Returns the counters of the broadcaster.
+
+      Returns:
+        dict: The queued, deduplicated and dropped leaks, and the batches sent.
+    """
+    with self.__lock:
+      return {
+        'pending': len(self.__batch),
+        'queued': self.queued,
+        'deduplicated': self.deduplicated,
+        'dropped': self.dropped,
+        'batches': self.batches,
+      }
+
+
+
+leak_broadcaster = LeakBroadcaster()
@@ -0,0 +1,182 @@
+# Description:  This file contains the live scorer, giving the teams their score while the round is running.
+# Path:         app/live_scoring.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import json
+import time
+from typing import Any, Dict, Tuple
+
+import eventlet
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+from flask import Flask
+from flask_socketio import SocketIO
+
+from app.backend import backend
+from app.cache import content_key
+from app.cmd.app import app
+from app.models import Challenge, Team
+from app.scoring import score_submissions
+from app.utils import cleanup_html, cleanup_css
+
+# The hash of the live scores of the teams, when the workers share a backend
+LEADERBOARD_KEY = 'live:leaderboard'
+
+
+class LiveScorer:
+  """
+    Scores the submissions of the teams in the background while a round is running.
+
+    The syncs of a team are debounced: only the newest code is kept, and a team is scored
+    at most once per interval. The cleaning, rendering and scoring run off the eventlet
+    hub, then the score is pushed to the team room and the leaderboard to the admins.
+
+    A team is scored by the worker which received its syncs; with a shared backend, the
+    scores are kept there so the leaderboard covers the teams of every worker.
+  """
+  def __init__(self):
+    self.__pending: Dict[Any, Tuple[int, Challenge, str, str]] = {}
+    self.__scheduled = set()
+    self.__last: Dict[Any, float] = {}
+    self.__scores: Dict[Any, float] = {}
+    self.__names: Dict[Any, str] = {}
+    self.__round = None
+    self.__lock = Semaphore()
+    self.__slots = Semaphore(4)
+    self.__interval = 10
+    self.__socket = None
+
+
+  def init_app(self, app: Flask, socketio: SocketIO) -> None:
+    """
+      Initializes the LiveScorer with the Flask app and SocketIO instance.
+
+      Args:
+        app (Flask): The Flask app instance.
+        socketio (SocketIO): The SocketIO instance.
+    """
+    self.__socket = socketio
+    self.__interval = app.config.get('LIVE_SCORE_INTERVAL', 10)
+    self.__slots = Semaphore(app.config.get('LIVE_SCORE_CONCURRENCY', 4))
+
+
+  def submit(self, team_id: Any, round_number: int, challenge: Challenge, html: str, css: str) -> None:
+    """
+      Queues the latest code of a team, replacing the code not scored yet.
+
+      Args:
+        team_id (Any): The ID of the team.
+        round_number (int): The current round number.
+        challenge (Challenge): The challenge of the current round.
+        html (str): The raw HTML code of the team.
+        css (str): The raw CSS code of the team.
+    """
+    with self.__lock:
+      if self.__round != round_number:
+        self.__reset(round_number)
+
+      self.__pending[team_id] = (round_number, challenge, html, css)
+      if team_id in self.__scheduled:
+        return
+
+      self.__scheduled.add(team_id)
+      delay = max(0, self.__last.get(team_id, 0) + self.__interval - time.monotonic())
+
+    eventlet.spawn_after(delay, self.__score, team_id)
+
+
+  def reset(self) -> None:
+    """
+      Drops the pending code and the leaderboard, at the end of a round.
+    """
+    with self.__lock:
+      self.__reset(None)
+    if backend.shared:
+      backend.delete(LEADERBOARD_KEY)
+
+
+  def leaderboard(self) -> dict:
+    """
+      Returns the live leaderboard of the current round.
+
+      Returns:
+        dict: The round number and the teams ordered by decreasing score.
+    """
+    if backend.shared:
+      entries = [json.loads(value) for value in backend.hgetall(LEADERBOARD_KEY).values()]
+      round_number = max((entry[0] for entry in entries), default=None)
+      scores = sorted(((name, score) for number, name, score in entries if number == round_number), key=lambda item: -item[1])
+      return {'round': round_number, 'scores': [{'team': name, 'score': score} for name, score in scores]}
+
+    with self.__lock:
+      scores = sorted(self.__scores.items(), key=lambda item: -item[1])
+      return {
+        'round': self.__round,
+        'scores': [{'team': self.__names.get(team_id, str(team_id)), 'score': score} for team_id, score in scores],
+      }
+
+
+  def __reset(self, round_number: Any) -> None:
+    """
+      Starts a new leaderboard. Must be called with the lock held.
+    """
+    self.__round = round_number
+    self.__pending.clear()
+    self.__scores.clear()
+
+
+  def __score(self, team_id: Any) -> None:
+    """
+      Scores the pending code of a team, then schedules the next scoring if the team
+      synced again in the meantime.
+
+      Args:
+        team_id (Any): The ID of the team.
+    """
+    try:
+      with self.__lock:
+        job = self.__pending.pop(team_id, None)
+
+      if job is not None:
+        with self.__slots:
+          self.__evaluate(team_id, *job)
+    except Exception as e:
+      app.logger.warning(f'Unable to score team {team_id}: {e!r}')
+
+    with self.__lock:
+      self.__last[team_id] = time.monotonic()
+      again = team_id in self.__pending
+      if not again:
+        self.__scheduled.discard(team_id)
+
+    if again:
+      eventlet.spawn_after(self.__interval, self.__score, team_id)
+
+
+  def __evaluate(self, team_id: Any, round_number: int, challenge: Challenge, html: str, css: str) -> None:
+    """
+      Scores the code of a team and pushes the results to the team and to the admins.
+    """
+    html, css = tpool.execute(lambda: (cleanup_html(html), cleanup_css(css)))
+    key = content_key(challenge._id, html, css)
+    score = score_submissions(challenge, {key: (html, css)})[key]
+
+    if team_id not in self.__names:
+      team = Team.objects(id=team_id).only('name').first()
+      self.__names[team_id] = team.name if team else str(team_id)
+
+    with self.__lock:
+      if self.__round != round_number:
+        return
+      self.__scores[team_id] = score
+
+    if backend.shared:
+      backend.hset(LEADERBOARD_KEY, str(team_id), json.dumps([round_number, self.__names[team_id], score]))
+
+    self.__socket.emit('score', {'round': round_number, 'score': score}, room=str(team_id))
+    self.__socket.emit('leaderboard', self.leaderboard(), room='admin')
+
+
+
+live_scorer = LiveScorer()
@@ -0,0 +1,253 @@
+# Description:  This file contains the buffered log writer used by the submission logger.
+# Path:         app/logs.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import glob
+import gzip
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from typing import List, Tuple, Union
+
+import eventlet
+from eventlet import patcher, tpool
+from eventlet.event import Event
+from eventlet.semaphore import Semaphore
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# The batches are written from native threads, which can not wait on green locks.
+threading = patcher.original('threading')
+
+
+def format_record(created: float, message: str) -> str:
+  """
+    Formats a record like the `[%(asctime)s] %(message)s` format of the logging module.
+
+    Args:
+      created (float): The time the record was created.
+      message (str): The message of the record.
+
+    Returns:
+      str: The formatted line, without its newline.
+  """
+  seconds = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))
+  return f'[{seconds},{int(created % 1 * 1000):03d}] {message}'
+
+
+
+class BufferedLogWriter:
+  """
+    Writes log records from a bounded in-memory ring, in batches, off the eventlet hub.
+
+    Appending a record never blocks: the ring is bounded by the size of its messages, in
+    characters, and the oldest records are dropped and counted to make room for a new
+    one. A background green thread drains the ring every flush interval, or as soon as it
+    is half full, and writes the batch from a native thread. A batch which can not be
+    written is counted as a failure, and the writer carries on with the next one.
+
+    The file is rotated when it exceeds its size or its age. The rotated files are
+    compressed with gzip (or zstd, if installed) and only the newest backups are kept.
+  """
+  def __init__(self, filename: str, capacity: int = 16 * 1024 * 1024, flush_interval: float = 1,
+               max_bytes: int = 0, rotate_interval: float = 0, backup_count: int = 10,
+               compression: Union[str, None] = 'gzip', stream: bool = True):
+    self.__filename = filename
+    self.__records: 'deque[Tuple[float, str]]' = deque()
+    self.__capacity = capacity
+    self.__size = 0
+    self.__flush_interval = flush_interval
+    self.__max_bytes = max_bytes
+    self.__rotate_interval = rotate_interval
+    self.__backup_count = backup_count
+    self.__compression = compression if compression != 'zstd' or zstandard is not None else 'gzip'
+    self.__stream = stream
+    self.__lock = Semaphore()
+    self.__write_lock = threading.Lock()
+    self.__wakeup = Event()
+    self.__thread = None
+    self.__file = None
+    self.__opened = 0
+
+    self.written = 0
+    self.dropped = 0
+    self.rotations = 0
+    self.failures = 0
+
+
+  def append(self, message: str) -> None:
+    """
+      Queues a record, dropping the oldest record if the ring is full.
+
+      Args:
+        message (str): The message of the record.
+    """
+    with self.__lock:
+      while self.__records and self.__size + len(message) > self.__capacity:
+        self.__size -= len(self.__records.popleft()[1])
+        self.dropped += 1
+      self.__records.append((time.time(), message))
+      self.__size += len(message)
+
+      if self.__thread is None:
+        self.__thread = eventlet.spawn(self.__run)
+      elif self.__size * 2 >= self.__capacity and not self.__wakeup.ready():
+        self.__wakeup.send()
+
+
+  def flush(self) -> None:
+    """
+      Writes the queued records, blocking the caller until they are written.
+    """
+    tpool.execute(self.__write, self.__drain())
+
+
+  def close(self) -> None:
+    """
+      Stops the background writer, writes the queued records and closes the file.
+    """
+    with self.__lock:
+      thread, self.__thread = self.__thread, None
+    if thread is not None:
+      thread.kill()
+
+    self.flush()
+    tpool.execute(self.__close_file)
+
+
+  def stats(self) -> dict:
+    """
+      Returns the counters of the writer.
+
+      Returns:
+        dict: The pending, written and dropped records, and the rotations of the file.
+    """
+    with self.__lock:
+      return {
+        'pending': len(self.__records),
+        'pending_size': self.__size,
+        'capacity': self.__capacity,
+        'written': self.written,
+        'dropped': self.dropped,
+        'rotations': self.rotations,
+        'failures': self.failures,
+      }
+
+
+  def __run(self) -> None:
+    """
+      Main loop of the background writer.
+    """
+    while True:
+      with eventlet.Timeout(self.__flush_interval, False):
+        self.__wakeup.wait()
+      with self.__lock:
+        self.__wakeup = Event()
+
+      records = self.__drain()
+      try:
+        tpool.execute(self.__write, records)
+      except Exception as e:
+        self.failures += 1
+        print(f'Unable to write {len(records)} log records: {e!r}', file=sys.stderr)
+
+
+  def __drain(self) -> List[Tuple[float, str]]:
+    with self.__lock:
+      records = list(self.__records)
+      self.__records.clear()
+      self.__size = 0
+      return records
+
+
+  def __write(self, records: List[Tuple[float, str]]) -> None:
+    """
+      Writes a batch of records to the file, rotating it first if needed, and to the
+      stream. Runs in a native thread, one batch at a time.
+    """
+    if not records:
+      return
+
+    data = ''.join(f'{format_record(created, message)}\n' for created, message in records)
+    with self.__write_lock:
+      try:
+        self.__rotate_if_needed()
+        if self.__file is None:
+          self.__open()
+        self.__file.write(data)
+        self.__file.flush()
+        self.written += len(records)
+      except (OSError, ValueError):
+        self.failures += 1
+
+      # The echo is best effort: a closed or broken stderr does not lose the records
+      if self.__stream:
+        try:
+          sys.stderr.write(data)
+          sys.stderr.flush()
+        except (OSError, ValueError):
+          pass
+
+
+  def __close_file(self) -> None:
+    with self.__write_lock:
+      if self.__file is not None:
+        self.__file.close()
+        self.__file = None
+
+
+  def __open(self) -> None:
+    # Lone surrogates are valid in a str but not in UTF-8; they are written escaped
+    self.__file = open(self.__filename, mode='a', encoding='utf-8', errors='backslashreplace')
+    self.__opened = time.time()
+
+
+  def __rotate_if_needed(self) -> None:
+    """
+      Rotates the file when it exceeds its size or its age. Must be called with the
+      write lock held.
+    """
+    if self.__file is None:
+      return
+
+    too_big = self.__max_bytes > 0 and self.__file.tell() >= self.__max_bytes
+    too_old = self.__rotate_interval > 0 and time.time() - self.__opened >= self.__rotate_interval
+    if not too_big and not too_old:
+      return
+
+    self.__file.close()
+    self.__file = None
+
+    rotated = f'{self.__filename}.{time.strftime("%Y%m%d-%H%M%S")}'
+    suffix = 0
+    while glob.glob(f'{glob.escape(rotated)}*'):
+      suffix += 1
+      rotated = f'{self.__filename}.{time.strftime("%Y%m%d-%H%M%S")}.{suffix}'
+    os.rename(self.__filename, rotated)
+    self.__compress(rotated)
+    self.rotations += 1
+
+    backups = sorted(glob.glob(f'{glob.escape(self.__filename)}.*'), key=os.path.getmtime)
+    for backup in backups[:max(0, len(backups) - self.__backup_count)]:
+      os.remove(backup)
+
+
+  def __compress(self, path: str) -> None:
+    """
+      Compresses a rotated file, replacing it by its compressed copy.
+    """
+    if self.__compression == 'gzip':
+      with open(path, 'rb') as src, gzip.open(f'{path}.gz', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    elif self.__compression == 'zstd':
+      with open(path, 'rb') as src, open(f'{path}.zst', 'wb') as dst:
+        zstandard.ZstdCompressor().copy_stream(src, dst)
+    else:
+      return
+    os.remove(path)
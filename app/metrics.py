@@ -0,0 +1,222 @@
+# Description:  This file contains the metrics of the app, exposed in the Prometheus text format.
+# Path:         app/metrics.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Any, Callable, Dict, List, Tuple
+
+import eventlet
+from flask import Flask
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# The histograms of the app: their help, the names of their labels and their buckets
+HISTOGRAMS = {
+  'socketio_event_seconds': ('Time spent handling a Socket.IO event.', ('event',), LATENCY_BUCKETS),
+  'socketio_payload_bytes': ('Size of the code received with a Socket.IO event.', ('event',), SIZE_BUCKETS),
+  'sanitize_seconds': ('Time spent sanitizing a synced document.', ('role',), LATENCY_BUCKETS),
+  'persist_seconds': ('Time spent persisting the submissions of a round.', (), LATENCY_BUCKETS),
+  'hub_lag_seconds': ('Delay of the eventlet hub in waking up a sleeping green thread.', (), LAG_BUCKETS),
+}
+
+EVENTS = ('connect', 'disconnect', 'sync', 'sync_delta', 'update_resync')
+ROLES = ('html', 'css')
+
+
+class Histogram:
+  """
+    A histogram with preallocated buckets: recording a value only increments a counter.
+  """
+  __slots__ = ('bounds', 'counts', 'sum')
+
+  def __init__(self, bounds: Tuple[float, ...]):
+    self.bounds = bounds
+    self.counts = [0] * (len(bounds) + 1)
+    self.sum = 0.0
+
+
+  def observe(self, value: float) -> None:
+    self.counts[bisect_left(self.bounds, value)] += 1
+    self.sum += value
+
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = '') -> str:
+  labels = [f'{name}="{value}"' for name, value in zip(names, values)]
+  if extra:
+    labels.append(extra)
+  return '{' + ','.join(labels) + '}' if labels else ''
+
+
+
+class Metrics:
+  """
+    Records the metrics of the app. The histograms of the known label values are
+    allocated upfront, and every update is a few integer increments on the hub, without
+    locks: the instrumentation does not slow the handlers down.
+
+    The counters kept by the components (caches, pools, journal...) are read from their
+    `stats()` when the metrics are rendered.
+  """
+  def __init__(self):
+    self.__histograms: Dict[str, Dict[Tuple, Histogram]] = {name: {} for name in HISTOGRAMS}
+    self.__clients: Dict[str, int] = {}
+    self.__collectors: List[Tuple[str, Callable[[], dict]]] = []
+    self.__lag_interval = 0.5
+    self.__lag = 0.0
+    self.__monitor = None
+
+    for event in EVENTS:
+      self.__histogram('socketio_event_seconds', (event,))
+      self.__histogram('socketio_payload_bytes', (event,))
+    for role in ROLES:
+      self.__histogram('sanitize_seconds', (role,))
+    self.__histogram('persist_seconds', ())
+    self.__histogram('hub_lag_seconds', ())
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the Metrics with the configurations of the Flask app, and starts the
+      monitor of the hub.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    self.__lag_interval = app.config.get('METRICS_LAG_INTERVAL', 0.5)
+    if self.__monitor is None:
+      self.__monitor = eventlet.spawn(self.__monitor_hub)
+
+
+  def observe(self, name: str, labels: Tuple, value: float) -> None:
+    """
+      Records a value in a histogram.
+
+      Args:
+        name (str): The name of the histogram.
+        labels (Tuple): The values of its labels.
+        value (float): The value.
+    """
+    histogram = self.__histograms[name].get(labels)
+    if histogram is None:
+      histogram = self.__histogram(name, labels)
+    histogram.observe(value)
+
+
+  def joined(self, room: str) -> None:
+    self.__clients[room] = self.__clients.get(room, 0) + 1
+
+
+  def left(self, room: str) -> None:
+    self.__clients[room] = max(0, self.__clients.get(room, 0) - 1)
+
+
+  def register(self, component: str, stats: Callable[[], dict]) -> None:
+    """
+      Exposes the counters of a component.
+
+      Args:
+        component (str): The name of the component, prefixing its metrics.
+        stats (Callable[[], dict]): Returns the counters of the component.
+    """
+    self.__collectors.append((component, stats))
+
+
+  def instrument(self, event: str) -> Callable:
+    """
+      Decorator recording the latency of a Socket.IO handler and the size of its payload.
+
+      Args:
+        event (str): The name of the event.
+
+      Returns:
+        Callable: The decorator.
+    """
+    latency = self.__histograms['socketio_event_seconds'].get((event,)) or self.__histogram('socketio_event_seconds', (event,))
+    sizes = self.__histograms['socketio_payload_bytes'].get((event,)) or self.__histogram('socketio_payload_bytes', (event,))
+
+    def decorator(func: Callable) -> Callable:
+      @wraps(func)
+      def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if args:
+          payload = args[0]
+          if isinstance(payload, str):
+            sizes.observe(len(payload))
+          elif isinstance(payload, dict) and isinstance(payload.get('text'), str):
+            sizes.observe(len(payload['text']))
+
+        started = time.perf_counter()
+        try:
+          return func(*args, **kwargs)
+        finally:
+          latency.observe(time.perf_counter() - started)
+      return wrapper
+    return decorator
+
+
+  def render(self) -> str:
+    """
+      Renders the metrics in the Prometheus text format.
+
+      Returns:
+        str: The metrics.
+    """
+    lines = []
+    for name, (description, label_names, bounds) in HISTOGRAMS.items():
+      lines.append(f'# HELP art_forgery_{name} {description}')
+      lines.append(f'# TYPE art_forgery_{name} histogram')
+      for labels, histogram in list(self.__histograms[name].items()):
+        counts, cumulative = list(histogram.counts), 0
+        for bound, count in zip(bounds + ('+Inf',), counts):
+          cumulative += count
+          le = f'le="{bound}"'
+          lines.append(f'art_forgery_{name}_bucket{format_labels(label_names, labels, le)} {cumulative}')
+        lines.append(f'art_forgery_{name}_sum{format_labels(label_names, labels)} {histogram.sum}')
+        lines.append(f'art_forgery_{name}_count{format_labels(label_names, labels)} {cumulative}')
+
+    lines.append('# HELP art_forgery_hub_lag_last_seconds Last measured delay of the eventlet hub.')
+    lines.append('# TYPE art_forgery_hub_lag_last_seconds gauge')
+    lines.append(f'art_forgery_hub_lag_last_seconds {self.__lag}')
+
+    lines.append('# HELP art_forgery_room_clients Clients connected to a Socket.IO room.')
+    lines.append('# TYPE art_forgery_room_clients gauge')
+    for room, count in sorted(self.__clients.items()):
+      lines.append(f'art_forgery_room_clients{{room="{room}"}} {count}')
+
+    for component, stats in self.__collectors:
+      for key, value in stats().items():
+        if isinstance(value, bool):
+          value = int(value)
+        if isinstance(value, (int, float)):
+          lines.append(f'# TYPE art_forgery_{component}_{key} untyped')
+          lines.append(f'art_forgery_{component}_{key} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+  def __histogram(self, name: str, labels: Tuple) -> Histogram:
+    histogram = self.__histograms[name][labels] = Histogram(HISTOGRAMS[name][2])
+    return histogram
+
+
+  def __monitor_hub(self) -> None:
+    """
+      Sleeps at a fixed interval and records how late the hub wakes it up, the time the
+      other green threads held the hub without yielding.
+    """
+    histogram = self.__histograms['hub_lag_seconds'][()]
+    while True:
+      started = time.perf_counter()
+      eventlet.sleep(self.__lag_interval)
+      self.__lag = max(0.0, time.perf_counter() - started - self.__lag_interval)
+      histogram.observe(self.__lag)
+
+
+
+metrics = Metrics()
@@ -3,17 +3,22 @@
 # Author:      Capucinoxx
 # Date:        2024
 
-import base64
 import os
+import time
 from datetime import datetime
 from enum import Enum
+from typing import Tuple
 
 from flask_login import UserMixin
+from pymongo import UpdateOne
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from app.blobstore import blob_store
 from app.cmd.app import app
 from app.cmd.config import IMAGES_FOLDER
 from app.database import db
+from app.features import feature_store
+from app.metrics import metrics
 
 
 class SubmissionType(Enum):
@@ -149,7 +154,6 @@ class Challenge(db.Document):
     return {
       'id': self._id,
       'name': self.name,
-      'image': base64.b64encode(self.image).decode('utf-8'),
     }
 
 
@@ -159,22 +163,52 @@ class Submission(db.Document):
     Class used to represent a submission in the application.
     When round ends, teams persist their HTML and CSS code to the database.
   """
-  meta = {'collection': 'submissions'}
+  meta = {
+    'collection': 'submissions',
+    'indexes': [
+      {'fields': ('team', 'round_number'), 'unique': True},
+      ('-round_number', 'team'),
+    ],
+  }
 
   team = db.ReferenceField(Team)
   round_number = db.IntField()
+  html_digest = db.StringField()
+  css_digest = db.StringField()
+  timestamp = db.DateTimeField(default=datetime.now)
+  score = db.FloatField()
+  points = db.FloatField()
+  rank = db.IntField()
+
+  # Bodies of the submissions persisted before the blob store, read when there is no digest
   html = db.StringField()
   css = db.StringField()
-  timestamp = db.DateTimeField(default=datetime.now)
+
+
+  def code(self) -> Tuple[str, str]:
+    """
+      Reads the bodies of the submission from the blob store.
+
+      Returns:
+        Tuple[str, str]: The HTML and CSS code of the submission.
+    """
+    bodies = blob_store.get_many([self.html_digest, self.css_digest])
+    html = bodies.get(self.html_digest, '') if self.html_digest else self.html or ''
+    css = bodies.get(self.css_digest, '') if self.css_digest else self.css or ''
+    return html, css
 
 
   def to_dict(self) -> dict:
     return {
+      'id': str(self.id),
       'team': self.team.to_dict(),
       'round_number': self.round_number,
-      'html': self.html,
-      'css': self.css,
+      'html_digest': self.html_digest,
+      'css_digest': self.css_digest,
       'timestamp': self.timestamp.isoformat(),
+      'score': self.score,
+      'points': self.points,
+      'rank': self.rank,
     }
 
 
@@ -182,7 +216,8 @@ class Submission(db.Document):
 def seed_challenges():
   """
     Seeds the challenges in the database.
-    Reads the images from the images folder and saves them as challenges.
+    Reads the images from the images folder and saves them as challenges, then builds
+    the feature store entry of every challenge.
   """
   for image in sorted(os.listdir(IMAGES_FOLDER)):
     if image.endswith('.png'):
@@ -194,6 +229,9 @@ def seed_challenges():
         challenge = Challenge(name=image_name, image=f.read())
         challenge.save()
 
+  for challenge in Challenge.objects():
+    feature_store.build(challenge.image)
+
 
 
 def seed_users(data):
@@ -227,18 +265,63 @@ def seed_users(data):
 
 def persist_sumbissions(round_number: int, data: dict):
   """
-    Persists the submissions in the database.
-  """
-  app.logger.warning(f'Persisting submissions for round {round_number} {data}')
-
-  for team in Team.objects():
-    if not team:
-      continue
-
-    html = data.get(team.id, {}).get(SubmissionType.HTML, '')
-    css = data.get(team.id, {}).get(SubmissionType.CSS, '')
+    Persists the submissions of a round in the database, with a single unordered bulk
+    write. The submissions are upserted by team and round number, so persisting a round
+    again replaces its submissions instead of duplicating them.
 
-    app.logger.warning(f'Persisting submission for {team.id} - {round_number} - {html} - {css}')
-
-    submission = Submission(team=team, round_number=round_number, html=html, css=css)        
-    submission.save()
\ No newline at end of file
+    The bodies are stored in the blob store, the submissions only holding their digests;
+    the references to the bodies of the replaced submissions are released.
+  """
+  started = time.perf_counter()
+  now = datetime.now()
+
+  team_ids = list(Team.objects().scalar('id'))
+  if not team_ids:
+    return
+
+  bodies = []
+  for team_id in team_ids:
+    submission = data.get(team_id, {})
+    bodies.append(submission.get(SubmissionType.HTML, ''))
+    bodies.append(submission.get(SubmissionType.CSS, ''))
+  digests = blob_store.put_many(bodies)
+
+  collection = Submission._get_collection()
+  replaced = collection.find({'round_number': round_number}, {'html_digest': 1, 'css_digest': 1})
+  released = [document.get(field) for document in replaced for field in ('html_digest', 'css_digest')]
+
+  requests = []
+  for i, team_id in enumerate(team_ids):
+    requests.append(UpdateOne(
+      {'team': team_id, 'round_number': round_number},
+      {
+        '$set': {'html_digest': digests[2 * i], 'css_digest': digests[2 * i + 1], 'timestamp': now},
+        '$unset': {'html': '', 'css': ''},
+      },
+      upsert=True,
+    ))
+
+  result = collection.bulk_write(requests, ordered=False)
+  blob_store.release(released)
+  metrics.observe('persist_seconds', (), time.perf_counter() - started)
+  app.logger.info(f'Persisted {len(requests)} submissions ({len(set(digests))} distinct bodies) for round {round_number} '
+                  f'({result.upserted_count} inserted, {result.modified_count} updated) '
+                  f'in {time.perf_counter() - started:.3f}s')
+
+
+
+def persist_scores(round_number: int, results: list):
+  """
+    Persists the scores of a round next to the submissions of the teams, with a single
+    unordered bulk write.
+  """
+  requests = [
+    UpdateOne(
+      {'team': result['team'], 'round_number': round_number},
+      {'$set': {'score': result['score'], 'points': result['points'], 'rank': result['rank']}},
+    )
+    for result in results
+  ]
+
+  if requests:
+    Submission._get_collection().bulk_write(requests, ordered=False)
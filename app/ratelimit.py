@@ -0,0 +1,214 @@
+# Description:  This file contains the per-user rate limiter of the synced code.
+# Path:         app/ratelimit.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+import eventlet
+from flask import Flask
+
+from app.cmd.app import app
+
+
+class TokenBucket:
+  """
+    A token bucket, refilled at a fixed rate up to its burst.
+  """
+  __slots__ = ('tokens', 'updated')
+
+  def __init__(self, burst: float, now: float):
+    self.tokens = burst
+    self.updated = now
+
+
+  def take(self, now: float, rate: float, burst: float) -> float:
+    """
+      Takes a token from the bucket.
+
+      Returns:
+        float: 0 if a token was taken, otherwise the seconds until a token is available.
+    """
+    self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+    self.updated = now
+    if self.tokens >= 1:
+      self.tokens -= 1
+      return 0
+    return (1 - self.tokens) / rate
+
+
+  def full(self, now: float, rate: float, burst: float) -> bool:
+    """
+      Returns whether the bucket refilled up to its burst, a fresh bucket being the same.
+    """
+    return self.tokens + (now - self.updated) * rate >= burst
+
+
+
+class SyncLimiter:
+  """
+    Limits the syncs processed for each user with a token bucket, so a flooding client
+    can not monopolize the sanitizers, the logs and the broadcasts.
+
+    The syncs over the limit are not dropped but coalesced: only the latest sync of the
+    user waits, and it is processed as soon as the bucket has a token, the ones it
+    replaced being stale by then.
+
+    The buckets are kept by each worker: a user connected to several workers at once gets
+    the rate of each of them. The buckets refilled to their burst are dropped once per
+    window, and the syncs delayed or coalesced of each user are counted by second over
+    the last window only.
+  """
+  def __init__(self):
+    self.__buckets: Dict[Any, TokenBucket] = {}
+    self.__pending: Dict[Any, Tuple[Callable[..., None], tuple]] = {}
+    self.__throttled_users: Dict[Any, Deque[List[int]]] = {}
+    self.__rate = 2.0
+    self.__burst = 5.0
+    self.__window = 60
+    self.__next_sweep = 0.0
+
+    self.admitted = 0
+    self.throttled = 0
+    self.coalesced = 0
+    self.failed = 0
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the SyncLimiter with the configurations of the Flask app.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    self.__rate = app.config.get('SYNC_RATE', 2.0)
+    self.__burst = app.config.get('SYNC_BURST', 5.0)
+    self.__window = app.config.get('SYNC_THROTTLE_WINDOW', 60)
+
+
+  def submit(self, key: Any, callback: Callable[..., None], *args: Any) -> None:
+    """
+      Processes a sync of a user, right away when the bucket of the user has a token,
+      otherwise once it has one, unless a newer sync replaces it meanwhile.
+
+      Args:
+        key (Any): The identifier of the user.
+        callback (Callable[..., None]): Processes the sync.
+        *args (Any): The arguments of the callback.
+    """
+    if self.__rate <= 0:
+      callback(*args)
+      return
+
+    now = time.monotonic()
+    if now >= self.__next_sweep:
+      self.__sweep(now)
+
+    if key in self.__pending:
+      self.__pending[key] = (callback, args)
+      self.coalesced += 1
+      self.__record(key, now)
+      return
+
+    bucket = self.__buckets.get(key)
+    if bucket is None:
+      bucket = self.__buckets[key] = TokenBucket(self.__burst, now)
+
+    wait = bucket.take(now, self.__rate, self.__burst)
+    if not wait:
+      self.admitted += 1
+      callback(*args)
+      return
+
+    self.__pending[key] = (callback, args)
+    self.throttled += 1
+    self.__record(key, now)
+    eventlet.spawn_after(wait, self.__release, key)
+
+
+  def throttled_users(self) -> Dict[Any, int]:
+    """
+      Returns the syncs delayed or coalesced of each user throttled in the last window.
+    """
+    self.__sweep(time.monotonic())
+    return {key: sum(count for _, count in seconds) for key, seconds in self.__throttled_users.items()}
+
+
+  def stats(self) -> dict:
+    """
+      Returns the counters of the limiter.
+
+      Returns:
+        dict: The waiting syncs, the buckets, the syncs admitted, throttled, coalesced and
+              failed, and the users throttled in the last window.
+    """
+    self.__sweep(time.monotonic())
+    return {
+      'pending': len(self.__pending),
+      'buckets': len(self.__buckets),
+      'admitted': self.admitted,
+      'throttled': self.throttled,
+      'coalesced': self.coalesced,
+      'failed': self.failed,
+      'throttled_users': len(self.__throttled_users),
+    }
+
+
+  def __record(self, key: Any, now: float) -> None:
+    """
+      Counts a sync delayed or coalesced in the current second of the user.
+    """
+    second = int(now)
+    seconds = self.__throttled_users.get(key)
+    if seconds is None:
+      seconds = self.__throttled_users[key] = deque()
+    if seconds and seconds[-1][0] == second:
+      seconds[-1][1] += 1
+    else:
+      seconds.append([second, 1])
+
+
+  def __sweep(self, now: float) -> None:
+    """
+      Drops the buckets refilled to their burst without a waiting sync, and the counts of
+      the throttled users older than the window.
+    """
+    self.__next_sweep = now + self.__window
+    for key in [key for key, bucket in self.__buckets.items()
+                if key not in self.__pending and bucket.full(now, self.__rate, self.__burst)]:
+      del self.__buckets[key]
+
+    oldest = int(now) - self.__window
+    for key in list(self.__throttled_users):
+      seconds = self.__throttled_users[key]
+      while seconds and seconds[0][0] <= oldest:
+        seconds.popleft()
+      if not seconds:
+        del self.__throttled_users[key]
+
+
+  def __release(self, key: Any) -> None:
+    """
+      Processes the waiting sync of a user once its bucket has a token.
+
+      Args:
+        key (Any): The identifier of the user.
+    """
+    wait = self.__buckets[key].take(time.monotonic(), self.__rate, self.__burst)
+    if wait:
+      eventlet.spawn_after(wait, self.__release, key)
+      return
+
+    callback, args = self.__pending.pop(key)
+    self.admitted += 1
+    try:
+      callback(*args)
+    except Exception as e:
+      self.failed += 1
+      app.logger.warning(f'Unable to process the throttled sync of {key}: {e!r}')
+
+
+
+sync_limiter = SyncLimiter()
@@ -0,0 +1,284 @@
+# Description:  This file contains the pool of headless browsers used to render the submissions.
+# Path:         app/renderer.py
+# Author:       Capucinoxx
+# Date:         2024
+
+from typing import Any, Dict, List, Tuple, Union
+
+import eventlet
+import numpy as np
+from eventlet import tpool
+from eventlet.event import Event
+from eventlet.queue import LightQueue
+from eventlet.semaphore import Semaphore
+from flask import Flask
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+
+from app.cmd.app import app
+from app.features import decode_image
+
+
+# Renders the code the same way the editor preview does: the CSS in a style tag of the
+# head and the HTML as the body of a blank document.
+RENDER_SCRIPT = """
+  document.head.innerHTML = '<style>' + arguments[1] + '</style>';
+  document.body.innerHTML = arguments[0];
+"""
+
+# Flags keeping the browser offline and its output deterministic.
+CHROMIUM_ARGUMENTS = [
+  '--headless',
+  '--no-sandbox',
+  '--disable-gpu',
+  '--disable-dev-shm-usage',
+  '--disable-extensions',
+  '--disable-background-networking',
+  '--disable-sync',
+  '--no-first-run',
+  '--hide-scrollbars',
+  '--mute-audio',
+  '--force-device-scale-factor=1',
+  '--proxy-server=127.0.0.1:9',
+  '--host-resolver-rules=MAP * ~NOTFOUND',
+]
+
+
+class RenderTimeout(Exception):
+  """
+    Raised when a browser does not render a submission before the timeout.
+  """
+
+
+
+class RenderWorker:
+  """
+    A long-lived headless Chromium instance. The same blank page is reused by every
+    render, only its head and body being replaced.
+  """
+  def __init__(self, chromium_path: str, chromedriver_path: str):
+    self.__chromium_path = chromium_path
+    self.__chromedriver_path = chromedriver_path
+    self.__driver = None
+    self.__viewport = None
+
+
+  def start(self) -> None:
+    """
+      Starts the browser on a blank page.
+    """
+    options = webdriver.ChromeOptions()
+    options.binary_location = self.__chromium_path
+    for argument in CHROMIUM_ARGUMENTS:
+      options.add_argument(argument)
+
+    self.__driver = webdriver.Chrome(service=Service(executable_path=self.__chromedriver_path), options=options)
+    self.__driver.get('about:blank')
+    self.__viewport = None
+
+
+  def stop(self) -> None:
+    """
+      Stops the browser, killing it if it does not quit gracefully.
+    """
+    driver, self.__driver = self.__driver, None
+    if driver is None:
+      return
+
+    try:
+      with eventlet.Timeout(5):
+        tpool.execute(driver.quit)
+    except (Exception, eventlet.Timeout):
+      process = getattr(driver.service, 'process', None)
+      if process is not None:
+        process.kill()
+
+
+  def render(self, html: str, css: str, width: int, height: int) -> bytes:
+    """
+      Renders the code in the page and takes a screenshot of the viewport.
+
+      Args:
+        html (str): The cleaned HTML code.
+        css (str): The cleaned CSS code.
+        width (int): The width of the viewport.
+        height (int): The height of the viewport.
+
+      Returns:
+        bytes: The screenshot as a PNG image.
+    """
+    if self.__driver is None:
+      self.start()
+
+    if self.__viewport != (width, height):
+      self.__driver.execute_cdp_cmd('Emulation.setDeviceMetricsOverride', {
+        'width': width,
+        'height': height,
+        'deviceScaleFactor': 1,
+        'mobile': False,
+      })
+      self.__viewport = (width, height)
+
+    self.__driver.execute_script(RENDER_SCRIPT, html, css)
+    return self.__driver.get_screenshot_as_png()
+
+
+
+class RenderPool:
+  """
+    A pool of warm headless browsers consuming (html, css) jobs from a queue. Each browser
+    is served by its own green thread; a browser exceeding the timeout is killed, its job
+    fails with a RenderTimeout and a fresh browser is started for the next job.
+
+    The WebDriver calls block on their sockets, so they run in the native threads of
+    tpool: the hub keeps serving while a browser renders, and the timeout interrupts the
+    wait even when the socket module is not monkey patched.
+  """
+  def __init__(self):
+    self.__jobs = LightQueue()
+    self.__workers: List[RenderWorker] = []
+    self.__threads = []
+    self.__lock = Semaphore()
+    self.__size = 0
+    self.__timeout = 0
+    self.__chromium_path = None
+    self.__chromedriver_path = None
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the RenderPool with the configurations of the Flask app.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    self.__size = app.config.get('RENDER_WORKERS', 4)
+    self.__timeout = app.config.get('RENDER_TIMEOUT', 10)
+    self.__chromium_path = app.config.get('CHROMIUM_PATH', '/usr/bin/chromium')
+    self.__chromedriver_path = app.config.get('CHROMEDRIVER_PATH', '/usr/bin/chromedriver')
+
+
+  def start(self) -> None:
+    """
+      Starts the browsers of the pool, if they are not already running.
+    """
+    with self.__lock:
+      if self.__threads:
+        return
+
+      for _ in range(self.__size):
+        worker = RenderWorker(self.__chromium_path, self.__chromedriver_path)
+        self.__workers.append(worker)
+        self.__threads.append(eventlet.spawn(self.__serve, worker))
+
+
+  def stop(self) -> None:
+    """
+      Stops the browsers of the pool.
+    """
+    with self.__lock:
+      for thread in self.__threads:
+        thread.kill()
+      for worker in self.__workers:
+        worker.stop()
+      self.__threads.clear()
+      self.__workers.clear()
+
+
+  def submit(self, html: str, css: str, width: int, height: int) -> Event:
+    """
+      Queues a render job, starting the pool on first use.
+
+      Args:
+        html (str): The cleaned HTML code.
+        css (str): The cleaned CSS code.
+        width (int): The width of the viewport.
+        height (int): The height of the viewport.
+
+      Returns:
+        Event: The event receiving the PNG screenshot, or the exception of the job.
+    """
+    self.start()
+    event = Event()
+    self.__jobs.put((html, css, width, height, event))
+    return event
+
+
+  def render(self, html: str, css: str, width: int, height: int) -> bytes:
+    """
+      Renders a submission and waits for its screenshot.
+
+      Args:
+        html (str): The cleaned HTML code.
+        css (str): The cleaned CSS code.
+        width (int): The width of the viewport.
+        height (int): The height of the viewport.
+
+      Returns:
+        bytes: The screenshot as a PNG image.
+    """
+    return self.submit(html, css, width, height).wait()
+
+
+  def render_array(self, html: str, css: str, width: int, height: int) -> np.ndarray:
+    """
+      Renders a submission and decodes its screenshot.
+
+      Args:
+        html (str): The cleaned HTML code.
+        css (str): The cleaned CSS code.
+        width (int): The width of the viewport.
+        height (int): The height of the viewport.
+
+      Returns:
+        np.ndarray: The screenshot as an (H, W, 3) RGB array.
+    """
+    return decode_image(self.render(html, css, width, height))
+
+
+  def render_many(self, jobs: Dict[Any, Tuple[str, str]], width: int, height: int) -> Dict[Any, Union[bytes, None]]:
+    """
+      Renders a batch of submissions over every browser of the pool.
+
+      Args:
+        jobs (Dict[Any, Tuple[str, str]]): The cleaned (html, css) code, keyed by an identifier.
+        width (int): The width of the viewport.
+        height (int): The height of the viewport.
+
+      Returns:
+        Dict[Any, Union[bytes, None]]: The PNG screenshots, None for the jobs that failed.
+    """
+    events = {key: self.submit(html, css, width, height) for key, (html, css) in jobs.items()}
+
+    renders = {}
+    for key, event in events.items():
+      try:
+        renders[key] = event.wait()
+      except Exception as e:
+        app.logger.warning(f'Unable to render {key}: {e!r}')
+        renders[key] = None
+    return renders
+
+
+  def __serve(self, worker: RenderWorker) -> None:
+    """
+      Main loop of a browser, rendering the queued jobs one at a time.
+
+      Args:
+        worker (RenderWorker): The browser consuming the jobs.
+    """
+    while True:
+      html, css, width, height, event = self.__jobs.get()
+      try:
+        with eventlet.Timeout(self.__timeout):
+          event.send(tpool.execute(worker.render, html, css, width, height))
+      except eventlet.Timeout:
+        worker.stop()
+        event.send_exception(RenderTimeout(f'render exceeded {self.__timeout}s'))
+      except Exception as e:
+        worker.stop()
+        event.send_exception(e)
+
+
+
+render_pool = RenderPool()
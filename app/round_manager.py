@@ -3,19 +3,32 @@
 # Author:       Capucinoxx
 # Date:         2024
 
-import time
-from datetime import datetime, timezone, timedelta
-from typing import List, Union, Tuple
+import json
+from typing import Any, List, Union, Tuple
 
 import eventlet
 from flask import Flask, current_app
 from flask_socketio import SocketIO
 
+from app.backend import backend, election
+from app.images import challenge_images
+from app.journal import journal
+from app.live_scoring import live_scorer
 from app.models import Challenge, Submission, Team, User, SubmissionType, persist_sumbissions
-from app.utils import CDict, logger
+from app.scheduler import Scheduler
+from app.scoring import evaluate_round
+from app.store import Generation, submission_store
+from app.utils import logger
 from app.cmd.app import app
 
 
+# The state of the rounds is written by the elected worker to this key, and broadcasted
+# on the channel of the same name; the other workers forward the admin actions on the
+# control channel.
+STATE_KEY = 'round:state'
+CONTROL_CHANNEL = 'round:control'
+
+
 class RoundManager:
   """
     Manages the rounds of art-forgery, handling the start, end, and the progression
@@ -26,14 +39,18 @@ class RoundManager:
     self.__round_duration = 0
     self.__current_round = None
     self.__current_round_start = None
+    self.__current_round_end = None
+    self.__in_round = False
+    self.__paused_remaining = None
     self.__is_running = False
+    self.__scheduler = Scheduler()
+    self.__timer = None
     self.__app_context = None
     self.__current_challenge = None
-    self.__submissions = CDict()
     self.__lock = eventlet.semaphore.Semaphore()
 
 
-  def init_app(self, app: Flask, socketio: SocketIO) -> None:
+  def init_app(self, app: Flask, socketio: SocketIO, clock: Any = None) -> None:
     """
       Initializes the RoundManager with the Flask app and SocketIO instance, setting up context 
       and configurations.
@@ -41,7 +58,10 @@ class RoundManager:
       Args:
         app (Flask): The Flask app instance.
         socketio (SocketIO): The SocketIO instance.
+        clock (Any): The clock of the rounds, a `MonotonicClock` by default; a `VirtualClock`
+                     simulates the rounds without waiting.
     """
+    self.__scheduler = Scheduler(clock)
     self.__app_context = app.app_context()
     self.__app_context.push()
     self.__socket = socketio
@@ -50,17 +70,132 @@ class RoundManager:
     self.__break_duration = app.config.get('BREAK_DURATION', 5 * 60)
     self.__rounds: List[Challenge] = list(Challenge.objects.order_by('_id'))
 
+    backend.subscribe(STATE_KEY, self.__receive_state)
+    backend.subscribe(CONTROL_CHANNEL, self.__receive_control)
+    election.start(self.__lead, self.__follow)
+
 
   def start(self) -> None:
     """
       Starts the round management process.
     """
+    if not election.is_leader:
+      self.__forward('start')
+      return
+
     with self.__lock:
       if self.__is_running:
         return
 
       self.__is_running = True
-    eventlet.spawn(self.__run)
+      self.__scheduler.start()
+      self.__schedule(self.__scheduler.now(), self.__start_round)
+    self.__share()
+
+
+  def stop(self) -> None:
+    """
+      Stops the round management process of this worker, cancelling the next transition.
+    """
+    with self.__lock:
+      self.__is_running = False
+      self.__timer = None
+    self.__scheduler.stop()
+
+
+  def pause(self) -> bool:
+    """
+      Pauses the clock of the current round.
+
+      Returns:
+        bool: True if the round was paused (or the action forwarded to the leader), otherwise False.
+    """
+    if not election.is_leader:
+      return self.__forward('pause')
+
+    with self.__lock:
+      if not self.__in_round or self.__paused_remaining is not None:
+        return False
+
+      self.__paused_remaining = max(0, self.__current_round_end - self.__scheduler.now())
+      self.__cancel()
+
+    self.__share()
+    self.__socket.emit('round_time', { 'end': None, 'paused': True })
+    return True
+
+
+  def resume(self) -> bool:
+    """
+      Resumes the clock of the paused round, with the time it had left.
+
+      Returns:
+        bool: True if the round was resumed (or the action forwarded to the leader), otherwise False.
+    """
+    if not election.is_leader:
+      return self.__forward('resume')
+
+    with self.__lock:
+      if self.__paused_remaining is None:
+        return False
+
+      self.__current_round_end = self.__scheduler.now() + self.__paused_remaining
+      self.__paused_remaining = None
+      self.__schedule(self.__current_round_end, self.__end_round)
+      end = self.round_end_time()
+
+    self.__share()
+    self.__socket.emit('round_time', { 'end': end, 'paused': False })
+    return True
+
+
+  def extend(self, seconds: float) -> bool:
+    """
+      Extends the current round.
+
+      Args:
+        seconds (float): The time added to the round, negative to shorten it.
+
+      Returns:
+        bool: True if the round was extended (or the action forwarded to the leader), otherwise False.
+    """
+    if not election.is_leader:
+      return self.__forward('extend', seconds)
+
+    with self.__lock:
+      if not self.__in_round:
+        return False
+
+      paused = self.__paused_remaining is not None
+      if paused:
+        self.__paused_remaining = max(0, self.__paused_remaining + seconds)
+      else:
+        self.__current_round_end += seconds
+        self.__schedule(self.__current_round_end, self.__end_round)
+      end = self.round_end_time()
+
+    self.__share()
+    if not paused:
+      self.__socket.emit('round_time', { 'end': end, 'paused': False })
+    return True
+
+  def skip(self) -> bool:
+    """
+      Ends the current round, or the current break, right away.
+
+      Returns:
+        bool: True if a transition was triggered (or the action forwarded to the leader), otherwise False.
+    """
+    if not election.is_leader:
+      return self.__forward('skip')
+
+    with self.__lock:
+      if not self.__is_running or self.__timer is None and self.__paused_remaining is None:
+        return False
+
+      self.__paused_remaining = None
+      self.__schedule(self.__scheduler.now(), self.__end_round if self.__in_round else self.__start_round)
+    return True
 
 
   def current_round_is_active(self) -> bool:
@@ -71,7 +206,9 @@ class RoundManager:
         bool: True if the current round is active, otherwise False.
     """
     with self.__lock:
-      return self.__current_round != None and time.time() < self.__current_round_start + self.__round_duration
+      if self.__current_round == None or not self.__in_round:
+        return False
+      return self.__paused_remaining is not None or self.__scheduler.now() < self.__current_round_end
 
 
   def retrieve_role(self, id: int) -> SubmissionType:
@@ -103,9 +240,26 @@ class RoundManager:
       return self.__current_round, self.__rounds[self.__current_round]
 
 
+  def is_revealed(self, challenge_id: int) -> bool:
+    """
+      Checks if a challenge is the challenge of the current round or of a previous round.
+
+      Args:
+        challenge_id (int): The ID of the challenge.
+
+      Returns:
+        bool: True if the challenge was revealed to the teams, otherwise False.
+    """
+    with self.__lock:
+      if self.__current_round == None:
+        return False
+      return any(challenge._id == challenge_id for challenge in self.__rounds[:self.__current_round + 1])
+
+
   def handle_submission(self, user: User, content: str) -> Union[SubmissionType, None]:
     """
-      Processes a submission from a user, updating the internal submissions store.
+      Processes a submission from a user, updating the internal submissions store and
+      queuing the code of the team for live scoring.
 
       Args:
         user (User): The user submitting the content.
@@ -118,30 +272,36 @@ class RoundManager:
     if not self.current_round_is_active() or user.team is None:
       return None
 
-    if not self.__submissions.contains(user.team.id):
-      self.__submissions.set(user.team.id, {})
-
     with self.__lock:
-      role = self.retrieve_role(user.retrieve_number())
-      logger.submission(self.__current_round, user.team.id, role.value, content)
+      round_number, challenge = self.__current_round, self.__rounds[self.__current_round]
+    role = self.retrieve_role(user.retrieve_number())
+
+    # Only the shard of the team is locked; the record is None if the round ended meanwhile
+    record = submission_store.put(round_number, user.team.id, role, content)
+    if record is None:
+      return None
 
-    self.__submissions.update_dict_value(user.team.id, role, content)
+    logger.submission(round_number, user.team.id, role.value, content)
+    journal.record(round_number, user.team.id, role.value, content)
+
+    live_scorer.submit(user.team.id, round_number, challenge, record.html, record.css)
     return role
 
 
-  def round_end_time(self) -> Union[datetime, None]:
+  def round_end_time(self) -> Union[int, None]:
     """
       Calculates the end time of the current round.
 
       Returns:
-        Union[datetime, None]: The end time of the current round, or None if no round is active.
+        Union[int, None]: The end time of the current round as a UNIX timestamp, or None if no
+                          round is active or the round is paused.
     """
-    if self.__current_round == None:
+    if self.__current_round == None or self.__paused_remaining is not None:
       return None
-    return int(datetime.fromtimestamp(self.__current_round_start + self.__round_duration, timezone.utc).timestamp())
+    return int(self.__current_round_end)
 
 
-  def get_submission(user: User) -> Tuple[str, str]:
+  def get_submission(self, user: User) -> Tuple[str, str]:
     """
       Retrieves the submission for a given user.
 
@@ -151,88 +311,255 @@ class RoundManager:
       Returns:
         Tuple[str, str]: The CSS and HTML submissions for the user.
     """
-    if user.team is None:
+    if user.team is None or self.__current_round is None:
       return '', ''
-    return self.__get_submission(user.team.id)
+    record = submission_store.get(self.__current_round, user.team.id)
+    return record.html, record.css
+
+
+  def __next(self) -> Union[int, None]:
+    """
+      Advances to the next round, updating the round index and start time.
+
+      Returns:
+        Union[int, None]: The index of the next round, or None if there are no more rounds.
+    """
+    with self.__lock:
+      if self.__current_round is not None and self.__current_round >= len(self.__rounds) - 1:
+        return None
+
+      self.__current_round = 0 if self.__current_round == None else self.__current_round + 1
+      self.__current_round_start = self.__scheduler.now()
+      self.__current_round_end = self.__current_round_start + self.__round_duration
+      self.__in_round = True
+      self.__paused_remaining = None
+      self.__schedule(self.__current_round_end, self.__end_round)
+      submission_store.begin(self.__current_round)
+
+      return self.__rounds[self.__current_round]
+
+
+  def __restore(self) -> None:
+    """
+      Replays the submission journal, restoring the round that was running before the
+      server stopped along with the submissions of its teams, and resumes the rounds.
+    """
+    state = journal.replay()
+    pending = state.pending_round()
+    if pending is None or pending[0] >= len(self.__rounds):
+      return
+
+    round_number, start = pending
+    submission_store.begin(round_number)
+    for team_id, roles in state.submissions.get(round_number, {}).items():
+      for role, content in roles.items():
+        submission_store.put(round_number, team_id, SubmissionType(role), content)
 
+    with self.__lock:
+      self.__current_round, self.__current_round_start = round_number, start
+      self.__current_round_end = start + self.__round_duration
+      self.__in_round = True
+      self.__is_running = True
+      self.__scheduler.start()
+      self.__schedule(self.__current_round_end, self.__end_round)
 
-  def __get_submission(self, team_id: int) -> Tuple[str, str]:
+    self.__share()
+    app.logger.warning(f'Restored round {round_number} with the submissions of {len(state.submissions.get(round_number, {}))} teams')
+
+
+  def __close_round(self, round_number: int, challenge: Challenge, generation: Generation) -> None:
     """
-      Internal method to fetch submissions for a specific team.
+      Persists the submissions of a finished round, then renders and scores them.
 
       Args:
-        team_id (int): The ID of the team for which to retrieve submissions.
+        round_number (int): The number of the finished round.
+        challenge (Challenge): The challenge of the finished round.
+        generation (Generation): The submissions of the finished round.
+    """
+    data = generation.collect()
+    try:
+      persist_sumbissions(round_number, data)
+    except Exception as e:
+      # The round stays open in the journal, so a restart persists it again
+      app.logger.error(f'Unable to persist round {round_number}: {e!r}')
+      return
+    journal.close_round(round_number)
+
+    try:
+      evaluate_round(round_number, challenge, data)
+    except Exception as e:
+      app.logger.error(f'Unable to score round {round_number}: {e!r}')
+
+
+  def __lead(self) -> None:
+    """
+      Takes over the rounds once this worker is elected: the transitions are scheduled from
+      the state shared by the previous leader, or from the journal on the first start.
+    """
+    state = backend.get(STATE_KEY)
+    if state is None:
+      self.__restore()
+      return
 
-      Returns:
-        Tuple[str, str]: The CSS and HTML submissions for the team.
+    state = self.__apply_state(json.loads(state))
+    with self.__lock:
+      if not self.__is_running:
+        return
+
+      if self.__in_round:
+        submission_store.begin(self.__current_round)
+
+      self.__scheduler.start()
+      if state['deadline'] is not None and self.__paused_remaining is None:
+        self.__schedule(state['deadline'], self.__end_round if self.__in_round else self.__start_round)
+
+    app.logger.warning(f'Took over the rounds at round {self.__current_round}')
+
+
+  def __follow(self) -> None:
     """
-    html = self.__submissions.get(team_id, {}).get(SubmissionType.HTML, '')
-    css = self.__submissions.get(team_id, {}).get(SubmissionType.CSS, '')
-    return html, css
+      Stops driving the rounds once this worker lost the election.
+    """
+    with self.__lock:
+      self.__cancel()
+    self.__scheduler.stop()
 
 
-  def __next(self) -> Union[int, None]:
+  def __share(self) -> None:
     """
-      Advances to the next round, updating the round index and start time.
+      Writes the state of the rounds to the backend and broadcasts it to the other workers.
+    """
+    with self.__lock:
+      state = json.dumps({
+        'round': self.__current_round,
+        'start': self.__current_round_start,
+        'end': self.__current_round_end,
+        'in_round': self.__in_round,
+        'paused': self.__paused_remaining,
+        'running': self.__is_running,
+        'deadline': self.__timer.deadline if self.__timer is not None else None,
+      })
+
+    backend.set(STATE_KEY, state)
+    backend.publish(STATE_KEY, state)
+
+
+  def __apply_state(self, state: dict) -> dict:
+    """
+      Adopts the state of the rounds shared by the leader.
+
+      Args:
+        state (dict): The state written by `__share`.
 
       Returns:
-        Union[int, None]: The index of the next round, or None if there are no more rounds.
+        dict: The state.
     """
     with self.__lock:
-      if self.__current_round is not None and self.__current_round >= len(self.__rounds) - 1:
-        return None
+      ended = self.__in_round and not state['in_round']
+      self.__current_round = state['round']
+      self.__current_round_start = state['start']
+      self.__current_round_end = state['end']
+      self.__in_round = state['in_round']
+      self.__paused_remaining = state['paused']
+      self.__is_running = state['running']
+
+    if ended:
+      live_scorer.reset()
+    return state
+
+
+  def __receive_state(self, message: str) -> None:
+    if not election.is_leader:
+      self.__apply_state(json.loads(message))
+
+
+  def __forward(self, action: str, *args: Any) -> bool:
+    """
+      Forwards an admin action to the leader.
+
+      Returns:
+        bool: Always True, the action being applied asynchronously.
+    """
+    backend.publish(CONTROL_CHANNEL, json.dumps({'action': action, 'args': args}))
+    return True
 
-      if self.__current_round == None:
-        self.__current_round = 0
-        self.__current_round_start = time.time()
-      else:
-        self.__current_round_start = self.round_end_time() + self.__break_duration
-        self.__current_round += 1
-      
-      return self.__rounds[self.__current_round]
 
+  def __receive_control(self, message: str) -> None:
+    if not election.is_leader:
+      return
 
-  def __run(self) -> None:
+    message = json.loads(message)
+    actions = {'start': self.start, 'pause': self.pause, 'resume': self.resume, 'extend': self.extend, 'skip': self.skip}
+    if message['action'] in actions:
+      actions[message['action']](*message['args'])
+
+
+  def __schedule(self, deadline: float, transition) -> None:
+    """
+      Schedules the next transition, replacing the pending one. Must be called with the
+      lock held.
     """
-      The main loop for managing rounds, responsible for transitioning between rounds and 
-      handling end-of-round events.
+    self.__cancel()
+    self.__timer = self.__scheduler.call_at(deadline, transition)
 
-      When a round ends, the submissions are persisted to the database and the next round
-      is started.
 
-      At the start of each round, the challenge is broadcasted to all connected clients.
-      After the round ends, the end time is broadcasted to all connected clients.
+  def __cancel(self) -> None:
     """
-    while self.__is_running:
-      if self.current_round_is_active():
-        eventlet.sleep(1)
-        continue
+      Cancels the pending transition. Must be called with the lock held.
+    """
+    if self.__timer is not None:
+      self.__timer.cancel()
+      self.__timer = None
+
+
+  def __start_round(self) -> None:
+    """
+      Starts the next round and broadcasts its challenge to all connected clients, or
+      stops when there are no more rounds.
+    """
+    with self.__lock:
+      self.__timer = None
+      first = self.__current_round is None
 
-      with self.__lock:
-        end_time = self.round_end_time()
-      self.__socket.emit('round_end', { 'end': end_time + self.__break_duration if end_time else None })
+    # Sent before the first round so the clients switch to the roles of the first round
+    if first:
+      self.__socket.emit('round_end', { 'end': None })
 
+    next_round = self.__next()
+    self.__share()
+    if next_round is None:
+      return
+
+    with self.__lock:
+      round_number, start, end = self.__current_round, self.__current_round_start, self.round_end_time()
+    journal.start_round(round_number, start)
+
+    self.__socket.emit('round_start', { 'round': challenge_images.describe(next_round), 'end': end })
+
+
+  def __end_round(self) -> None:
+    """
+      Ends the current round: the submissions are persisted and scored in the background,
+      the end of the break is broadcasted to all connected clients and the next round is
+      scheduled after the break.
+    """
+    with self.__lock:
+      self.__timer = None
+      if not self.__in_round:
+        return
 
-      need_sleep = False
-      with self.__lock:
-        if self.__current_round is not None:
-          copy = self.__submissions.copy()
-          eventlet.spawn(persist_sumbissions, self.__current_round, copy)
-          self.__submissions.clear()
-          need_sleep = True
-      
-      if need_sleep:
-        eventlet.sleep(self.__break_duration)
+      self.__in_round = False
+      self.__paused_remaining = None
+      round_number, challenge = self.__current_round, self.__rounds[self.__current_round]
+      generation = submission_store.end(round_number)
 
-      next_round = self.__next()
-      if next_round is None:
-        break
+      break_end = self.__scheduler.now() + self.__break_duration
+      self.__schedule(break_end, self.__start_round)
 
-      current = self.current()
-      if current is not None:
-        _, challenge = current
-        challenge = challenge.to_dict()
-        self.__socket.emit('round_start', { 'round': challenge, 'end': self.round_end_time() })
+    self.__share()
+    live_scorer.reset()
+    eventlet.spawn(self.__close_round, round_number, challenge, generation)
+    self.__socket.emit('round_end', { 'end': int(break_end) })
 
 
 
@@ -7,15 +7,29 @@ import random
 from functools import wraps
 from typing import List, Callable, Any
 
-from flask import jsonify, redirect, request, render_template, url_for
+from flask import Response, jsonify, redirect, request, render_template, url_for
 from flask_login import LoginManager, login_required, login_user, logout_user, current_user
 from flask_socketio import SocketIO, emit, join_room, leave_room
 
+from app.admin import list_challenges, list_submissions, list_users
+from app.backend import election
+from app.diagnostics import diagnostics
+from app.cache import render_cache, score_cache
 from app.cmd.app import app
 from app.database import db
+from app.delta import Patch, documents
+from app.identity import Identity, identity_cache
+from app.images import challenge_images
+from app.journal import journal
+from app.leaks import leak_broadcaster
+from app.live_scoring import live_scorer
+from app.metrics import metrics
+from app.ratelimit import sync_limiter
 from app.models import User, Challenge, SubmissionType, Submission
 from app.round_manager import round_manager
-from app.utils import cleanup_html, cleanup_css
+from app.store import submission_store
+from app.utils import cleanup_html, cleanup_css, logger
+from app.workers import sanitizer_pool
 
 
 # Initialize the login manager and associate it with the app
@@ -25,19 +39,32 @@ login_manager.login_view = 'login'
 
 socketio = SocketIO(async_mode='eventlet')
 
+# The counters of the components, exposed with the metrics
+metrics.register('renders', render_cache.stats)
+metrics.register('scores', score_cache.stats)
+metrics.register('sanitizer', sanitizer_pool.stats)
+metrics.register('leaks', leak_broadcaster.stats)
+metrics.register('logger', logger.stats)
+metrics.register('journal', journal.stats)
+metrics.register('identities', identity_cache.stats)
+metrics.register('submissions', submission_store.stats)
+metrics.register('election', election.stats)
+metrics.register('diagnostics', diagnostics.stats)
+metrics.register('syncs', sync_limiter.stats)
+
 
 @login_manager.user_loader
-def load_user(user_id: int) -> User:
+def load_user(user_id: str) -> Identity:
   """
-    Callback function used by Flask-Login to load a user from the database.
+    Callback function used by Flask-Login to load a user, from the identity cache.
     
     Args:
-      user_id (int): The ID of the user to load.
+      user_id (str): The ID of the user to load.
     
     Returns:
-      User: The user object if found, otherwise None.
+      Identity: The identity of the user if found, otherwise None.
   """
-  return User.objects(pk=user_id).first()
+  return identity_cache.get(user_id)
 
 
 
@@ -135,15 +162,22 @@ def index() -> Any:
       Any: The rendered template for the index page.
     """
   if current_user.is_admin:
-    return render_template('admin.html',  users=User.objects().all(), 
-                                          challenges=[c.to_dict() for c in Challenge.objects().all()],
+    submissions, next_cursor = list_submissions(request.args.get('cursor'),
+                                                request.args.get('round', type=int),
+                                                app.config.get('ADMIN_PAGE_SIZE', 50))
+    return render_template('admin.html',  users=list_users(),
+                                          challenges=list_challenges(),
                                           time_left=round_manager.round_end_time(),
                                           current_round=round_manager.current(),
-                                          submissions=[s.to_dict() for s in Submission.objects().all()])
+                                          submissions=submissions,
+                                          next_cursor=next_cursor)
 
+  current_round = round_manager.current() if round_manager.current_round_is_active() else None
   return render_template('index.html',  time_left=round_manager.round_end_time(), 
-                                        current_round=round_manager.current() if round_manager.current_round_is_active() else None,
-                                        role=round_manager.retrieve_role(current_user.retrieve_number()).value)
+                                        current_round=current_round,
+                                        current_image=challenge_images.describe(current_round[1])['image'] if current_round else None,
+                                        role=round_manager.retrieve_role(current_user.retrieve_number()).value,
+                                        delta_sync=app.config.get('DELTA_SYNC', False))
 
 
 
@@ -161,20 +195,219 @@ def start() -> Any:
 
 
 
+@app.route('/admin/pause')
+@admin_required
+def pause() -> Any:
+  """
+    Admin route to pause the clock of the current round.
+
+    Returns:
+      Any: JSON response indicating whether the round was paused.
+  """
+  return jsonify({'success': round_manager.pause()}), 200
+
+
+
+@app.route('/admin/resume')
+@admin_required
+def resume() -> Any:
+  """
+    Admin route to resume the clock of the paused round.
+
+    Returns:
+      Any: JSON response indicating whether the round was resumed.
+  """
+  return jsonify({'success': round_manager.resume()}), 200
+
+
+
+@app.route('/admin/extend')
+@admin_required
+def extend() -> Any:
+  """
+    Admin route to extend the current round by `seconds` (60 by default).
+
+    Returns:
+      Any: JSON response indicating whether the round was extended.
+  """
+  seconds = request.args.get('seconds', 60, type=int)
+  return jsonify({'success': round_manager.extend(seconds)}), 200
+
+
+
+@app.route('/admin/skip')
+@admin_required
+def skip() -> Any:
+  """
+    Admin route to end the current round, or the current break, right away.
+
+    Returns:
+      Any: JSON response indicating whether a transition was triggered.
+  """
+  return jsonify({'success': round_manager.skip()}), 200
+
+
+
+@app.route('/admin/cache')
+@admin_required
+def cache_stats() -> Any:
+  """
+    Admin route exposing the counters of the render and score caches.
+
+    Returns:
+      Any: JSON response with the hits, misses and evictions of each cache.
+  """
+  return jsonify({'renders': render_cache.stats(), 'scores': score_cache.stats()}), 200
+
+
+
+@app.route('/admin/throttling')
+@admin_required
+def throttling_stats() -> Any:
+  """
+    Admin route exposing the counters of the sync rate limiter, and the syncs delayed or
+    coalesced of each user throttled in the last window.
+
+    Returns:
+      Any: JSON response with the counters and the throttled users, the most throttled first.
+  """
+  throttled = sync_limiter.throttled_users()
+  usernames = {user.id: user.username for user in User.objects(id__in=list(throttled)).only('username')}
+  users = [{'user': usernames.get(user_id, str(user_id)), 'throttled': count}
+           for user_id, count in sorted(throttled.items(), key=lambda item: item[1], reverse=True)]
+  return jsonify({'stats': sync_limiter.stats(), 'users': users}), 200
+
+
+
+@app.route('/admin/metrics')
+@admin_required
+def metrics_export() -> Any:
+  """
+    Admin route exposing the metrics of the server in the Prometheus text format.
+
+    Returns:
+      Any: The metrics.
+  """
+  return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+
+@app.route('/admin/diagnostics')
+@admin_required
+def diagnostics_report() -> Any:
+  """
+    Admin route exposing the code found blocking the eventlet hub, when the diagnostics
+    are enabled.
+
+    Returns:
+      Any: JSON response with the counters and the offenders, the longest blocking first.
+  """
+  return jsonify({'stats': diagnostics.stats(), 'offenders': diagnostics.offenders()}), 200
+
+
+
+@app.route('/admin/diagnostics/profile/start')
+@admin_required
+def start_profile() -> Any:
+  """
+    Admin route starting the sampling profiler of the hub for `seconds` (30 by default).
+
+    Returns:
+      Any: JSON response indicating whether the profiler was started.
+  """
+  seconds = request.args.get('seconds', 30, type=float)
+  return jsonify({'success': diagnostics.start_profile(seconds)}), 200
+
+
+
+@app.route('/admin/diagnostics/profile')
+@admin_required
+def download_profile() -> Any:
+  """
+    Admin route downloading the last profile of the hub, in the collapsed stack format
+    of the flamegraph tools.
+
+    Returns:
+      Any: The profile.
+  """
+  return Response(diagnostics.profile(), mimetype='text/plain',
+                  headers={'Content-Disposition': 'attachment; filename=hub.folded'})
+
+
+
+@app.route('/admin/submissions/<submission_id>/preview')
+@admin_required
+def submission_preview(submission_id: str) -> Any:
+  """
+    Admin route rendering the cleaned code of a submission, read from the blob store.
+
+    Args:
+      submission_id (str): The ID of the submission.
+
+    Returns:
+      Any: The rendered preview, or a 404 JSON response if the submission does not exist.
+  """
+  submission = Submission.objects(id=submission_id).first()
+  if submission is None:
+    return jsonify({'error': 'Not found'}), 404
+
+  html, css = submission.code()
+  return render_template('preview.html', html=cleanup_html(html), css=cleanup_css(css))
+
+
+
+@app.route('/challenges/<int:challenge_id>/image')
+@login_required
+def challenge_image(challenge_id: int) -> Any:
+  """
+    Serves the image of a challenge once its round started. The URL of the image is
+    versioned by its content hash, so the response is cached by the browser for good
+    and revalidated with its strong ETag.
+
+    Args:
+      challenge_id (int): The ID of the challenge.
+
+    Returns:
+      Any: The PNG image, or a 404 JSON response if the challenge is not revealed.
+  """
+  if not current_user.is_admin and not round_manager.is_revealed(challenge_id):
+    return jsonify({'error': 'Not found'}), 404
+
+  image = challenge_images.get(challenge_id)
+  if image is None:
+    return jsonify({'error': 'Not found'}), 404
+
+  response = Response(image.data, mimetype='image/png')
+  response.set_etag(image.digest)
+  response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+  return response.make_conditional(request)
+
+
+
 @socketio.on('connect')
+@metrics.instrument('connect')
 @login_required
 def connect() -> None:
   """
     Handles a client's connection event. When a user connects, they are added to a room
-    based on their team ID, allowing for targeted broadcasting.
+    based on their team ID, allowing for targeted broadcasting. Admins join the admin room
+    and receive the live leaderboard.
 
     Requires the user to be authenticated.
   """
+  if current_user.is_admin:
+    join_room('admin')
+    metrics.joined('admin')
+    emit('leaderboard', live_scorer.leaderboard())
+    return
+
   join_room(str(current_user.team.id))
+  metrics.joined(str(current_user.team.id))
 
 
 
 @socketio.on('disconnect')
+@metrics.instrument('disconnect')
 @login_required
 def disconnect() -> None:
   """
@@ -183,10 +416,94 @@ def disconnect() -> None:
 
     Requires the user to be authenticated.
   """
+  if current_user.is_admin:
+    leave_room('admin')
+    metrics.left('admin')
+    return
+
   leave_room(str(current_user.team.id))
+  metrics.left(str(current_user.team.id))
+
+
+def roll_leak(round_number: int, team_id: Any, role: SubmissionType) -> None:
+  """
+    Randomly leaks a received sync to simulate an unexpected data leak broadcast. The leak
+    is sent with the next broadcast of the document, so the syncs coalesced by the rate
+    limiter keep their chance to leak.
+
+    Args:
+      round_number (int): The current round number.
+      team_id (Any): The team of the document.
+      role (SubmissionType): The role of the document.
+  """
+  if random.randint(0, 100) < 10:
+    documents.leak(round_number, (team_id, role.value))
+
+
+
+def publish_code(round_number: int, user: User, role: SubmissionType, version: int, code: str) -> None:
+  """
+    Queues the code of a document to be cleaned off the eventlet hub, then broadcasts it to
+    the team room, as a patch of the previously broadcast code when the delta sync is enabled.
+
+    Args:
+      round_number (int): The current round number.
+      user (User): The user who synced the document.
+      role (SubmissionType): The role of the document.
+      version (int): The version of the document.
+      code (str): The raw code of the document.
+  """
+  team_id = user.team.id
+  key = (team_id, role.value)
+
+  def publish(code: str) -> None:
+    published = documents.publish(round_number, key, version, code)
+    if published is None:
+      return
+
+    base, patch = published
+    if app.config.get('DELTA_SYNC', False):
+      socketio.emit('update_delta', {'role': role.value, 'base': base, 'version': version, **patch.to_dict()}, room=str(team_id))
+    else:
+      socketio.emit('update', {'role': role.value, 'code': code, 'version': version}, room=str(team_id))
+
+    # The leaks are sent to every client in periodic batches
+    if documents.take_leak(round_number, key):
+      leak_broadcaster.queue(code)
+
+  if not sanitizer_pool.submit(user.id, role, code, publish):
+    app.logger.warning(f'Sanitizer queue full, dropping the sync of {user.id}')
+
+
+
+def process_sync(user: User, sid: str, round_number: int, role: SubmissionType, version: int, code: str) -> None:
+  """
+    Processes a sync admitted by the rate limiter: records the submission, acknowledges its
+    version to the client and publishes the code to the team. A throttled sync is processed
+    later, outside of the Socket.IO event, and is ignored if its round is over by then.
+
+    Args:
+      user (User): The user who synced the document.
+      sid (str): The Socket.IO session of the client.
+      round_number (int): The round of the sync.
+      role (SubmissionType): The role of the document.
+      version (int): The version of the document.
+      code (str): The raw code of the document.
+  """
+  current = round_manager.current()
+  if current is None or current[0] != round_number:
+    return
+
+  if round_manager.handle_submission(user, code) is None:
+    return
+
+  socketio.emit('sync_ack', {'role': role.value, 'version': version}, room=sid)
+  publish_code(round_number, user, role, version, code)
+
 
 
 @socketio.on('sync')
+@metrics.instrument('sync')
 @login_required
 def handle_message(code: str) -> None:
   """
@@ -196,27 +513,81 @@ def handle_message(code: str) -> None:
     Args:
       code (str): The code snippet or content that needs to be synchronized.
 
-    This function checks if the current round is active, processes the code based on the user's
-    submission type (HTML or CSS), cleans it if necessary, and then emits an 'update' event
-    to the user's team room with the processed code.
+    This function checks if the current round is active and replaces the document of the user's
+    submission type (HTML or CSS). Within the sync rate of the user, the submission is then
+    recorded, its new version acknowledged to the user, and the code queued to be cleaned and
+    emitted to the user's team room; over it, only the latest sync is processed once allowed.
 
-    Additionally, there's a random chance to trigger a 'leak' event, broadcasting the code
-    to all connected clients.
+    Additionally, there's a random chance to leak the code, broadcasting the next code published
+    for the document to all connected clients in the next 'leak_batch' event.
   """
-  if round_manager.current_round_is_active():
-    if code is None:
-      code = ''
+  current = round_manager.current()
+  if current is None or not round_manager.current_round_is_active() or current_user.team is None:
+    return
+
+  if not isinstance(code, str):
+    code = ''
+
+  round_number, _ = current
+  user = current_user._get_current_object()
+  role = round_manager.retrieve_role(user.retrieve_number())
+  version = documents.replace(round_number, (user.team.id, role.value), code)
+  roll_leak(round_number, user.team.id, role)
+  sync_limiter.submit(user.id, process_sync, user, request.sid, round_number, role, version, code)
+
 
-    role = round_manager.handle_submission(current_user, code)
 
-    if role == SubmissionType.HTML:
-      code = cleanup_html(code)
-    elif role == SubmissionType.CSS:
-      code = cleanup_css(code)
+@socketio.on('sync_delta')
+@metrics.instrument('sync_delta')
+@login_required
+def handle_delta(data: dict) -> None:
+  """
+    Handles the 'sync_delta' event from the client, a patch of the document of the user
+    against the version it last had acknowledged.
 
-    if role is not None:
-      emit('update', {'role': role.value, 'code': code}, room=str(current_user.team.id))
+    Args:
+      data (dict): The version, and the start, end and text of the patch.
+
+    If the versions diverged, a 'resync' event asks the client to send its whole document
+    with a 'sync' event. Otherwise the patched document is processed like a full sync, within
+    the same sync rate.
+  """
+  current = round_manager.current()
+  if current is None or not round_manager.current_round_is_active() or current_user.team is None:
+    return
 
-      # Randomly trigger a 'leak' event to simulate a unexpected data leak broadcast
-      if random.randint(0, 100) < 10:
-        socketio.emit('leak', {'code': code})
+  round_number, _ = current
+  user = current_user._get_current_object()
+  role = round_manager.retrieve_role(user.retrieve_number())
+  patch = Patch.parse(data)
+
+  result = None
+  if patch is not None:
+    result = documents.patch(round_number, (user.team.id, role.value), data.get('version'), patch)
+
+  if result is None:
+    emit('resync', {'role': role.value})
+    return
+
+  version, code = result
+  roll_leak(round_number, user.team.id, role)
+  sync_limiter.submit(user.id, process_sync, user, request.sid, round_number, role, version, code)
+
+
+
+@socketio.on('update_resync')
+@metrics.instrument('update_resync')
+@login_required
+def handle_update_resync() -> None:
+  """
+    Handles the 'update_resync' event from a client missing the base of a received patch,
+    sending it the whole code last broadcast to its team for each role.
+  """
+  current = round_manager.current()
+  if current is None or current_user.team is None:
+    return
+
+  round_number, _ = current
+  for role in SubmissionType:
+    version, code = documents.published(round_number, (current_user.team.id, role.value))
+    emit('update', {'role': role.value, 'code': code, 'version': version})
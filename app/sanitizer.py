@@ -0,0 +1,736 @@
+# Description:  This file contains the streaming sanitizers used to clean the submissions.
+# Path:         app/sanitizer.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import html as entities
+import re
+import string
+from typing import Dict, List, Set, Union
+
+from lxml import etree
+
+
+FORBIDDEN_TAGS = frozenset(['script', 'iframe', 'link', 'img', 'style', 'embed', 'object'])
+FORBIDDEN_ATTRIBUTES = frozenset(['style', 'background', 'src', 'href'])
+
+# Serialization rules of BeautifulSoup's HTML tree builder, which the sanitized output
+# reproduces byte for byte.
+VOID_TAGS = frozenset([
+  'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+  'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+  'image', 'isindex', 'nextid', 'spacer',
+])
+PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+MULTI_VALUED_ATTRIBUTES = {
+  '*': frozenset(['class', 'accesskey', 'dropzone']),
+  'a': frozenset(['rel', 'rev']),
+  'link': frozenset(['rel', 'rev']),
+  'td': frozenset(['headers']),
+  'th': frozenset(['headers']),
+  'form': frozenset(['accept-charset']),
+  'object': frozenset(['archive']),
+  'area': frozenset(['rel']),
+  'icon': frozenset(['sizes']),
+  'iframe': frozenset(['sandbox']),
+  'output': frozenset(['for']),
+}
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+# Elements whose content is not part of the text of a stylesheet: raw text dropped with
+# the element, and elements whose strings are not extracted by BeautifulSoup's get_text.
+DROPPED_RAW_TAGS = frozenset(['script', 'style'])
+DROPPED_TEXT_TAGS = frozenset(['template', 'rt', 'rp'])
+# Elements whose content is kept verbatim until their end tag, with or without entity decoding.
+RAW_TEXT_TAGS = frozenset(['iframe', 'xmp', 'noembed', 'noframes'])
+RCDATA_TAGS = frozenset(['textarea', 'title'])
+# Elements implying the head of the document, and the elements closed by a start tag when
+# they are the innermost open element, the head included.
+HEAD_TAGS = frozenset(['base', 'link', 'meta', 'script', 'style', 'title'])
+CLOSED_BY_START_TAGS = {
+  'head': frozenset([
+    'a', 'abbr', 'acronym', 'address', 'b', 'bdo', 'big', 'blockquote', 'br', 'center', 'cite',
+    'code', 'dd', 'dfn', 'dir', 'div', 'dl', 'dt', 'em', 'fieldset', 'font', 'form', 'frameset',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'iframe', 'img', 'kbd', 'li', 'listing',
+    'map', 'menu', 'ol', 'p', 'pre', 'q', 's', 'samp', 'small', 'span', 'strike', 'strong',
+    'sub', 'sup', 'table', 'tt', 'u', 'ul', 'var', 'xmp',
+  ]),
+  'a': frozenset(['a', 'fieldset', 'table', 'td', 'th']),
+  'address': frozenset(['dd', 'dl', 'dt', 'form', 'li', 'ul']),
+  'b': frozenset(['center', 'p', 'td', 'th']),
+  'big': frozenset(['p']),
+  'caption': frozenset(['col', 'colgroup', 'tbody', 'tfoot', 'thead', 'tr']),
+  'colgroup': frozenset(['colgroup', 'tbody', 'tfoot', 'thead', 'tr']),
+  'dd': frozenset(['dt']),
+  'dir': frozenset(['dd', 'dl', 'dt', 'form', 'ul']),
+  'dl': frozenset(['form', 'li']),
+  'dt': frozenset(['dd', 'dl']),
+  'font': frozenset(['center', 'td', 'th']),
+  'form': frozenset(['form']),
+  'h1': frozenset(['fieldset', 'form', 'li', 'p', 'table']),
+  'h2': frozenset(['fieldset', 'form', 'li', 'p', 'table']),
+  'h3': frozenset(['fieldset', 'form', 'li', 'p', 'table']),
+  'h4': frozenset(['fieldset', 'form', 'li', 'p', 'table']),
+  'h5': frozenset(['fieldset', 'form', 'li', 'p', 'table']),
+  'h6': frozenset(['fieldset', 'form', 'li', 'p', 'table']),
+  'i': frozenset(['center', 'p', 'td', 'th']),
+  'legend': frozenset(['fieldset']),
+  'li': frozenset(['li']),
+  'listing': frozenset(['dd', 'dl', 'dt', 'fieldset', 'form', 'li', 'table', 'ul']),
+  'menu': frozenset(['dd', 'dl', 'dt', 'form', 'ul']),
+  'ol': frozenset(['form']),
+  'option': frozenset(['optgroup', 'option']),
+  'p': frozenset([
+    'address', 'blockquote', 'body', 'caption', 'center', 'col', 'colgroup', 'dd', 'dir', 'div',
+    'dl', 'dt', 'fieldset', 'form', 'frameset', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'head',
+    'hr', 'li', 'listing', 'menu', 'ol', 'p', 'pre', 'table', 'tbody', 'td', 'tfoot', 'th',
+    'title', 'tr', 'ul', 'xmp',
+  ]),
+  'pre': frozenset(['dd', 'dl', 'dt', 'fieldset', 'form', 'li', 'table', 'ul']),
+  's': frozenset(['p']),
+  'small': frozenset(['p']),
+  'span': frozenset(['td', 'th']),
+  'strike': frozenset(['p']),
+  'tbody': frozenset(['tbody', 'tfoot']),
+  'td': frozenset(['tbody', 'td', 'tfoot', 'th', 'tr']),
+  'tfoot': frozenset(['tbody']),
+  'th': frozenset(['tbody', 'td', 'tfoot', 'th', 'tr']),
+  'thead': frozenset(['tbody', 'tfoot']),
+  'tr': frozenset(['tbody', 'tfoot', 'tr']),
+  'tt': frozenset(['p']),
+  'u': frozenset(['p', 'td', 'th']),
+  'ul': frozenset(['address', 'form', 'menu', 'pre']),
+}
+# A misplaced end tag only closes the open elements of lower or equal priority.
+END_TAG_PRIORITIES = {
+  'div': 150, 'td': 160, 'th': 160, 'tr': 170, 'thead': 180, 'tbody': 180, 'tfoot': 180,
+  'table': 190, 'head': 200, 'body': 200, 'html': 220,
+}
+DEFAULT_END_TAG_PRIORITY = 100
+
+# The tags are tokenized the way an HTML5 tokenizer does: the quotes only delimit the
+# attribute values, and the end tag of an element holding raw text must end its name.
+_ATTRIBUTES = r'''(?:[\t\n\f ]+|/(?!>)|[^\t\n\f />][^\t\n\f />=]*(?:[\t\n\f ]*=[\t\n\f ]*(?:"[^"]*"?|'[^']*'?|[^\t\n\f >]*))?)*'''
+_MARKUP_RE = re.compile(rf'''<(?:
+    !--(?:-?>|.*?(?:--!?>|\Z))
+  | \?[^>]*>?
+  | (?P<doctype>![Dd][Oo][Cc][Tt][Yy][Pp][Ee][^>]*>?)
+  | (?P<bogus>![^>]*>?|/[^A-Za-z>][^>]*>?)
+  | /(?:(?P<end>[A-Za-z][^\t\n\f />]*){_ATTRIBUTES}/?>?|>)
+  | (?P<start>[A-Za-z][^\t\n\f />]*){_ATTRIBUTES}(?:(?P<closed>/>)|>)?
+)''', re.S | re.X)
+_END_TAG_RE = {
+  name: re.compile(f'</{name}(?=[\\t\\n\\f />]){_ATTRIBUTES}/?>?', re.I)
+  for name in DROPPED_RAW_TAGS | RAW_TEXT_TAGS | RCDATA_TAGS
+}
+_FORBIDDEN_CSS_RE = re.compile(r'@import|url\(|expression\(')
+_ASCII_LOWER_TABLE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+# The common forms of the constructs, without escapes, unterminated strings or deeper
+# nesting, matched at once before falling back to the token scan.
+_STRING = r'"[^"\\]*"|' r"'[^'\\]*'"
+_PARENTHESES = rf'''\([^()"'\\]*(?:(?:{_STRING})[^()"'\\]*)*\)'''
+_SIMPLE_FUNCTION_RE = re.compile(rf'''[^()"'\\]*(?:(?:{_STRING}|{_PARENTHESES})[^()"'\\]*)*\)''')
+_SIMPLE_RULE_RE = re.compile(rf'''[^(){{}};"'\\]*(?:(?:{_STRING}|{_PARENTHESES})[^(){{}};"'\\]*)*;''')
+_CSS_TOKEN_RE = re.compile(r'''\\.|"(?:\\.|[^"\\])*"?|'(?:\\.|[^'\\])*'?|[(){};]''', re.S)
+
+_ENTITIES = {'&': '&amp;', '<': '&lt;', '>': '&gt;'}
+_ENTITY_RE = re.compile('[&<>]')
+_NON_WHITESPACE_RE = re.compile(r'\S+')
+_BLANK_TABLE = str.maketrans('', '', ASCII_SPACES)
+
+
+def escape(text: str) -> str:
+  """
+    Replaces the ampersands and angle brackets of a string by their entities.
+
+    Args:
+      text (str): The text to escape.
+
+    Returns:
+      str: The escaped text.
+  """
+  if '&' in text or '<' in text or '>' in text:
+    return _ENTITY_RE.sub(lambda m: _ENTITIES[m.group(0)], text)
+  return text
+
+
+
+def quote(value: str) -> str:
+  """
+    Quotes an attribute value, preferring double quotes.
+
+    Args:
+      value (str): The escaped attribute value.
+
+    Returns:
+      str: The quoted attribute value.
+  """
+  if '"' in value:
+    if "'" in value:
+      return '"' + value.replace('"', '&quot;') + '"'
+    return "'" + value + "'"
+  return '"' + value + '"'
+
+
+
+class HTMLSanitizer:
+  """
+    An lxml parser target removing the forbidden tags and attributes while the document
+    is parsed, and serializing the remaining nodes as they are produced. No tree is built:
+    the subtrees of forbidden tags are skipped and every other event is written once.
+
+    The output is the content of the body, or the whole document when it has no body.
+  """
+  def __init__(self):
+    self.__out: List[str] = []
+    self.__text: List[str] = []
+    self.__stack: List[str] = []
+    self.__preserve = 0
+    self.__skip = 0
+    self.__body = None
+    self.__body_done = False
+    self.__open_void = False
+
+
+  def start(self, tag: str, attrib: Dict[str, str], nsmap: Union[dict, None] = None) -> None:
+    self.__flush()
+    self.__stack.append(tag)
+    if tag in PRESERVE_WHITESPACE_TAGS:
+      self.__preserve += 1
+
+    if self.__skip or self.__body_done:
+      if self.__skip:
+        self.__skip += 1
+      return
+
+    if tag in FORBIDDEN_TAGS:
+      self.__skip = 1
+      return
+
+    if tag == 'body' and self.__body is None:
+      self.__out.clear()
+      self.__open_void = False
+      self.__body = len(self.__stack)
+      return
+
+    self.__close_void()
+
+    parts = ['<', tag]
+    if attrib:
+      universal = MULTI_VALUED_ATTRIBUTES['*']
+      specific = MULTI_VALUED_ATTRIBUTES.get(tag.lower(), ())
+      for key in sorted(attrib.keys()):
+        if key in FORBIDDEN_ATTRIBUTES:
+          continue
+        value = attrib[key]
+        if key in universal or key in specific:
+          value = ' '.join(_NON_WHITESPACE_RE.findall(value))
+        parts.append(' ' + key + '=' + quote(escape(value)))
+
+    self.__out.append(''.join(parts))
+    if tag in VOID_TAGS:
+      self.__open_void = True
+    else:
+      self.__out.append('>')
+
+
+  def end(self, tag: str) -> None:
+    self.__flush()
+    depth = len(self.__stack)
+    self.__stack.pop()
+    if tag in PRESERVE_WHITESPACE_TAGS:
+      self.__preserve -= 1
+
+    if self.__skip:
+      self.__skip -= 1
+      return
+    if self.__body_done:
+      return
+
+    if self.__body == depth:
+      self.__body_done = True
+      return
+
+    if self.__open_void:
+      self.__out.append('/>')
+      self.__open_void = False
+    else:
+      self.__out.append(f'</{tag}>')
+
+
+  def data(self, data: str) -> None:
+    self.__text.append(data)
+
+
+  def comment(self, text: str) -> None:
+    self.__flush()
+    self.__special('<!--', text, '-->')
+
+
+  def pi(self, target: str, data: str) -> None:
+    self.__flush()
+    self.__special('<?', target + ' ' + data, '>')
+
+
+  def doctype(self, name: str, pubid: Union[str, None], system: Union[str, None]) -> None:
+    self.__flush()
+    value = name or ''
+    if pubid is not None:
+      value += f' PUBLIC "{pubid}"'
+      if system is not None:
+        value += f' "{system}"'
+    elif system is not None:
+      value += f' SYSTEM "{system}"'
+    self.__special('<!DOCTYPE ', value, '>\n')
+
+
+  def close(self) -> str:
+    self.__flush()
+    self.__close_void()
+    return ''.join(self.__out)
+
+
+  def __visible(self) -> bool:
+    return not self.__skip and not self.__body_done
+
+
+  def __at_body_level(self) -> bool:
+    return self.__body is not None and len(self.__stack) == self.__body
+
+
+  def __close_void(self) -> None:
+    """
+      Ends the start tag of a void element once it is known to have content.
+    """
+    if self.__open_void:
+      self.__out.append('>')
+      self.__open_void = False
+
+
+  def __special(self, prefix: str, text: str, suffix: str) -> None:
+    """
+      Writes a comment, processing instruction or doctype. The direct children of the
+      body are written without their delimiters.
+    """
+    if not self.__visible():
+      return
+    self.__close_void()
+    if self.__at_body_level():
+      self.__out.append(text)
+    else:
+      self.__out.append(prefix + text + suffix)
+
+
+  def __flush(self) -> None:
+    """
+      Writes the pending text, collapsing the whitespace-only strings outside of
+      the preformatted elements. The direct children of the body are not escaped.
+    """
+    if not self.__text:
+      return
+
+    text = ''.join(self.__text)
+    self.__text.clear()
+    if not self.__visible():
+      return
+
+    if not self.__preserve and not text.translate(_BLANK_TABLE):
+      text = '\n' if '\n' in text else ' '
+
+    self.__close_void()
+    self.__out.append(text if self.__at_body_level() else escape(text))
+
+
+
+def sanitize_html(html: str) -> str:
+  """
+    Removes the forbidden tags and attributes of an HTML document in a single streaming
+    pass over the lxml parser events.
+
+    Args:
+      html (str): The HTML content to clean.
+
+    Returns:
+      str: The cleaned HTML content.
+  """
+  if html.startswith('\ufeff'):
+    html = html[1:]
+
+  try:
+    parser = etree.HTMLParser(target=HTMLSanitizer(), recover=True)
+    parser.feed(html)
+    return parser.close()
+  except (UnicodeDecodeError, LookupError, etree.ParserError):
+    parser = etree.HTMLParser(target=HTMLSanitizer(), recover=True, encoding='utf8')
+    parser.feed(html.encode('utf8'))
+    return parser.close()
+
+
+
+class CSSSanitizer:
+  """
+    A sanitizer for stylesheets, in two scans driven by compiled token patterns.
+
+    The first scan strips the injected markup and keeps the text of the document the way
+    BeautifulSoup extracts it from the tree built by lxml: the tags are tokenized like
+    the HTML5 tokenizer of libxml2, and the open elements are tracked like its tree
+    builder, which implies the document, its head and its body, and splits the text
+    at the boundaries of the elements. The second scan removes the `@import` rules and
+    the `url(...)` and `expression(...)` functions, matching nested parentheses and strings.
+  """
+  def __init__(self):
+    self.__reset()
+
+
+  def sanitize(self, css: str) -> str:
+    """
+      Sanitizes a stylesheet.
+
+      Args:
+        css (str): The CSS content to clean.
+
+      Returns:
+        str: The cleaned CSS content.
+    """
+    return self.strip_forbidden(self.strip_markup(css))
+
+
+  def strip_markup(self, css: str) -> str:
+    """
+      Removes the tags, comments and declarations of the content and decodes its entities.
+
+      Args:
+        css (str): The content to clean.
+
+      Returns:
+        str: The text of the content.
+    """
+    # A leading byte order mark is dropped by BeautifulSoup, and the next one by lxml
+    # unless nothing follows
+    if css.startswith('\ufeff'):
+      css = css[2:] if css.startswith('\ufeff', 1) and len(css) > 2 else css[1:]
+    if '\r' in css:
+      css = css.replace('\r\n', '\n').replace('\r', '\n')
+    if '\0' in css:
+      css = css.replace('\0', '\ufffd')
+
+    self.__reset()
+    pos, length = 0, len(css)
+    while pos < length:
+      match = _MARKUP_RE.search(css, pos)
+      if match is None:
+        self.__text.append(css[pos:])
+        break
+
+      if match.start() > pos:
+        self.__text.append(css[pos:match.start()])
+      pos = match.end()
+
+      kind = match.lastgroup
+      if kind == 'bogus' or kind == 'doctype' and self.__doctype:
+        # A malformed comment or a second doctype, unlike the well-formed comments, ends
+        # the prolog of the document: the following blanks are kept as their own node.
+        self.__flush()
+        self.__split_blanks = True
+        continue
+
+      if kind == 'end':
+        self.__end(match.group('end').lower())
+        continue
+
+      if kind is None or kind == 'doctype':
+        if match.group(0) == '</>':
+          self.__end('')
+        else:
+          self.__flush()
+          self.__doctype = self.__doctype or kind == 'doctype'
+        continue
+
+      name = match.group('start').lower()
+      if not self.__start(name):
+        continue
+      if kind == 'closed':
+        # A self-closing element is closed at once, without content
+        continue
+
+      if name in DROPPED_RAW_TAGS or name in RAW_TEXT_TAGS or name in RCDATA_TAGS:
+        close = _END_TAG_RE[name].search(css, pos)
+        if name not in DROPPED_RAW_TAGS:
+          self.__text.append(css[pos:close.start() if close else length])
+          self.__push(name)
+          self.__flush(decode=name in RCDATA_TAGS)
+          self.__close(len(self.__open) - 1)
+        pos = close.end() if close else length
+      elif name == 'plaintext':
+        self.__push(name)
+        self.__text.append(css[pos:])
+        self.__flush(decode=False)
+        break
+      elif name not in VOID_TAGS:
+        self.__push(name)
+
+    self.__flush()
+    return ''.join(self.__out)
+
+
+  def strip_forbidden(self, css: str) -> str:
+    """
+      Removes the `@import` rules and the `url(...)` and `expression(...)` functions.
+      An `@import` rule ends at its semicolon, at its block, or at the end of the enclosing
+      block; the functions end at their matching parenthesis.
+
+      Args:
+        css (str): The CSS content to clean.
+
+      Returns:
+        str: The CSS content without the forbidden constructs.
+    """
+    # The keywords are searched case-sensitively in a lower-cased copy, which is much
+    # faster than a case-insensitive search.
+    lowered = css.lower()
+    if len(lowered) != len(css):
+      lowered = css.translate(_ASCII_LOWER_TABLE)
+
+    out = []
+    pos = 0
+    while True:
+      match = _FORBIDDEN_CSS_RE.search(lowered, pos)
+      if match is None:
+        out.append(css[pos:])
+        return ''.join(out)
+
+      out.append(css[pos:match.start()])
+      rule = css[match.start()] == '@'
+      simple = (_SIMPLE_RULE_RE if rule else _SIMPLE_FUNCTION_RE).match(css, match.end())
+      pos = simple.end() if simple else self.__skip(css, match.end(), rule)
+
+
+  def __skip(self, css: str, pos: int, rule: bool) -> int:
+    """
+      Returns the end of the construct starting at the given position.
+    """
+    parentheses, braces = (0 if rule else 1), 0
+    for token in _CSS_TOKEN_RE.finditer(css, pos):
+      char = token.group(0)
+      if char == '(':
+        parentheses += 1
+      elif char == ')':
+        parentheses = max(parentheses - 1, 0)
+        if not rule and parentheses == 0:
+          return token.end()
+      elif not rule or parentheses:
+        continue
+      elif char == '{':
+        braces += 1
+      elif char == '}':
+        if braces == 0:
+          return token.start()
+        braces -= 1
+        if braces == 0:
+          return token.end()
+      elif char == ';' and braces == 0:
+        return token.end()
+    return len(css)
+
+
+  def __reset(self) -> None:
+    self.__out: List[str] = []
+    self.__text: List[str] = []
+    # The open elements, the document and its body excepted
+    self.__open: List[str] = []
+    self.__counts: Dict[str, int] = {}
+    # The end tags found misplaced since the open elements last changed
+    self.__blocked: Set[str] = set()
+    self.__html = False
+    self.__body = False
+    # Whether the head and the body were opened once, which are not implied again
+    self.__head = False
+    self.__seen_body = False
+    self.__doctype = False
+    self.__ignored = 0
+    self.__split_blanks = False
+    self.__dropped = 0
+    self.__preserve = 0
+
+
+  def __start(self, name: str) -> bool:
+    """
+      Starts an element, implying the document, its head or its body. The misplaced
+      document elements are ignored, without splitting the surrounding text, along
+      with their end tags.
+
+      Returns:
+        bool: Whether the element is to be opened, unlike the document elements.
+    """
+    self.__imply()
+    if self.__open and name in CLOSED_BY_START_TAGS.get(self.__open[-1], ()):
+      self.__flush()
+      while self.__open and name in CLOSED_BY_START_TAGS.get(self.__open[-1], ()):
+        self.__close(len(self.__open) - 1)
+
+    if name == 'html' and self.__html or name == 'body' and self.__body \
+        or name == 'head' and (self.__body or self.__open):
+      self.__ignored += 1
+      return False
+
+    self.__flush()
+    self.__html = True
+    if name == 'html':
+      # The blanks of the document are kept as their own node
+      self.__split_blanks = True
+    elif name == 'body':
+      self.__open_body()
+    elif name == 'head' or name in HEAD_TAGS and not self.__body and not self.__open:
+      # And so are the blanks of its head
+      self.__split_blanks = True
+      if name == 'head' or not self.__head:
+        self.__head = True
+        self.__push('head')
+    elif not self.__seen_body and self.__open[:1] != ['head']:
+      self.__open_body()
+    return name != 'html' and name != 'head' and name != 'body'
+
+
+  def __end(self, name: str) -> None:
+    """
+      Closes an element and the elements opened since, unless one of them has a higher
+      priority. A misplaced end tag produces no node and does not split the surrounding
+      text, except in the prolog of the document, whose blanks are then dropped.
+    """
+    self.__imply()
+    if self.__ignored and name in ('html', 'head', 'body'):
+      self.__ignored -= 1
+      return
+
+    if name == 'html' and self.__html or name == 'body' and self.__body:
+      # Closes every open element, the ones whose text is dropped included. The text
+      # following the end of the document is the start of a new one.
+      self.__flush()
+      self.__close(0)
+      self.__body = False
+      if name == 'html':
+        self.__html = False
+        self.__split_blanks = True
+      return
+
+    if self.__counts.get(name) and name not in self.__blocked:
+      priority = END_TAG_PRIORITIES.get(name, DEFAULT_END_TAG_PRIORITY)
+      for index in range(len(self.__open) - 1, -1, -1):
+        if self.__open[index] == name:
+          self.__flush()
+          self.__close(index)
+          return
+        if END_TAG_PRIORITIES.get(self.__open[index], DEFAULT_END_TAG_PRIORITY) > priority:
+          self.__blocked.add(name)
+          break
+
+    if not self.__split_blanks and self.__at_top():
+      self.__text.clear()
+      self.__split_blanks = True
+
+
+  def __at_top(self) -> bool:
+    """
+      Returns whether the text is added to the document or to its head, where its first
+      character implies the document or its body, rather than to an element.
+    """
+    if self.__open:
+      return self.__open[-1] == 'head'
+    return not self.__body and (not self.__html or not self.__seen_body)
+
+
+  def __imply(self) -> None:
+    """
+      Implies the document or its body at the first character of the pending text added
+      to the document or to its head. The leading blanks are split from the text, and
+      dropped in the prolog of the document.
+    """
+    if not self.__text or not self.__at_top():
+      return
+
+    text = ''.join(self.__text)
+    stripped = text.lstrip(ASCII_SPACES)
+    if not stripped:
+      return
+
+    self.__text.clear()
+    if self.__split_blanks and len(stripped) < len(text):
+      blanks = text[:len(text) - len(stripped)]
+      self.__out.append('\n' if '\n' in blanks else ' ')
+    self.__text.append(stripped)
+    self.__open_body()
+
+
+  def __open_body(self) -> None:
+    """
+      Enters the body of the document, closing its head. The body is implied once.
+    """
+    if self.__open and self.__open[-1] == 'head':
+      self.__close(len(self.__open) - 1)
+    self.__html = self.__head = True
+    if not self.__seen_body:
+      self.__body = self.__seen_body = True
+
+
+  def __push(self, name: str) -> None:
+    """
+      Opens an element.
+    """
+    self.__open.append(name)
+    self.__blocked.clear()
+    self.__counts[name] = self.__counts.get(name, 0) + 1
+    self.__dropped += name in DROPPED_TEXT_TAGS
+    self.__preserve += name in PRESERVE_WHITESPACE_TAGS
+
+
+  def __close(self, index: int) -> None:
+    """
+      Closes the open elements from the given depth.
+    """
+    for name in self.__open[index:]:
+      self.__counts[name] -= 1
+      self.__dropped -= name in DROPPED_TEXT_TAGS
+      self.__preserve -= name in PRESERVE_WHITESPACE_TAGS
+    del self.__open[index:]
+    self.__blocked.clear()
+
+
+  def __flush(self, decode: bool = True) -> None:
+    """
+      Writes the pending text node, collapsing the whitespace-only nodes outside of the
+      preformatted elements. The blanks added to the document or to its head are kept
+      as their own node once the prolog ended.
+    """
+    if not self.__text:
+      return
+
+    self.__imply()
+    text = ''.join(self.__text)
+    self.__text.clear()
+    if self.__dropped or not text:
+      return
+
+    if self.__at_top():
+      if self.__split_blanks:
+        self.__out.append('\n' if '\n' in text else ' ')
+      return
+
+    if decode and '&' in text:
+      text = entities.unescape(text)
+    if not self.__preserve and not text.translate(_BLANK_TABLE):
+      text = '\n' if '\n' in text else ' '
+    self.__out.append(text)
+
+
+
+def sanitize_css(css: str) -> str:
+  """
+    Removes the injected markup, imports, URLs and expressions of a stylesheet.
+
+    Args:
+      css (str): The CSS content to clean.
+
+    Returns:
+      str: The cleaned CSS content.
+  """
+  return CSSSanitizer().sanitize(css)
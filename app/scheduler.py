@@ -0,0 +1,215 @@
+# Description:  This file contains the timer heap scheduling the transitions of the rounds.
+# Path:         app/scheduler.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import heapq
+import itertools
+import time
+from typing import Any, Callable, List, Union
+
+import eventlet
+from eventlet.event import Event
+from eventlet.semaphore import Semaphore
+
+from app.cmd.app import app
+
+
+class MonotonicClock:
+  """
+    A clock advancing with the monotonic clock of the system, expressed as a UNIX timestamp
+    so its times can be sent to the clients. Changes of the system time do not affect it.
+  """
+  def __init__(self):
+    self.__offset = time.time() - time.monotonic()
+
+
+  def now(self) -> float:
+    return time.monotonic() + self.__offset
+
+
+  def wait(self, event: Event, timeout: Union[float, None]) -> None:
+    """
+      Waits until the event is sent or the timeout expires.
+
+      Args:
+        event (Event): The event waking the caller early.
+        timeout (Union[float, None]): The maximum time to wait, or None to wait for the event.
+    """
+    if timeout is None:
+      event.wait()
+      return
+
+    with eventlet.Timeout(max(0, timeout), False):
+      event.wait()
+
+
+
+class VirtualClock:
+  """
+    A clock only advancing when the scheduler waits: instead of sleeping, it jumps to the
+    next deadline once the other green threads ran. A whole game can be simulated in
+    milliseconds with it.
+  """
+  def __init__(self, start: float = 0):
+    self.__now = start
+
+
+  def now(self) -> float:
+    return self.__now
+
+
+  def advance(self, seconds: float) -> None:
+    self.__now += seconds
+
+
+  def wait(self, event: Event, timeout: Union[float, None]) -> None:
+    """
+      Lets the other green threads run, then jumps to the timeout unless the event was sent.
+
+      Args:
+        event (Event): The event waking the caller early.
+        timeout (Union[float, None]): The time to jump forward, or None to wait for the event.
+    """
+    eventlet.sleep(0)
+    if event.ready():
+      return
+
+    if timeout is None:
+      event.wait()
+      return
+
+    self.__now += max(0, timeout)
+
+
+
+class Timer:
+  """
+    A callback scheduled at a deadline, which can be cancelled until it runs.
+  """
+  def __init__(self, deadline: float, sequence: int, callback: Callable, args: tuple):
+    self.deadline = deadline
+    self.sequence = sequence
+    self.callback = callback
+    self.args = args
+    self.cancelled = False
+
+
+  def __lt__(self, other: 'Timer') -> bool:
+    return (self.deadline, self.sequence) < (other.deadline, other.sequence)
+
+
+  def cancel(self) -> None:
+    self.cancelled = True
+
+
+
+class Scheduler:
+  """
+    Runs callbacks at their deadline from a heap of timers. A single green thread sleeps
+    exactly until the earliest deadline, and is woken early when an earlier timer is
+    scheduled. The callbacks run one at a time, in the order of their deadlines.
+  """
+  def __init__(self, clock: Any = None):
+    self.__clock = clock or MonotonicClock()
+    self.__timers: List[Timer] = []
+    self.__sequence = itertools.count()
+    self.__wakeup = Event()
+    self.__lock = Semaphore()
+    self.__thread = None
+
+
+  @property
+  def clock(self) -> Any:
+    return self.__clock
+
+
+  def now(self) -> float:
+    return self.__clock.now()
+
+
+  def call_at(self, deadline: float, callback: Callable, *args: Any) -> Timer:
+    """
+      Schedules a callback at a deadline.
+
+      Args:
+        deadline (float): The time of the clock at which the callback runs.
+        callback (Callable): The callback.
+        *args: Arguments to pass to the callback.
+
+      Returns:
+        Timer: The timer, to cancel the callback.
+    """
+    timer = Timer(deadline, next(self.__sequence), callback, args)
+    with self.__lock:
+      heapq.heappush(self.__timers, timer)
+      if self.__timers[0] is timer and not self.__wakeup.ready():
+        self.__wakeup.send()
+    return timer
+
+
+  def call_later(self, delay: float, callback: Callable, *args: Any) -> Timer:
+    return self.call_at(self.now() + delay, callback, *args)
+
+
+  def start(self) -> None:
+    """
+      Starts the green thread running the timers, if it is not already running.
+    """
+    with self.__lock:
+      if self.__thread is None:
+        self.__thread = eventlet.spawn(self.__run)
+
+
+  def stop(self) -> None:
+    """
+      Stops the green thread and drops the pending timers. A running callback is not
+      interrupted: the green thread exits once it returns.
+    """
+    with self.__lock:
+      self.__thread = None
+      self.__timers.clear()
+      if not self.__wakeup.ready():
+        self.__wakeup.send()
+
+
+  def pending(self) -> int:
+    with self.__lock:
+      return sum(1 for timer in self.__timers if not timer.cancelled)
+
+
+  def __run(self) -> None:
+    """
+      Main loop of the scheduler.
+    """
+    while True:
+      with self.__lock:
+        if self.__thread is not eventlet.getcurrent():
+          return
+        while self.__timers and self.__timers[0].cancelled:
+          heapq.heappop(self.__timers)
+        timeout = self.__timers[0].deadline - self.now() if self.__timers else None
+        wakeup = self.__wakeup
+
+      if timeout is None or timeout > 0:
+        self.__clock.wait(wakeup, timeout)
+
+      due = []
+      with self.__lock:
+        if self.__thread is not eventlet.getcurrent():
+          return
+        if self.__wakeup.ready():
+          self.__wakeup = Event()
+        now = self.now()
+        while self.__timers and self.__timers[0].deadline <= now:
+          timer = heapq.heappop(self.__timers)
+          if not timer.cancelled:
+            due.append(timer)
+
+      for timer in due:
+        if timer.cancelled:
+          continue
+        try:
+          timer.callback(*timer.args)
+        except Exception as e:
+          app.logger.error(f'Scheduled callback {timer.callback!r} failed: {e!r}')
@@ -0,0 +1,288 @@
+# Description:  This file contains the scoring engine used to rank the submissions of a round.
+# Path:         app/scoring.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import time
+from typing import Any, Dict, List, Tuple, Union
+
+import cv2
+import numpy as np
+from eventlet import tpool
+
+from app.cache import content_key, render_cache, score_cache
+from app.cmd.app import app
+from app.features import SSIM_C1, SSIM_C2, blur, decode_image, feature_store, reference_statistics
+from app.models import Challenge, SubmissionType, persist_scores
+from app.renderer import render_pool
+from app.utils import cleanup_html, cleanup_css
+
+
+MAX_SCORE = 1000
+MAX_POINTS = 22
+
+# Number of teams filtered by the same OpenCV call. OpenCV accepts at most 128 channels
+# per matrix (3 per team) and the chunk size also bounds the memory of the temporaries.
+BATCH_SIZE = 16
+
+
+def stack_renders(shape: Tuple[int, ...], renders: List[Union[np.ndarray, None]]) -> np.ndarray:
+  """
+    Stacks the renders of the teams into one contiguous array, resizing the renders that
+    do not match the reference and replacing the missing ones by a blank page.
+
+    Args:
+      shape (Tuple[int, ...]): The (H, W, 3) shape of the reference.
+      renders (List[Union[np.ndarray, None]]): The RGB renders of the teams.
+
+    Returns:
+      np.ndarray: An (N, H, W, 3) uint8 array.
+  """
+  height, width = shape[:2]
+  stack = np.full((len(renders), height, width, 3), 255, dtype=np.uint8)
+
+  for i, render in enumerate(renders):
+    if render is None:
+      continue
+    if render.shape[:2] != (height, width):
+      render = cv2.resize(render, (width, height), interpolation=cv2.INTER_AREA)
+    stack[i] = render[..., :3]
+
+  return stack
+
+
+
+def similarity_scores(reference: np.ndarray, renders: np.ndarray,
+                      statistics: Union[Tuple[np.ndarray, np.ndarray], None] = None) -> np.ndarray:
+  """
+    Scores a batch of renders against the reference using the mean structural similarity
+    of the RGB channels. The renders are processed as multi-channel matrices, so every
+    team of a chunk is filtered by the same OpenCV call.
+
+    Args:
+      reference (np.ndarray): The (H, W, 3) reference image.
+      renders (np.ndarray): The (N, H, W, 3) renders of the teams.
+      statistics (Union[Tuple[np.ndarray, np.ndarray], None]): The precomputed local means and
+                                                                variances of the reference.
+
+    Returns:
+      np.ndarray: The similarity scores between 0 and 1000.
+  """
+  count = renders.shape[0]
+  scores = np.zeros(count, dtype=np.float64)
+  if count == 0:
+    return scores
+
+  height, width = reference.shape[:2]
+  x = reference.astype(np.float32)
+  mu_x, sigma_x = statistics if statistics is not None else reference_statistics(reference)
+
+  for start in range(0, count, BATCH_SIZE):
+    chunk = renders[start:start + BATCH_SIZE]
+    n = chunk.shape[0]
+
+    # (N, H, W, 3) -> (H, W, N * 3), each team occupying three consecutive channels.
+    y = np.ascontiguousarray(chunk.transpose(1, 2, 0, 3).reshape(height, width, n * 3), dtype=np.float32)
+    tx, tmu_x, tsigma_x = (np.tile(a, (1, 1, n)) for a in (x, mu_x, sigma_x))
+
+    mu_y = blur(y)
+    sigma_y = blur(y * y) - mu_y * mu_y
+    sigma_xy = blur(tx * y) - tmu_x * mu_y
+
+    ssim = ((2 * tmu_x * mu_y + SSIM_C1) * (2 * sigma_xy + SSIM_C2)) / \
+           ((tmu_x * tmu_x + mu_y * mu_y + SSIM_C1) * (tsigma_x + sigma_y + SSIM_C2))
+
+    means = ssim.reshape(height * width, n, 3).mean(axis=(0, 2))
+    scores[start:start + n] = np.clip(means, 0, 1) * MAX_SCORE
+
+  return scores
+
+
+
+def rank(scores: Dict[Any, float], lengths: Dict[Any, int]) -> List[Any]:
+  """
+    Ranks the teams by decreasing similarity score, the shortest code winning the ties.
+
+    Args:
+      scores (Dict[Any, float]): The similarity score of each team.
+      lengths (Dict[Any, int]): The code length of each team.
+
+    Returns:
+      List[Any]: The team IDs, from the first to the last place.
+  """
+  return sorted(scores, key=lambda team_id: (-scores[team_id], lengths.get(team_id, 0)))
+
+
+
+def round_points(scores: Dict[Any, float]) -> Dict[Any, float]:
+  """
+    Applies the ranking formula of a round: (x - y) / (w - y) * 22 where x is the score of the
+    team, y the minimum score and w the maximum score of the round.
+
+    Args:
+      scores (Dict[Any, float]): The similarity score of each team.
+
+    Returns:
+      Dict[Any, float]: The points earned by each team.
+  """
+  if not scores:
+    return {}
+
+  values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+  low, high = values.min(), values.max()
+  if high == low:
+    return {team_id: float(MAX_POINTS) for team_id in scores}
+
+  points = (values - low) / (high - low) * MAX_POINTS
+  return dict(zip(scores, points.tolist()))
+
+
+
+def compute_scores(challenge: Challenge, renders: Dict[Any, Union[np.ndarray, None]]) -> Dict[Any, float]:
+  """
+    Scores a batch of renders against a challenge, off the eventlet hub.
+
+    Args:
+      challenge (Challenge): The challenge to compare the renders with.
+      renders (Dict[Any, Union[np.ndarray, None]]): The RGB renders, None for a blank page.
+
+    Returns:
+      Dict[Any, float]: The similarity score of each render.
+  """
+  features = feature_store.load(challenge.image)
+  keys = list(renders)
+  stack = stack_renders(features.rgb.shape, [renders[key] for key in keys])
+  scores = tpool.execute(similarity_scores, features.rgb, stack, features.statistics)
+  return dict(zip(keys, scores.tolist()))
+
+
+
+def rank_round(round_number: int, scores: Dict[Any, float], data: dict) -> List[dict]:
+  """
+    Ranks the teams of a round and stores the results next to their submissions.
+
+    Args:
+      round_number (int): The round number.
+      scores (Dict[Any, float]): The similarity score of each team, keyed by team ID.
+      data (dict): The submissions of the round, as given to `persist_sumbissions`.
+
+    Returns:
+      List[dict]: The results of the round, from the first to the last place.
+  """
+  lengths = {}
+  for team_id in scores:
+    submission = data.get(team_id, {})
+    lengths[team_id] = len(submission.get(SubmissionType.HTML, '')) + len(submission.get(SubmissionType.CSS, ''))
+
+  points = round_points(scores)
+  results = [{
+    'team': team_id,
+    'rank': position,
+    'score': scores[team_id],
+    'points': points[team_id],
+  } for position, team_id in enumerate(rank(scores, lengths), start=1)]
+
+  persist_scores(round_number, results)
+  return results
+
+
+
+def score_round(round_number: int, challenge: Challenge, renders: Dict[Any, np.ndarray],
+                data: dict) -> List[dict]:
+  """
+    Scores every team of a round in one batch, ranks them and stores the results next to
+    their submissions.
+
+    Args:
+      round_number (int): The round number.
+      challenge (Challenge): The challenge of the round.
+      renders (Dict[Any, np.ndarray]): The RGB render of each team, keyed by team ID.
+      data (dict): The submissions of the round, as given to `persist_sumbissions`.
+
+    Returns:
+      List[dict]: The results of the round, from the first to the last place.
+  """
+  started = time.perf_counter()
+  results = rank_round(round_number, compute_scores(challenge, renders), data)
+
+  app.logger.info(f'Scored {len(results)} submissions for round {round_number} in {time.perf_counter() - started:.3f}s')
+  return results
+
+
+
+def score_submissions(challenge: Challenge, jobs: Dict[str, Tuple[str, str]]) -> Dict[str, float]:
+  """
+    Renders and scores distinct submissions of a challenge, reusing the renders and scores
+    of the caches. The renders are decoded and scored off the eventlet hub.
+
+    Args:
+      challenge (Challenge): The challenge of the submissions.
+      jobs (Dict[str, Tuple[str, str]]): The cleaned (html, css) code, keyed by `content_key`.
+
+    Returns:
+      Dict[str, float]: The similarity score of each submission.
+  """
+  height, width = feature_store.load(challenge.image).rgb.shape[:2]
+
+  scores, renders, missing = {}, {}, {}
+  for key, job in jobs.items():
+    score = score_cache.get(key)
+    if score is not None:
+      scores[key] = score
+      continue
+
+    render = render_cache.get(key)
+    if render is None:
+      missing[key] = job
+    else:
+      renders[key] = render
+
+  if missing:
+    screenshots = render_pool.render_many(missing, width, height)
+    decoded = tpool.execute(lambda: {
+      key: decode_image(png) if png is not None else None for key, png in screenshots.items()
+    })
+    for key, render in decoded.items():
+      if render is not None:
+        render_cache.set(key, render)
+    renders.update(decoded)
+
+  if renders:
+    for key, score in compute_scores(challenge, renders).items():
+      if renders[key] is not None:
+        score_cache.set(key, score)
+      scores[key] = score
+
+  return scores
+
+
+
+def evaluate_round(round_number: int, challenge: Challenge, data: dict) -> List[dict]:
+  """
+    Renders the cleaned code of every team of a round with the render pool, then scores
+    the renders in one batch. Identical submissions are rendered and scored once, and
+    the renders and scores of previous requests are reused from the caches.
+
+    Args:
+      round_number (int): The round number.
+      challenge (Challenge): The challenge of the round.
+      data (dict): The submissions of the round, as given to `persist_sumbissions`.
+
+    Returns:
+      List[dict]: The results of the round, from the first to the last place.
+  """
+  started = time.perf_counter()
+
+  keys, jobs = {}, {}
+  for team_id, submission in data.items():
+    html = cleanup_html(submission.get(SubmissionType.HTML, ''))
+    css = cleanup_css(submission.get(SubmissionType.CSS, ''))
+    keys[team_id] = content_key(challenge._id, html, css)
+    jobs.setdefault(keys[team_id], (html, css))
+
+  scores = score_submissions(challenge, jobs)
+  results = rank_round(round_number, {team_id: scores[key] for team_id, key in keys.items()}, data)
+
+  app.logger.info(f'Scored {len(results)} submissions ({len(jobs)} distinct) for round {round_number} '
+                  f'in {time.perf_counter() - started:.3f}s')
+  return results
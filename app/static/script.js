@@ -1,7 +1,8 @@
 const ROLE_HTML = 'html';
 const ROLE_CSS = 'css';
 
-const socket = io.connect('/');
+// Without the polling transport, a client stays on the worker it connected to
+const socket = io.connect('/', { transports: ['websocket'] });
 
 let current_tab = 'rules';
 const comm_tab = document.querySelector('.container >ul li a[href="comm"]');
@@ -93,6 +94,13 @@ class Countdown {
     this.update();
   }
 
+  pause() {
+    clearTimeout(this.__tid);
+    this.__end = NaN;
+    this.__remaining_time_str = '--:--';
+    this.__el.innerText = this.__remaining_time_str;
+  }
+
   swap_role() {
     this.__role.innerText = '????';
     this.__current_role = ROLE_CSS === this.__current_role ? ROLE_HTML : ROLE_CSS;
@@ -272,10 +280,12 @@ class ImageReference {
     this.__magnifier.style.display = 'none';
   }
 
-  set_image(base64) {
-    this.__img_src.src = `data:image/png;base64,${base64}`;
+  set_image(image) {
+    const { url, width, height } = image;
 
-    this.__img_src.onload = () => this.__setup_canvas();
+    this.__canvas_ref.width = width;
+    this.__canvas_ref.height = height;
+    this.__img_src.src = url;
   }
 
   change_img_src(src) {
@@ -283,6 +293,110 @@ class ImageReference {
   }
 }
 
+/**
+ * delta sync protocol
+ *
+ * The patches replace the [start, end) span of a document. Their offsets are in code
+ * points on the wire, like the strings of the server, and in UTF-16 units locally.
+ **********************************************************/
+const is_high_surrogate = (code) => code >= 0xD800 && code <= 0xDBFF;
+const is_low_surrogate = (code) => code >= 0xDC00 && code <= 0xDFFF;
+const is_pair_end = (text, i) => is_high_surrogate(text.charCodeAt(i - 1)) && is_low_surrogate(text.charCodeAt(i));
+
+const to_points = (text, units) => {
+  let points = 0;
+  for (let i = 0; i < units; i++)
+    if (!is_pair_end(text, i)) points++;
+  return points;
+};
+
+const to_units = (text, points) => {
+  let units = 0;
+  for (; points > 0 && units < text.length; points--)
+    units += is_pair_end(text, units + 1) ? 2 : 1;
+  return units;
+};
+
+const diff = (old_text, new_text) => {
+  const limit = Math.min(old_text.length, new_text.length);
+
+  let start = 0;
+  while (start < limit && old_text.charCodeAt(start) === new_text.charCodeAt(start))
+    start++;
+  if (start > 0 && is_high_surrogate(old_text.charCodeAt(start - 1)))
+    start--;
+
+  let end = 0;
+  while (end < limit - start && old_text.charCodeAt(old_text.length - end - 1) === new_text.charCodeAt(new_text.length - end - 1))
+    end++;
+  if (end > 0 && is_low_surrogate(old_text.charCodeAt(old_text.length - end)))
+    end--;
+
+  return {
+    start: to_points(old_text, start),
+    end: to_points(old_text, old_text.length - end),
+    text: new_text.slice(start, new_text.length - end),
+  };
+};
+
+const apply_patch = (text, patch) => {
+  const start = to_units(text, patch.start);
+  const end = start + to_units(text.slice(start), patch.end - patch.start);
+  return text.slice(0, start) + patch.text + text.slice(end);
+};
+
+class SyncState {
+  constructor(delta) {
+    this.__delta = delta;
+    this.reset();
+  }
+
+  reset() {
+    this.__version = 0;
+    this.__synced = '';
+    this.__sent = null;
+    this.__received = {};
+  }
+
+  send(code) {
+    this.__sent = code;
+
+    if (this.__delta)
+      socket.emit('sync_delta', { version: this.__version, ...diff(this.__synced, code) });
+    else
+      socket.emit('sync', code);
+  }
+
+  resync() {
+    this.__sent = editor.get_code();
+    socket.emit('sync', this.__sent);
+  }
+
+  acknowledge(version) {
+    if (this.__sent === null)
+      return;
+
+    this.__version = version;
+    this.__synced = this.__sent;
+    this.__sent = null;
+  }
+
+  receive(role, version, code) {
+    this.__received[role] = { version, code };
+  }
+
+  receive_patch(data) {
+    const { role, base, version } = data;
+    const current = this.__received[role] || { version: 0, code: '' };
+    if (current.version !== base)
+      return null;
+
+    const code = apply_patch(current.code, data);
+    this.__received[role] = { version, code };
+    return code;
+  }
+}
+
 class LeakDashboard {
   constructor(container) {
     this.__el = document.querySelector(container);
@@ -312,6 +426,8 @@ const editor = new Editor('#text-editor');
 const image_reference = new ImageReference('#ref-img', '#canvas-ref', '#magnifier', '#img-replicat');
 const replicat = document.querySelector('#img-replicat');
 const leak = new LeakDashboard('#leaks');
+const live_score = document.querySelector('#live-score');
+const sync_state = new SyncState(sync_btn.getAttribute('data-delta') === 'true');
 
 
 if (countdown.get_remaining_time() === 'xx:xx') {
@@ -320,25 +436,63 @@ if (countdown.get_remaining_time() === 'xx:xx') {
   image_reference.change_img_src('/static/logo.png');
 }
 
-socket.on('update', (data) => {
-  const { role, code } = data;
-
+const render_code = (role, code) => {
   if (role === ROLE_HTML)
     replicat.contentDocument.body.innerHTML = code;
   else if (role === ROLE_CSS)
     replicat.contentDocument.head.innerHTML = `<style>${code}</style>`;
+};
+
+socket.on('update', (data) => {
+  const { role, code, version } = data;
+
+  sync_state.receive(role, version, code);
+  render_code(role, code);
+});
+
+socket.on('update_delta', (data) => {
+  const code = sync_state.receive_patch(data);
+
+  if (code === null)
+    socket.emit('update_resync');
+  else
+    render_code(data.role, code);
+});
+
+socket.on('sync_ack', (data) => {
+  sync_state.acknowledge(data.version);
 });
 
+socket.on('resync', () => {
+  sync_state.resync();
+});
+
+
+const decode_leaks = async (data) => {
+  if (data.encoding !== 'deflate')
+    return data.leaks;
 
-socket.on('leak', (data) => {
-  const { code } = data;
+  const stream = new Blob([data.data]).stream().pipeThrough(new DecompressionStream('deflate'));
+  return JSON.parse(await new Response(stream).text());
+};
 
-  leak.append(countdown.get_remaining_time(), code);
+socket.on('leak_batch', async (data) => {
+  const leaks = await decode_leaks(data);
+  if (leaks.length === 0)
+    return;
+
+  leaks.forEach((code) => leak.append(countdown.get_remaining_time(), code));
 
   if (current_tab !== 'comm')
     comm_tab.classList.add('notification');
 });
 
+socket.on('score', (data) => {
+  const { score } = data;
+
+  live_score.innerText = `score: ${Math.round(score)}`;
+});
+
 socket.on('round_start', (data) => {
   const { round, end } = data;
 
@@ -346,10 +500,21 @@ socket.on('round_start', (data) => {
   countdown.set_end(+end);
   
   image_reference.set_image(round.image);
+  sync_state.reset();
   replicat.contentDocument.body.innerHTML = '';
   replicat.contentDocument.head.innerHTML = '';
 });
 
+socket.on('round_time', (data) => {
+  const { end, paused } = data;
+
+  if (paused) {
+    countdown.pause();
+  } else {
+    countdown.set_end(+end);
+  }
+});
+
 socket.on('round_end', (data) => {
   const { end } = data;
 
@@ -358,6 +523,8 @@ socket.on('round_end', (data) => {
   countdown.set_end(+end);
   editor.clear();
   leak.clear();
+  live_score.innerText = 'score: ????';
+  sync_state.reset();
   replicat.contentDocument.body.innerHTML = '';
   replicat.contentDocument.head.innerHTML = '';
 
@@ -371,7 +538,7 @@ document.querySelector('#sync').addEventListener('click', (e) => {
 
   e.target.disabled = true;
 
-  socket.emit('sync', editor.get_code());
+  sync_state.send(editor.get_code());
 
   setTimeout(() => {
     e.target.disabled = false;
@@ -0,0 +1,289 @@
+# Description:  This file contains the store of the submissions of the running round.
+# Path:         app/store.py
+# Author:       Capucinoxx
+# Date:         2024
+
+from typing import Any, Dict, Union
+
+from bson import ObjectId
+from eventlet.semaphore import Semaphore
+from flask import Flask
+
+from app.backend import backend
+from app.models import SubmissionType
+
+
+SUBMISSIONS_KEY = 'round:{}:submissions'
+# The round whose submissions are accepted, unset during the breaks
+OPEN_ROUND_KEY = 'round:open'
+
+
+class Record:
+  """
+    The latest code of a team, never modified once stored: an update stores a new record,
+    so a record can be read without holding any lock.
+  """
+  __slots__ = ('html', 'css', 'version')
+
+  def __init__(self, html: str = '', css: str = '', version: int = 0):
+    self.html = html
+    self.css = css
+    self.version = version
+
+
+  def replace(self, role: SubmissionType, content: str) -> 'Record':
+    if role == SubmissionType.HTML:
+      return Record(content, self.css, self.version + 1)
+    return Record(self.html, content, self.version + 1)
+
+
+  def to_dict(self) -> Dict[SubmissionType, str]:
+    return {SubmissionType.HTML: self.html, SubmissionType.CSS: self.css}
+
+
+
+EMPTY = Record()
+
+
+class Shard:
+  """
+    A part of the teams of a generation, with its own lock.
+  """
+  def __init__(self):
+    self.records: Dict[Any, Record] = {}
+    self.lock = Semaphore()
+    self.sealed = False
+
+
+
+class Generation:
+  """
+    The submissions of one round, split in shards by team. Once sealed, a generation
+    rejects the updates still in flight.
+  """
+  def __init__(self, round_number: Union[int, None], shards: int):
+    self.round_number = round_number
+    self.__shards = [Shard() for _ in range(shards)]
+
+
+  def shard(self, team_id: Any) -> Shard:
+    return self.__shards[hash(str(team_id)) % len(self.__shards)]
+
+
+  def collect(self) -> Dict[Any, Dict[SubmissionType, str]]:
+    """
+      Seals the generation, one shard at a time, and collects its submissions.
+
+      Returns:
+        Dict[Any, Dict[SubmissionType, str]]: The code of each role, keyed by team.
+    """
+    data = {}
+    for shard in self.__shards:
+      with shard.lock:
+        shard.sealed = True
+      data.update((team_id, record.to_dict()) for team_id, record in shard.records.items())
+    return data
+
+
+  def __len__(self) -> int:
+    return sum(len(shard.records) for shard in self.__shards)
+
+
+
+class ShardedSubmissionStore:
+  """
+    Keeps the submissions in the memory of the worker. The teams are spread over shards so
+    updates of different teams rarely wait on each other, and the end of a round swaps the
+    whole generation instead of copying it.
+  """
+  def __init__(self, shards: int):
+    self.__shards = shards
+    self.__generation = Generation(None, shards)
+
+
+  def put(self, round_number: int, team_id: Any, role: SubmissionType, content: str) -> Union[Record, None]:
+    generation = self.__generation
+    if generation.round_number != round_number:
+      return None
+
+    shard = generation.shard(team_id)
+    with shard.lock:
+      if shard.sealed:
+        return None
+      record = shard.records[team_id] = shard.records.get(team_id, EMPTY).replace(role, content)
+    return record
+
+
+  def get(self, round_number: int, team_id: Any) -> Record:
+    generation = self.__generation
+    if generation.round_number != round_number:
+      return EMPTY
+    return generation.shard(team_id).records.get(team_id, EMPTY)
+
+
+  def begin(self, round_number: int) -> None:
+    if self.__generation.round_number != round_number:
+      self.__generation = Generation(round_number, self.__shards)
+
+
+  def end(self, round_number: int) -> Generation:
+    generation, self.__generation = self.__generation, Generation(None, self.__shards)
+    return generation if generation.round_number == round_number else Generation(round_number, 1)
+
+
+  def stats(self) -> dict:
+    generation = self.__generation
+    return {'round': generation.round_number, 'teams': len(generation)}
+
+
+
+class BackendGeneration:
+  """
+    The submissions of one round stored in the shared backend.
+  """
+  def __init__(self, round_number: int):
+    self.round_number = round_number
+
+
+  def collect(self) -> Dict[Any, Dict[SubmissionType, str]]:
+    """
+      Takes the submissions of the round out of the backend.
+
+      Returns:
+        Dict[Any, Dict[SubmissionType, str]]: The code of each role, keyed by team.
+    """
+    data = {}
+    for field, content in backend.hdrain(SUBMISSIONS_KEY.format(self.round_number)).items():
+      team_id, role = field.rsplit(':', 1)
+      data.setdefault(ObjectId(team_id), {})[SubmissionType(role)] = content
+    return data
+
+
+
+class BackendSubmissionStore:
+  """
+    Keeps the submissions in the backend shared by the workers, one hash per round. The
+    open round is kept in the backend too, and checked by the same script that stores a
+    submission, so an update still in flight when its round ends is rejected.
+  """
+  def __init__(self):
+    self.__round_number = None
+
+
+  def put(self, round_number: int, team_id: Any, role: SubmissionType, content: str) -> Union[Record, None]:
+    key = SUBMISSIONS_KEY.format(round_number)
+    if not backend.hset_if(key, f'{team_id}:{role.value}', content, OPEN_ROUND_KEY, str(round_number)):
+      return None
+    return self.get(round_number, team_id)
+
+
+  def get(self, round_number: int, team_id: Any) -> Record:
+    html, css = backend.hmget(SUBMISSIONS_KEY.format(round_number), [
+      f'{team_id}:{SubmissionType.HTML.value}',
+      f'{team_id}:{SubmissionType.CSS.value}',
+    ])
+    return Record(html or '', css or '')
+
+
+  def begin(self, round_number: int) -> None:
+    self.__round_number = round_number
+    backend.set(OPEN_ROUND_KEY, str(round_number))
+
+
+  def end(self, round_number: int) -> BackendGeneration:
+    self.__round_number = None
+    # Closed before the generation is drained, so no submission lands after the drain
+    backend.release(OPEN_ROUND_KEY, str(round_number))
+    return BackendGeneration(round_number)
+
+
+  def stats(self) -> dict:
+    return {'round': self.__round_number}
+
+
+
+class SubmissionStore:
+  """
+    The submissions of the running round: in the memory of the worker, or in the backend
+    when it is shared by the workers.
+  """
+  def __init__(self):
+    self.__store: Union[ShardedSubmissionStore, BackendSubmissionStore] = ShardedSubmissionStore(64)
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the SubmissionStore with the configurations of the Flask app, after the
+      backend.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    if backend.shared:
+      self.__store = BackendSubmissionStore()
+    else:
+      self.__store = ShardedSubmissionStore(app.config.get('SUBMISSION_SHARDS', 64))
+
+
+  def put(self, round_number: int, team_id: Any, role: SubmissionType, content: str) -> Union[Record, None]:
+    """
+      Stores the code of a role of a team.
+
+      Args:
+        round_number (int): The number of the round of the submission.
+        team_id (Any): The ID of the team.
+        role (SubmissionType): The role of the code.
+        content (str): The code.
+
+      Returns:
+        Union[Record, None]: The code of the team, or None if the round is over.
+    """
+    return self.__store.put(round_number, team_id, role, content)
+
+
+  def get(self, round_number: int, team_id: Any) -> Record:
+    """
+      Retrieves the code of a team.
+
+      Args:
+        round_number (int): The number of the round.
+        team_id (Any): The ID of the team.
+
+      Returns:
+        Record: The code of the team, empty if the team did not submit.
+    """
+    return self.__store.get(round_number, team_id)
+
+
+  def begin(self, round_number: int) -> None:
+    """
+      Starts accepting the submissions of a round, keeping them if the round was already
+      started.
+
+      Args:
+        round_number (int): The number of the round.
+    """
+    self.__store.begin(round_number)
+
+
+  def end(self, round_number: int) -> Union[Generation, BackendGeneration]:
+    """
+      Stops accepting the submissions of a round, in constant time: the generation of the
+      round is swapped out rather than copied.
+
+      Args:
+        round_number (int): The number of the round.
+
+      Returns:
+        Union[Generation, BackendGeneration]: The generation of the round, whose `collect`
+                                              seals it and returns its submissions.
+    """
+    return self.__store.end(round_number)
+
+
+  def stats(self) -> dict:
+    return self.__store.stats()
+
+
+
+submission_store = SubmissionStore()
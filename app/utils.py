@@ -4,16 +4,15 @@
 # Date:         2024
 
 import csv
-import logging
-import re
 from typing import Any
 
 import eventlet
 import numpy as np
-from bs4 import BeautifulSoup
 from eventlet.semaphore import Semaphore
 
 from app.cmd.app import app
+from app.logs import BufferedLogWriter
+from app.sanitizer import sanitize_css, sanitize_html
 
 
 def cleanup_html(html: str) -> str:
@@ -26,28 +25,15 @@ def cleanup_html(html: str) -> str:
     List of attributes to remove:
     ['style', 'background', 'src', 'href']
 
+    The content is sanitized in a single streaming pass, see `app.sanitizer.HTMLSanitizer`.
+
     Args:
       html (str): The HTML content to clean.
 
     Returns:
       str: The cleaned HTML content.
   """
-  soup = BeautifulSoup(html, 'lxml')
-
-  tags_to_remove = ['script', 'iframe', 'link', 'img', 'style', 'embed', 'object']
-  for tag in tags_to_remove:
-    for elem in soup.find_all(tag):
-      elem.decompose()
-
-  attributes_to_remove = ['style', 'background', 'src', 'href']
-  for tag in soup.find_all():
-    for attr in attributes_to_remove:
-      del tag[attr]
-
-  if soup.body:
-    return ''.join(str(tag) for tag in soup.body.contents)
-  else:
-    return str(soup)
+  return sanitize_html(html)
 
 
 
@@ -55,20 +41,16 @@ def cleanup_css(css: str) -> str:
   """
     Cleans up the provided CSS content by removing imports, URLs, and expressions.
 
+    The markup and the forbidden rules are each removed in a single linear scan, see
+    `app.sanitizer.CSSSanitizer`.
+
     Args:
       css (str): The CSS content to clean.
 
     Returns:
       str: The cleaned CSS content.
   """
-  soup = BeautifulSoup(css, "lxml")
-  cleaned_css = soup.get_text()
-    
-  cleaned_css = re.sub(r'(?i)@import.*?;', '', cleaned_css)
-  cleaned_css = re.sub(r'(?i)url\(.*?\)', '', cleaned_css)
-  cleaned_css = re.sub(r'(?i)expression\(.*?\)', '', cleaned_css)
-
-  return cleaned_css
+  return sanitize_css(css)
 
 
 
@@ -190,25 +172,13 @@ class CDict:
 
 class Logger:
   """
-    A thread-safe logger that logs messages to both the console and a file.
+    A non-blocking logger that logs messages to both the console and a file. The records
+    are buffered and written in batches, see `app.logs.BufferedLogWriter`.
   """
-  def __init__(self, name: str, filename: str):
-    self.__lock = Semaphore() 
-
-    self.__logger = logging.getLogger(name)
-    self.__logger.setLevel(logging.DEBUG)
+  def __init__(self, name: str, filename: str, **options: Any):
+    self.__writer = BufferedLogWriter(filename, **options)
 
-    formatter = logging.Formatter('[%(asctime)s] %(message)s')
 
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    self.__logger.addHandler(stream_handler)
-
-    file_handler = logging.FileHandler(filename, mode='a')
-    file_handler.setFormatter(formatter)
-    self.__logger.addHandler(file_handler)
-
-    
   def submission(self, round_id: int, team_id: int, role: str, message: str) -> None:
     """
       Logs a formatted submission message.
@@ -220,19 +190,34 @@ class Logger:
         message (str): The message to log.
     """
     message = message.replace('\n', '\\n').replace('\r', '\\r')
-    with self.__lock:
-      self.__logger.info(f'[{round_id}{team_id}] {role}: {message}')
+    self.__writer.append(f'[{round_id}{team_id}] {role}: {message}')
 
-    
-    def log(self, message: str) -> None:
-      """
-        Logs a message.
 
-        Args:
-          message (str): The message to log.
-      """
-      with self.__lock:
-        self.__logger.info(message)
+  def log(self, message: str) -> None:
+    """
+      Logs a message.
+
+      Args:
+        message (str): The message to log.
+    """
+    self.__writer.append(message)
+
+
+  def close(self) -> None:
+    """
+      Writes the buffered messages and closes the file.
+    """
+    self.__writer.close()
+
+
+  def stats(self) -> dict:
+    """
+      Returns the counters of the logger.
+
+      Returns:
+        dict: The pending, written and dropped records of the logger.
+    """
+    return self.__writer.stats()
 
 
 
@@ -265,4 +250,10 @@ def consum_creds(path: str) -> dict:
 
 
 
-logger = Logger('round_manager', app.config.get('LOG_FILE', 'round_manager.log'))
+logger = Logger('round_manager', app.config.get('LOG_FILE', 'round_manager.log'),
+                capacity=app.config.get('LOG_BUFFER_SIZE', 16 * 1024 * 1024),
+                flush_interval=app.config.get('LOG_FLUSH_INTERVAL', 1),
+                max_bytes=app.config.get('LOG_MAX_BYTES', 0),
+                rotate_interval=app.config.get('LOG_ROTATE_INTERVAL', 0),
+                backup_count=app.config.get('LOG_BACKUP_COUNT', 10),
+                compression=app.config.get('LOG_COMPRESSION', 'gzip'))
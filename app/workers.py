@@ -0,0 +1,132 @@
+# Description:  This file contains the worker pool sanitizing the synced code off the eventlet hub.
+# Path:         app/workers.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import time
+from typing import Any, Callable, Dict, Tuple
+
+import eventlet
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+from flask import Flask
+
+from app.cmd.app import app
+from app.metrics import metrics
+from app.models import SubmissionType
+from app.utils import cleanup_html, cleanup_css
+
+
+class SanitizerPool:
+  """
+    Sanitizes the synced code in native threads, so a large paste does not block the
+    other clients on the eventlet hub.
+
+    The jobs of a user are processed one at a time and in order. A user has at most one
+    job waiting: a newer sync replaces the waiting code, which is stale by then. When
+    the number of users waiting reaches the queue depth, new jobs are rejected.
+  """
+  def __init__(self):
+    self.__pending: Dict[Any, Tuple[SubmissionType, str, Callable[[str], None]]] = {}
+    self.__running = set()
+    self.__lock = Semaphore()
+    self.__slots = Semaphore(4)
+    self.__max_depth = 256
+
+    self.processed = 0
+    self.dropped = 0
+    self.rejected = 0
+    self.failed = 0
+
+
+  def init_app(self, app: Flask) -> None:
+    """
+      Initializes the SanitizerPool with the configurations of the Flask app.
+
+      Args:
+        app (Flask): The Flask app instance.
+    """
+    self.__slots = Semaphore(app.config.get('SANITIZE_WORKERS', 4))
+    self.__max_depth = app.config.get('SANITIZE_QUEUE_DEPTH', 256)
+
+
+  def submit(self, key: Any, role: SubmissionType, code: str, callback: Callable[[str], None]) -> bool:
+    """
+      Queues the code of a user, replacing the code of the user not sanitized yet.
+
+      Args:
+        key (Any): The identifier of the user, ordering the jobs.
+        role (SubmissionType): The type of the code.
+        code (str): The raw code.
+        callback (Callable[[str], None]): Called on the hub with the sanitized code.
+
+      Returns:
+        bool: False if the job was rejected because the queue is full.
+    """
+    with self.__lock:
+      if key in self.__pending:
+        self.__pending[key] = (role, code, callback)
+        self.dropped += 1
+        return True
+
+      if len(self.__pending) >= self.__max_depth:
+        self.rejected += 1
+        return False
+
+      self.__pending[key] = (role, code, callback)
+      if key in self.__running:
+        return True
+      self.__running.add(key)
+
+    eventlet.spawn(self.__serve, key)
+    return True
+
+
+  def stats(self) -> dict:
+    """
+      Returns the counters of the pool.
+
+      Returns:
+        dict: The waiting and running jobs, and the processed, dropped and rejected jobs.
+    """
+    with self.__lock:
+      return {
+        'pending': len(self.__pending),
+        'running': len(self.__running),
+        'processed': self.processed,
+        'dropped': self.dropped,
+        'rejected': self.rejected,
+        'failed': self.failed,
+      }
+
+
+  def __serve(self, key: Any) -> None:
+    """
+      Sanitizes the waiting jobs of a user until there are none left.
+
+      Args:
+        key (Any): The identifier of the user.
+    """
+    while True:
+      with self.__lock:
+        job = self.__pending.pop(key, None)
+        if job is None:
+          self.__running.discard(key)
+          return
+
+      role, code, callback = job
+      cleanup = cleanup_html if role == SubmissionType.HTML else cleanup_css
+      try:
+        with self.__slots:
+          started = time.perf_counter()
+          code = tpool.execute(cleanup, code)
+          metrics.observe('sanitize_seconds', (role.value,), time.perf_counter() - started)
+        callback(code)
+        self.processed += 1
+      except Exception as e:
+        self.failed += 1
+        app.logger.warning(f'Unable to sanitize the code of {key}: {e!r}')
+
+
+
+sanitizer_pool = SanitizerPool()
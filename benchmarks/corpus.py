@@ -0,0 +1,102 @@
+# Description:  This file contains the corpus of submissions used by the micro-benchmarks.
+# Path:         benchmarks/corpus.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import random
+from typing import Dict, List, Tuple
+
+# Bumped whenever the generated corpus changes, so results of different corpora are not compared
+VERSION = 1
+
+SEED = 20240
+
+
+def html_document(rng: random.Random, size: int, depth: int = 8) -> str:
+  """
+    Generates nested HTML like a contest submission, of about `size` characters.
+  """
+  parts, open_tags = [], []
+  tags = ['div', 'span', 'section', 'p', 'ul', 'li', 'article']
+  while sum(map(len, parts)) < size:
+    roll = rng.random()
+    if len(open_tags) < depth and roll < 0.55:
+      tag = rng.choice(tags)
+      parts.append(f'<{tag} class="c{rng.randrange(64)}" id="e{rng.randrange(1 << 16)}">')
+      open_tags.append(tag)
+    elif open_tags and roll < 0.8:
+      parts.append(f'</{open_tags.pop()}>')
+    else:
+      parts.append(f'{rng.randrange(1 << 24):x} ')
+  parts.extend(f'</{tag}>' for tag in reversed(open_tags))
+  return ''.join(parts)
+
+
+
+def css_document(rng: random.Random, size: int) -> str:
+  """
+    Generates CSS like a contest submission, of about `size` characters.
+  """
+  parts = []
+  while sum(map(len, parts)) < size:
+    selector = rng.choice(['.c{}', '#e{}', 'div > .c{}', '.c{}:hover', '.c{}::before'])
+    parts.append(
+      f'{selector.format(rng.randrange(64))} {{\n'
+      f'  width: {rng.randrange(400)}px;\n'
+      f'  height: {rng.randrange(300)}px;\n'
+      f'  background: linear-gradient({rng.randrange(360)}deg, #{rng.randrange(1 << 24):06x}, #{rng.randrange(1 << 24):06x});\n'
+      f'  transform: rotate({rng.randrange(360)}deg) translate({rng.randrange(-50, 50)}px, {rng.randrange(-50, 50)}px);\n'
+      f'  border-radius: {rng.randrange(50)}% {rng.randrange(50)}%;\n'
+      f'}}\n'
+    )
+  return ''.join(parts)
+
+
+
+def adversarial_html(rng: random.Random) -> Dict[str, str]:
+  """
+    Generates HTML inputs exercising the edge cases of the sanitizer.
+  """
+  return {
+    'html/deep-nesting': '<div>' * 2000 + 'x' + '</div>' * 2000,
+    'html/unclosed': ''.join(f'<div class="c{i}"><span>' for i in range(2000)),
+    'html/stray-end-tags': '</div></span></p>' * 2000 + '<p>x</p>',
+    'html/attributes': '<div ' + ' '.join(f'data-a{i}="{"x" * 20}"' for i in range(2000)) + '></div>',
+    'html/scripts': ''.join(f'<script>alert({i})</script><style>.c{i} {{}}</style><p>{i}</p>' for i in range(1000)),
+    'html/entities': '&amp;&lt;&gt;&#x1F600;&nbsp;' * 4000,
+    'html/astral': ''.join(chr(0x1F600 + rng.randrange(64)) for _ in range(20000)),
+  }
+
+
+
+def adversarial_css(rng: random.Random) -> Dict[str, str]:
+  """
+    Generates CSS inputs exercising the edge cases of the sanitizer.
+  """
+  return {
+    'css/imports': ''.join(f'@import "a{i}.css";\n.c{i} {{ color: red; }}\n' for i in range(2000)),
+    'css/urls': ''.join(f'.c{i} {{ background: url("http://x/{i}.png"); color: expression(alert({i})); }}\n' for i in range(2000)),
+    'css/comments': '/*' + '*' * 50000 + '*/' + '.c { color: red; }' + '/* unterminated',
+    'css/escapes': ''.join(f'.c{i} {{ content: "\\{i:x} \\"</style>"; }}\n' for i in range(3000)),
+    'css/html-injection': ''.join(f'.c{i} {{ color: red; }}</style><script>x</script><style>\n' for i in range(2000)),
+    'css/single-line': ''.join(f'.c{rng.randrange(64)}{{width:{i}px}}' for i in range(10000)),
+  }
+
+
+
+def build() -> List[Tuple[str, str, str]]:
+  """
+    Builds the corpus, the same for a given VERSION.
+
+    Returns:
+      List[Tuple[str, str, str]]: The name, the kind ('html' or 'css') and the content of each case.
+  """
+  rng = random.Random(SEED)
+  cases = []
+  for name, size in [('tiny', 64), ('small', 2 * 1024), ('medium', 20 * 1024), ('large', 200 * 1024)]:
+    cases.append((f'html/{name}', 'html', html_document(rng, size)))
+    cases.append((f'css/{name}', 'css', css_document(rng, size)))
+
+  cases.extend((name, 'html', content) for name, content in adversarial_html(rng).items())
+  cases.extend((name, 'css', content) for name, content in adversarial_css(rng).items())
+  return cases
@@ -0,0 +1,384 @@
+# Description:  This file contains the Socket.IO load benchmark of the app.
+# Path:         benchmarks/load.py
+# Author:       Capucinoxx
+# Date:         2024
+
+"""
+  Starts the app against mongomock in a subprocess, then simulates teams of two users
+  syncing their code at a fixed rate, with patches like the editor in its default delta
+  sync mode or with whole documents, and measures:
+
+    - the latency between a `sync` and the `update` received by the teammate,
+    - the time for a `leak_batch` to reach every client,
+    - the time for a `round_start` to reach every client.
+
+  Usage:
+    python benchmarks/load.py --teams 20 --rate 2 --size 4096 --duration 30 --output load.json
+    python benchmarks/load.py --sync full
+    python benchmarks/load.py --baseline load.json --threshold 0.2
+"""
+
+import argparse
+import hashlib
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from typing import Any, Dict, List, Tuple
+
+import socketio
+
+from results import check, commit, summarize, write
+
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+# Last lines of the standard error of the server kept in the report, and their length
+SERVER_LOG_LINES = 100
+SERVER_LOG_WIDTH = 300
+
+
+def login(url: str, username: str, password: str) -> str:
+  """
+    Logs a user in through `/login`.
+
+    Returns:
+      str: The cookie header of the session.
+  """
+  cookies = http.cookiejar.CookieJar()
+  opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+  opener.open(f'{url}/login', urllib.parse.urlencode({'username': username, 'password': password}).encode())
+  return '; '.join(f'{cookie.name}={cookie.value}' for cookie in cookies)
+
+
+
+def generate_code(rng: random.Random, size: int) -> Tuple[str, str]:
+  """
+    Generates the HTML and the CSS of a submission of about `size` characters each,
+    nested like the submissions of a contest.
+  """
+  html, depth = [], 0
+  while sum(map(len, html)) < size:
+    if depth < 8 and rng.random() < 0.6:
+      html.append(f'<div class="c{rng.randrange(64)}">')
+      depth += 1
+    elif depth:
+      html.append('</div>')
+      depth -= 1
+    else:
+      html.append(f'<p class="c{rng.randrange(64)}">{rng.randrange(1 << 20):x}</p>')
+  html.extend('</div>' for _ in range(depth))
+
+  css = []
+  while sum(map(len, css)) < size:
+    css.append(f'.c{rng.randrange(64)} {{ width: {rng.randrange(400)}px; height: {rng.randrange(300)}px; '
+               f'background: #{rng.randrange(1 << 24):06x}; border-radius: {rng.randrange(50)}%; }}\n')
+  return ''.join(html), ''.join(css)
+
+
+
+def diff(old: str, new: str) -> dict:
+  """
+    Returns the patch of a `sync_delta` event replacing the span of `old` which differs
+    from `new`, like the editor does.
+  """
+  limit = min(len(old), len(new))
+  start = 0
+  while start < limit and old[start] == new[start]:
+    start += 1
+
+  end = 0
+  while end < limit - start and old[len(old) - end - 1] == new[len(new) - end - 1]:
+    end += 1
+  return {'start': start, 'end': len(old) - end, 'text': new[start:len(new) - end]}
+
+
+
+class Matcher:
+  """
+    Pairs each acknowledged sync with the first update received by the teammate. The
+    update may be received before the acknowledgement.
+  """
+  def __init__(self):
+    self.__sent: Dict[Tuple, Tuple[str, float]] = {}
+    self.__received: Dict[Tuple, List[Tuple[str, float]]] = {}
+    self.__lock = threading.Lock()
+    self.latencies: List[float] = []
+
+
+  def sent(self, key: Tuple, sender: str, at: float) -> None:
+    with self.__lock:
+      for receiver, received_at in self.__received.pop(key, []):
+        if receiver != sender:
+          self.latencies.append(received_at - at)
+          return
+      self.__sent[key] = (sender, at)
+
+
+  def received(self, key: Tuple, receiver: str, at: float) -> None:
+    with self.__lock:
+      sent = self.__sent.get(key)
+      if sent is None:
+        self.__received.setdefault(key, []).append((receiver, at))
+      elif sent[0] != receiver:
+        del self.__sent[key]
+        self.latencies.append(at - sent[1])
+
+
+
+class SimulatedUser:
+  """
+    A user connected with a Socket.IO client, recording the events it receives. In delta
+    mode, it follows the protocol of the editor: the patches are against the last
+    acknowledged document, and the whole document is sent again when the server asks.
+  """
+  def __init__(self, username: str, team: str, benchmark: 'Benchmark', delta: bool):
+    self.username = username
+    self.team = team
+    self.benchmark = benchmark
+    self.delta = delta
+    self.client = socketio.Client(reconnection=False)
+    self.pending: List[float] = []
+    self.lock = threading.Lock()
+    self.sent = 0
+    self.resyncs = 0
+    self.code = ''
+    self.version = 0
+    self.synced = ''
+    self.unacknowledged = None
+
+    self.client.on('sync_ack', self.on_sync_ack)
+    self.client.on('resync', self.on_resync)
+    self.client.on('update', self.on_update)
+    self.client.on('update_delta', self.on_update)
+    self.client.on('round_start', self.on_round_start)
+    self.client.on('leak_batch', self.on_leak_batch)
+
+
+  def connect(self, url: str, cookie: str) -> None:
+    self.client.connect(url, headers={'Cookie': cookie}, transports=['websocket'])
+
+
+  def sync(self, code: str) -> None:
+    with self.lock:
+      self.pending.append(time.perf_counter())
+      self.sent += 1
+      self.code = self.unacknowledged = code
+      version, synced = self.version, self.synced
+
+    if self.delta:
+      self.client.emit('sync_delta', {'version': version, **diff(synced, code)})
+    else:
+      self.client.emit('sync', code)
+
+
+  def on_sync_ack(self, data: dict) -> None:
+    with self.lock:
+      at = self.pending.pop(0) if self.pending else None
+      if self.unacknowledged is not None:
+        self.version, self.synced = data['version'], self.unacknowledged
+        self.unacknowledged = None
+    if at is not None:
+      self.benchmark.updates.sent((self.team, data['role'], data['version']), self.username, at)
+
+
+  def on_resync(self, data: dict) -> None:
+    with self.lock:
+      self.pending.append(time.perf_counter())
+      self.resyncs += 1
+      self.unacknowledged = code = self.code
+    self.client.emit('sync', code)
+
+
+  def on_update(self, data: dict) -> None:
+    self.benchmark.updates.received((self.team, data['role'], data['version']), self.username, time.perf_counter())
+
+
+  def on_round_start(self, data: dict) -> None:
+    self.benchmark.record('round_start', None, time.perf_counter())
+
+
+  def on_leak_batch(self, data: dict) -> None:
+    payload = data.get('data') or json.dumps(data.get('leaks')).encode()
+    self.benchmark.record('leak_batch', hashlib.sha1(payload).hexdigest(), time.perf_counter())
+
+
+
+class Benchmark:
+  """
+    Runs the load benchmark against a server started in a subprocess.
+  """
+  def __init__(self, args: argparse.Namespace):
+    self.args = args
+    self.url = f'http://127.0.0.1:{args.port}'
+    self.updates = Matcher()
+    self.events: Dict[Tuple[str, Any], List[float]] = {}
+    self.lock = threading.Lock()
+    self.users: List[SimulatedUser] = []
+    self.server = None
+    self.server_log = tempfile.TemporaryFile(mode='w+')
+
+
+  def record(self, event: str, key: Any, at: float) -> None:
+    with self.lock:
+      self.events.setdefault((event, key), []).append(at)
+
+
+  def start_server(self) -> None:
+    command = [sys.executable, SERVER, '--port', str(self.args.port), '--teams', str(self.args.teams),
+               '--password', self.args.password, '--sync', self.args.sync]
+
+    self.server = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=self.server_log, text=True)
+    for line in self.server.stdout:
+      if line.startswith('listening on'):
+        break
+    else:
+      self.server.wait()
+      raise RuntimeError('The server exited before listening:\n' + '\n'.join(self.server_errors()))
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+      try:
+        socket.create_connection(('127.0.0.1', self.args.port), timeout=1).close()
+        return
+      except OSError:
+        time.sleep(0.1)
+    raise RuntimeError('The server is not accepting connections')
+
+
+  def connect(self) -> socketio.Client:
+    admin = socketio.Client(reconnection=False)
+    admin.connect(self.url, headers={'Cookie': login(self.url, 'admin', 'SUPER_STRONG_PASSWORD')}, transports=['websocket'])
+
+    for i in range(self.args.teams):
+      for number in (1, 2):
+        user = SimulatedUser(f'team{i}_{number}', f'team{i}', self, self.args.sync == 'delta')
+        user.connect(self.url, login(self.url, user.username, self.args.password))
+        self.users.append(user)
+    return admin
+
+
+  def start_round(self) -> float:
+    """
+      Starts the first round from the admin route, and waits for every client to receive it.
+
+      Returns:
+        float: The time at which the round was started.
+    """
+    admin_cookie = login(self.url, 'admin', 'SUPER_STRONG_PASSWORD')
+    request = urllib.request.Request(f'{self.url}/admin/start', headers={'Cookie': admin_cookie})
+    started = time.perf_counter()
+    urllib.request.urlopen(request).read()
+
+    deadline = started + 10
+    while time.perf_counter() < deadline and len(self.events.get(('round_start', None), [])) < len(self.users):
+      time.sleep(0.01)
+    return started
+
+
+  def load(self, user: SimulatedUser, seed: int) -> None:
+    """
+      Syncs the code of a user at the configured rate, changing a few characters each time
+      as if the user was typing.
+    """
+    rng = random.Random(seed)
+    html, css = generate_code(rng, self.args.size)
+    interval = 1 / self.args.rate
+    deadline = time.perf_counter() + self.args.duration
+    next_sync = time.perf_counter() + rng.random() * interval
+
+    while next_sync < deadline:
+      time.sleep(max(0, next_sync - time.perf_counter()))
+      code = html if int(user.username[-1]) % 2 else css
+      position = rng.randrange(len(code))
+      user.sync(f'{code[:position]}{rng.randrange(10)}{code[position:]}')
+      next_sync += interval
+
+
+  def run(self) -> dict:
+    self.start_server()
+    try:
+      admin = self.connect()
+      started = self.start_round()
+
+      threads = [threading.Thread(target=self.load, args=(user, i)) for i, user in enumerate(self.users)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      time.sleep(self.args.drain)
+
+      for user in self.users:
+        user.client.disconnect()
+      admin.disconnect()
+    finally:
+      self.server.terminate()
+      self.server.wait()
+
+    return self.report(started)
+
+
+  def server_errors(self) -> List[str]:
+    """
+      Returns the last lines written by the server to its standard error.
+    """
+    self.server_log.seek(0)
+    return [line.rstrip('\n')[:SERVER_LOG_WIDTH] for line in self.server_log.readlines()[-SERVER_LOG_LINES:]]
+
+
+  def report(self, started: float) -> dict:
+    round_start = [at - started for at in self.events.get(('round_start', None), [])]
+    fanouts = [max(times) - min(times) for (event, _), times in self.events.items() if event == 'leak_batch']
+    sent = sum(user.sent for user in self.users)
+
+    to_ms = lambda values: [value * 1000 for value in values]
+    return {
+      'commit': commit(),
+      'config': {key: value for key, value in vars(self.args).items() if key not in ('output', 'baseline', 'password')},
+      'metrics': {
+        'sync_update_latency_ms': summarize(to_ms(self.updates.latencies)),
+        'leak_fanout_ms': summarize(to_ms(fanouts)),
+        'round_start_broadcast_ms': summarize(to_ms(round_start)),
+      },
+      'syncs': {
+        'sent': sent,
+        'matched': len(self.updates.latencies),
+        'rate': sent / self.args.duration,
+        'resyncs': sum(user.resyncs for user in self.users),
+      },
+      'server_stderr': self.server_errors(),
+    }
+
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description='Measures the latency of the app under a simulated load.')
+  parser.add_argument('--teams', type=int, default=10, help='number of simulated teams of two users')
+  parser.add_argument('--rate', type=float, default=1, help='syncs per second of each user')
+  parser.add_argument('--size', type=int, default=4096, help='approximate size of the synced code')
+  parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+  parser.add_argument('--drain', type=float, default=2, help='seconds waited for the last updates')
+  parser.add_argument('--sync', choices=('delta', 'full'), default='delta',
+                      help='sync mode of the server and of the clients, patches or whole documents')
+  parser.add_argument('--port', type=int, default=5055)
+  parser.add_argument('--password', default='benchmark')
+  parser.add_argument('--output', help='file of the JSON results, the standard output by default')
+  parser.add_argument('--baseline', help='JSON results to compare with, failing on a regression')
+  parser.add_argument('--threshold', type=float, default=0.2, help='tolerated relative regression of the p50 and p99')
+  args = parser.parse_args()
+
+  results = Benchmark(args).run()
+  write(results, args.output)
+  check(results['metrics'], args.baseline, args.threshold, {'p50': 'lower', 'p99': 'lower'})
+
+
+
+if __name__ == '__main__':
+  main()
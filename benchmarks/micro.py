@@ -0,0 +1,232 @@
+# Description:  This file contains the micro-benchmarks of the hot functions of the app.
+# Path:         benchmarks/micro.py
+# Author:       Capucinoxx
+# Date:         2024
+
+"""
+  Measures the throughput and the peak memory of the sanitizers, of the submission
+  store, of the submission log, of the persistence of a round and of the round
+  transitions, over the corpus of `benchmarks/corpus.py`.
+
+  Usage:
+    python benchmarks/micro.py --output micro.json
+    python benchmarks/micro.py --baseline micro.json --threshold 0.2
+    python benchmarks/micro.py --only sanitizers persistence
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eventlet
+import mongoengine
+
+from app.cmd.app import app
+
+import corpus
+from results import check, commit, write
+
+
+FOLDER = tempfile.mkdtemp(prefix='art-forgery-micro-')
+app.config['LOG_FILE'] = os.path.join(FOLDER, 'round_manager.log')
+app.config['JOURNAL_FILE'] = None
+
+
+def measure(func: Callable[[], Any], size: int, min_time: float) -> Dict[str, float]:
+  """
+    Measures a function: its throughput over at least `min_time` seconds, then the peak
+    memory and the allocations of a single call under tracemalloc.
+
+    Args:
+      func (Callable[[], Any]): The measured call.
+      size (int): The bytes processed by a call, for the bandwidth.
+      min_time (float): The minimum duration of the throughput measure.
+
+    Returns:
+      Dict[str, float]: The calls per second, the MB per second, and the peak and
+                        allocated KB of a call.
+  """
+  func()
+
+  calls, started = 0, time.perf_counter()
+  elapsed = 0
+  while elapsed < min_time:
+    func()
+    calls += 1
+    elapsed = time.perf_counter() - started
+
+  tracemalloc.start()
+  before = tracemalloc.take_snapshot()
+  func()
+  _, peak = tracemalloc.get_traced_memory()
+  allocated = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename') if stat.size_diff > 0)
+  tracemalloc.stop()
+
+  return {
+    'ops_per_s': calls / elapsed,
+    'mb_per_s': calls * size / elapsed / 1e6,
+    'peak_kb': peak / 1024,
+    'allocated_kb': allocated / 1024,
+  }
+
+
+
+def sanitizers(cases: list, min_time: float) -> Dict[str, dict]:
+  from app.utils import cleanup_css, cleanup_html
+
+  results = {}
+  for name, kind, content in cases:
+    func = cleanup_html if kind == 'html' else cleanup_css
+    results[f'{func.__name__}/{name}'] = measure(lambda: func(content), len(content.encode()), min_time)
+  return results
+
+
+
+def submission_store(cases: list, min_time: float) -> Dict[str, dict]:
+  """
+    Measures the updates of the submission store by 200 teams, the successor of
+    `CDict.update_dict_value`.
+  """
+  from app.models import SubmissionType
+  from app.store import ShardedSubmissionStore
+
+  store = ShardedSubmissionStore(64)
+  store.begin(0)
+  codes = [content for _, _, content in cases[:8]]
+  state = {'i': 0}
+
+  def update() -> None:
+    for team in range(200):
+      state['i'] += 1
+      store.put(0, team, SubmissionType.HTML if team % 2 else SubmissionType.CSS, codes[state['i'] % len(codes)])
+
+  return {'submission_store/put-200-teams': measure(update, 0, min_time)}
+
+
+
+def submission_log(cases: list, min_time: float) -> Dict[str, dict]:
+  """
+    Measures `Logger.submission`, the records being queued to a file without echo.
+  """
+  from app.utils import Logger
+
+  logger = Logger('benchmark', os.path.join(FOLDER, 'submissions.log'), stream=False)
+  results = {}
+  for name, _, content in cases:
+    if name.endswith(('/tiny', '/medium', '/large')):
+      results[f'logger_submission/{name}'] = measure(lambda: logger.submission(1, 'team', 'html', content), len(content.encode()), min_time)
+  logger.close()
+  return results
+
+
+
+def persistence(cases: list, min_time: float) -> Dict[str, dict]:
+  """
+    Measures `persist_sumbissions` of a round of 50 teams against mongomock, persisting
+    the same round again each time.
+  """
+  from app.models import SubmissionType, Team, persist_sumbissions
+
+  mongoengine.connect('micro', host='mongomock://localhost', alias='default')
+  teams = [Team(name=f'team{i}').save().id for i in range(50)]
+  html = dict((name, content) for name, kind, content in cases if kind == 'html')
+  css = dict((name, content) for name, kind, content in cases if kind == 'css')
+
+  results = {}
+  for size in ('small', 'medium'):
+    data = {team: {SubmissionType.HTML: html[f'html/{size}'] + str(i), SubmissionType.CSS: css[f'css/{size}']}
+            for i, team in enumerate(teams)}
+    total = sum(len(code.encode()) for codes in data.values() for code in codes.values())
+    results[f'persist_sumbissions/50-teams-{size}'] = measure(lambda: persist_sumbissions(0, data), total, min_time)
+  return results
+
+
+
+def round_transitions(cases: list, min_time: float) -> Dict[str, dict]:
+  """
+    Measures the transitions of a simulated game of 40 rounds on a virtual clock, with
+    the persistence and the scoring of the rounds left out.
+  """
+  from app.models import Challenge
+  import app.round_manager as round_manager_module
+  from app.scheduler import VirtualClock
+
+  png = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', 8, 8) + b'\x08\x02\x00\x00\x00'
+  mongoengine.connect('micro', host='mongomock://localhost', alias='default')
+  Challenge.objects.delete()
+  for i in range(40):
+    Challenge(_id=i + 1, name=f'challenge{i}', image=png).save()
+
+  class Socket:
+    def __init__(self):
+      self.events = 0
+
+    def emit(self, *args: Any, **kwargs: Any) -> None:
+      self.events += 1
+
+  round_manager_module.persist_sumbissions = lambda *args: None
+  round_manager_module.evaluate_round = lambda *args: None
+  manager, socket = round_manager_module.RoundManager(), Socket()
+  manager.init_app(app, socket, VirtualClock())
+
+  started = time.perf_counter()
+  manager.start()
+  while socket.events < 2 * 40 + 1:
+    eventlet.sleep(0)
+  elapsed = time.perf_counter() - started
+  manager.stop()
+
+  return {'round_manager/transitions': {'ops_per_s': 2 * 40 / elapsed}}
+
+
+
+BENCHMARKS: Dict[str, Callable[[list, float], Dict[str, dict]]] = {
+  'sanitizers': sanitizers,
+  'submission_store': submission_store,
+  'submission_log': submission_log,
+  'persistence': persistence,
+  'round_transitions': round_transitions,
+}
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description='Runs the micro-benchmarks over the submission corpus.')
+  parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds measured per case')
+  parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='only runs these benchmarks')
+  parser.add_argument('--output', help='file of the JSON results, the standard output by default')
+  parser.add_argument('--baseline', help='JSON results to compare with, failing on a regression')
+  parser.add_argument('--threshold', type=float, default=0.2, help='tolerated relative regression')
+  args = parser.parse_args()
+
+  if args.baseline is not None:
+    with open(args.baseline) as f:
+      if json.load(f).get('corpus') != corpus.VERSION:
+        sys.exit(f'{args.baseline} was measured on another version of the corpus')
+
+  cases = corpus.build()
+  metrics: Dict[str, dict] = {}
+  for name, benchmark in BENCHMARKS.items():
+    if args.only is not None and name not in args.only:
+      continue
+
+    for case, result in benchmark(cases, args.min_time).items():
+      metrics[case] = result
+      print(f'{case:60} {result["ops_per_s"]:12.1f} ops/s {result.get("mb_per_s", 0):9.2f} MB/s '
+            f'{result.get("peak_kb", 0):10.1f} KB peak', file=sys.stderr)
+
+  results = {'commit': commit(), 'corpus': corpus.VERSION, 'metrics': metrics}
+  write(results, args.output)
+  check(metrics, args.baseline, args.threshold, {'ops_per_s': 'higher', 'peak_kb': 'lower', 'allocated_kb': 'lower'})
+
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,119 @@
+# Description:  This file contains the helpers shared by the benchmarks to report and compare results.
+# Path:         benchmarks/results.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import json
+import subprocess
+import sys
+from typing import Dict, Iterable, List, Union
+
+
+def summarize(values: Iterable[float]) -> Dict[str, Union[float, int, None]]:
+  """
+    Summarizes samples with their count and percentiles.
+
+    Args:
+      values (Iterable[float]): The samples.
+
+    Returns:
+      Dict[str, Union[float, int, None]]: The count, mean, p50, p90, p99 and max of the samples.
+  """
+  values = sorted(values)
+  if not values:
+    return {'count': 0, 'mean': None, 'p50': None, 'p90': None, 'p99': None, 'max': None}
+
+  def percentile(p: float) -> float:
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+  return {
+    'count': len(values),
+    'mean': sum(values) / len(values),
+    'p50': percentile(0.5),
+    'p90': percentile(0.9),
+    'p99': percentile(0.99),
+    'max': values[-1],
+  }
+
+
+
+def commit() -> Union[str, None]:
+  """
+    Returns the commit of the working tree, to label the results.
+  """
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+
+def write(results: dict, path: Union[str, None]) -> None:
+  """
+    Writes the results as JSON to a file, or to the standard output.
+
+    Args:
+      results (dict): The results.
+      path (Union[str, None]): The path of the file, or None for the standard output.
+  """
+  data = json.dumps(results, indent=2, sort_keys=True)
+  if path is None:
+    print(data)
+    return
+
+  with open(path, 'w') as f:
+    f.write(data + '\n')
+
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float,
+            keys: Dict[str, str]) -> List[str]:
+  """
+    Compares metrics against a baseline.
+
+    Args:
+      results (Dict[str, dict]): The metrics of the run, keyed by name.
+      baseline (Dict[str, dict]): The metrics of the baseline, keyed by name.
+      threshold (float): The tolerated relative regression, 0.2 for 20%.
+      keys (Dict[str, str]): For each compared field, 'lower' if lower is better or
+                             'higher' if higher is better.
+
+    Returns:
+      List[str]: A description of each regression beyond the threshold.
+  """
+  regressions = []
+  for name, metrics in results.items():
+    for key, better in keys.items():
+      current, previous = metrics.get(key), baseline.get(name, {}).get(key)
+      if current is None or not previous:
+        continue
+
+      change = (current - previous) / previous if better == 'lower' else (previous - current) / previous
+      if change > threshold:
+        regressions.append(f'{name}.{key}: {previous:.4g} -> {current:.4g} ({change:+.0%})')
+  return regressions
+
+
+
+def check(results: Dict[str, dict], baseline_path: Union[str, None], threshold: float,
+          keys: Dict[str, str]) -> None:
+  """
+    Exits with an error if the results regressed against the baseline file.
+
+    Args:
+      results (Dict[str, dict]): The metrics of the run, keyed by name.
+      baseline_path (Union[str, None]): The results of the baseline, or None to skip the comparison.
+      threshold (float): The tolerated relative regression.
+      keys (Dict[str, str]): The compared fields, see `compare`.
+  """
+  if baseline_path is None:
+    return
+
+  with open(baseline_path) as f:
+    baseline = json.load(f)
+
+  regressions = compare(results, baseline['metrics'], threshold, keys)
+  for regression in regressions:
+    print(f'regression {regression}', file=sys.stderr)
+  if regressions:
+    sys.exit(1)
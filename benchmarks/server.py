@@ -0,0 +1,81 @@
+# Description:  This file starts the app against an in-memory database for the benchmarks.
+# Path:         benchmarks/server.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import sys
+import tempfile
+
+# The paths of the configuration are relative to the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from app.cmd.app import app
+
+
+def configure(args: argparse.Namespace, folder: str) -> None:
+  """
+    Points the app to mongomock and to a temporary folder, before the modules reading
+    their configuration at import are loaded.
+
+    Args:
+      args (argparse.Namespace): The command line arguments.
+      folder (str): The temporary folder of the run.
+  """
+  app.config['MONGODB_SETTINGS'] = {'host': 'mongomock://localhost', 'db': 'benchmark'}
+  app.config['JOURNAL_FILE'] = os.path.join(folder, 'submissions.journal')
+  app.config['LOG_FILE'] = os.path.join(folder, 'round_manager.log')
+  app.config['ROUND_DURATION'] = args.round_duration
+  app.config['BREAK_DURATION'] = args.break_duration
+  app.config['DELTA_SYNC'] = args.sync == 'delta'
+  # Chromium is not available in CI: the live scoring is pushed past the run
+  app.config['LIVE_SCORE_INTERVAL'] = 24 * 60 * 60
+
+
+
+def seed(teams: int, password: str) -> None:
+  """
+    Seeds the challenges and `teams` teams of two users named `team<i>_1` and `team<i>_2`.
+
+    Args:
+      teams (int): The number of teams.
+      password (str): The password of every user.
+  """
+  from app.models import seed_challenges, seed_users
+
+  seed_challenges()
+  seed_users({f'team{i}': [(f'team{i}_1', password), (f'team{i}_2', password)] for i in range(teams)})
+
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description='Starts the app for the load benchmark.')
+  parser.add_argument('--port', type=int, default=5055)
+  parser.add_argument('--teams', type=int, default=10)
+  parser.add_argument('--password', default='benchmark')
+  parser.add_argument('--round-duration', type=int, default=3600)
+  parser.add_argument('--break-duration', type=int, default=5)
+  parser.add_argument('--sync', choices=('delta', 'full'), default='delta')
+  args = parser.parse_args()
+
+  folder = tempfile.mkdtemp(prefix='art-forgery-bench-')
+  configure(args, folder)
+
+  from app.cmd.run import init_app
+  from app.routes import socketio
+
+  init_app(app, lambda: seed(args.teams, args.password))
+
+  print(f'listening on {args.port}', flush=True)
+  socketio.run(app, host='127.0.0.1', port=args.port, log_output=False)
+
+
+
+if __name__ == '__main__':
+  main()
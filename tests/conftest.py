@@ -0,0 +1,30 @@
+# Description:  This file contains the fixtures shared by the tests.
+# Path:         tests/conftest.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import os
+import sys
+
+# The config is read when the app is imported: the tests run against an in-memory database
+os.environ.setdefault('MONGO_HOST', 'mongomock://localhost')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+
+@pytest.fixture
+def database():
+  """
+    Connects the app to an empty in-memory database.
+  """
+  from app.cmd.app import app
+  from app.database import db
+
+  from mongoengine.connection import get_db
+
+  db.init_app(app)
+  with app.app_context():
+    yield db
+    get_db().client.drop_database(get_db().name)
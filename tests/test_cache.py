@@ -0,0 +1,32 @@
+# Description:  This file contains the tests of the spill folder of the caches.
+# Path:         tests/test_cache.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import os
+import subprocess
+import time
+
+from app.cache import STALE_TEMPORARY_AGE, LRUCache
+
+
+
+def test_init_app_keeps_temporary_files_of_running_writers(tmp_path):
+  writer = subprocess.Popen(['true'])
+  writer.wait()
+  ages = {
+    f'a.pkl.{os.getpid()}.tmp': 0,
+    f'b.pkl.{writer.pid}.tmp': 0,
+    f'c.pkl.{os.getpid()}.tmp': STALE_TEMPORARY_AGE * 2,
+  }
+  for name, age in ages.items():
+    path = tmp_path / name
+    path.touch()
+    os.utime(path, (time.time() - age, time.time() - age))
+  (tmp_path / 'd.pkl').write_bytes(b'd')
+
+  cache = LRUCache(1024, str(tmp_path), 1024)
+  cache.init_app(None)
+
+  assert sorted(os.listdir(tmp_path)) == [f'a.pkl.{os.getpid()}.tmp', 'd.pkl']
+  assert cache.contains('d')
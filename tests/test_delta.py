@@ -0,0 +1,19 @@
+# Description:  This file contains the tests of the documents of the teams.
+# Path:         tests/test_delta.py
+# Author:       Capucinoxx
+# Date:         2024
+
+from app.delta import DocumentStore
+
+
+
+def test_leaks_are_dropped_with_their_round():
+  documents = DocumentStore()
+  documents.leak(1, ('a', 'html'))
+  documents.leak(1, ('b', 'html'))
+  assert documents.take_leak(1, ('a', 'html'))
+  assert not documents.take_leak(1, ('a', 'html'))
+
+  documents.replace(2, ('a', 'html'), '<p></p>')
+  assert not documents.take_leak(1, ('b', 'html'))
+  assert not documents.take_leak(2, ('b', 'html'))
@@ -0,0 +1,40 @@
+# Description:  This file contains the tests of the submission journal.
+# Path:         tests/test_journal.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import os
+
+import pytest
+from flask import Flask
+
+from app.journal import SubmissionJournal
+
+
+
+def open_journal(path: str) -> SubmissionJournal:
+  flask_app = Flask(__name__)
+  flask_app.config['JOURNAL_FILE'] = path
+  journal = SubmissionJournal()
+  journal.init_app(flask_app)
+  return journal
+
+
+def test_failed_commit_does_not_tear_the_journal(tmp_path, monkeypatch):
+  path = str(tmp_path / 'submissions.journal')
+  journal = open_journal(path)
+  journal.replay()
+  journal.start_round(1, 0.0)
+
+  def fail(fd):
+    raise OSError(28, 'No space left on device')
+
+  with monkeypatch.context() as patch:
+    patch.setattr(os, 'fsync', fail)
+    with pytest.raises(OSError):
+      journal.record(1, 'a', 'html', '<p>lost</p>')
+  journal.record(1, 'b', 'html', '<p>kept</p>')
+
+  state = open_journal(path).replay()
+  assert state.pending_round() == (1, 0.0)
+  assert state.submissions == {1: {'b': {'html': '<p>kept</p>'}}}
@@ -0,0 +1,24 @@
+# Description:  This file contains the tests of the buffered log writer.
+# Path:         tests/test_logs.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import io
+import sys
+
+from app.logs import BufferedLogWriter
+
+
+
+def test_closed_stderr_does_not_lose_records(tmp_path, monkeypatch):
+  stderr = io.StringIO()
+  stderr.close()
+  monkeypatch.setattr(sys, 'stderr', stderr)
+  path = tmp_path / 'app.log'
+  writer = BufferedLogWriter(str(path), stream=True)
+
+  writer.append('kept')
+  writer.flush()
+
+  assert path.read_text().endswith('kept\n')
+  assert (writer.written, writer.failures) == (1, 0)
@@ -0,0 +1,18 @@
+# Description:  This file contains the tests of the persistence of the rounds.
+# Path:         tests/test_persistence.py
+# Author:       Capucinoxx
+# Date:         2024
+
+from app.models import SubmissionType, Submission, Team, persist_sumbissions
+
+
+
+def test_persist_round_with_lone_surrogate(database):
+  team = Team(name='a')
+  team.save()
+  html, css = '<p>a\ud800</p>', 'p { content: "\udfff"; }'
+
+  persist_sumbissions(1, {team.id: {SubmissionType.HTML: html, SubmissionType.CSS: css}})
+
+  submission = Submission.objects.get(team=team, round_number=1)
+  assert submission.code() == (html, css)
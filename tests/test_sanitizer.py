@@ -0,0 +1,96 @@
+# Description:  This file contains the differential tests of the stylesheet sanitizer.
+# Path:         tests/test_sanitizer.py
+# Author:       Capucinoxx
+# Date:         2024
+
+import random
+import re
+import warnings
+
+import pytest
+from bs4 import BeautifulSoup
+
+from app.sanitizer import CSSSanitizer, sanitize_css
+
+
+# Fragments of markup, valid or not, assembled at random into the documents of the corpus
+MARKUP_FRAGMENTS = [
+  'a{b:c}', '\n', ' ', '\t', 'x', '"', "'", '<', '>', '=', '/', '&', '&amp', '&amp;', '&#x41;',
+  '&#0;', '&notit;', '&#1114112;', '<P>', '</P>', '<DIV>', '</div>', '<li>', '<ul>', '</ul>',
+  '<td>', '<tr>', '<table>', '</table>', '<pre>', '</pre>', '<pre>\n', '<h1>', '</h1>',
+  '<TITLE>', '</TITLE >', '<title background=" b  c ">', '<Style>', '</style\n>',
+  '<script type="x">', '</script/>', '<iframe>', '</iframe>', '<iframe/>', '<iframe src="a>',
+  '<textarea>', '</textarea x="<">', '<select>', '<option>', '<rt>', '</rp>', '<rp>',
+  '<template>', '</template>', '<svg>', '</svg>', '<svg:x>', '<head>', '</head>', '<body>',
+  '</body>', '<html>', '</html>', '<meta charset="x">', '<link>', '<base>', '<foo>', '</foo>',
+  '<a b=\'c>d\'>', '<a b=c>d>', '<a b = "c" >', '<b/ c>', '<b =x>', '<b "c">', '<b c="d>',
+  '<!---->', '<!--->', '<!--c-->', '<!-- -- -->', '<!--', '--!>', '-->', '<?xml x?>',
+  '<!DOCTYPE html>', '<!doctype x SYSTEM "y">', '<!>', '</ >', '</>', '</3>', '<3', '< a>',
+  '<plaintext>', '<xmp>', '</xmp>', '<noembed>', '</noembed>', '<noframes>', '<noscript>',
+  '</noscript>', '\ufeff', '\x00', '\r', '\r\n', '\x0c', '\x0b', '\xa0', '\xe9',
+]
+# Fragments of stylesheets, whose forbidden constructs have the simple forms the regular
+# expressions of the former implementation matched
+CSS_FRAGMENTS = [
+  'a { color: red; }', '\n', '  ', 'div > p', '.x::before { content: "hi"; }',
+  '@import "x.css";', "@import url('y.css');", '@IMPORT "z.css";', 'b { background: URL(a.png); }',
+  'c { width: expression(a.b); }', 'b{}', '<style>', '</style>', '<b>', '</b>',
+  '<script>x</script>', '<!-- c -->', '&amp;', '&gt;', '&nbsp;', '#id{margin:0 auto}',
+  '@media (max-width: 10px) { a { b: c } }', 'calc(1px + 2px)', 'rgba(0,0,0,.5)', '\t', '}', '{',
+  ';', ':', '"', "'", '/* comment */', '<p>', '</p>', '<br/>', '<textarea>t</textarea>',
+  '<title>t</title>', '<iframe>i</iframe>', '< 3', '&#65;', '\xe9', '\r\n',
+  '@font-face{font-family:x}', '<div class="x">', '</div>',
+]
+
+
+
+def get_text(css: str) -> str:
+  with warnings.catch_warnings():
+    warnings.simplefilter('ignore')
+    return BeautifulSoup(css, 'lxml').get_text()
+
+
+def cleanup_css(css: str) -> str:
+  """
+    The former implementation of the sanitizer.
+  """
+  css = get_text(css)
+  css = re.sub(r'(?i)@import.*?;', '', css)
+  css = re.sub(r'(?i)url\(.*?\)', '', css)
+  css = re.sub(r'(?i)expression\(.*?\)', '', css)
+  return css
+
+
+def corpus(fragments, seed: int, size: int, length: int):
+  rng = random.Random(seed)
+  return [''.join(rng.choice(fragments) for _ in range(rng.randint(0, length))) for _ in range(size)]
+
+
+
+@pytest.mark.parametrize('css', [
+  '<iframe></iframe>x',
+  '<!--c--><title background=" b  c "></title>',
+  '<iframe src="a>' + 'b { color: red; } ' * 8,
+  '<svg><style>a { b: c }</style></svg>x',
+  '<title>a &amp; b</title><p>c',
+  '\ufeff\ufeff',
+])
+def test_strip_markup_matches_lxml(css):
+  assert CSSSanitizer().strip_markup(css) == get_text(css)
+
+
+def test_strip_markup_matches_lxml_on_corpus():
+  sanitizer = CSSSanitizer()
+  mismatches = [
+    css for css in corpus(MARKUP_FRAGMENTS, 7, 3000, 16)
+    if sanitizer.strip_markup(css) != get_text(css)
+  ]
+  assert mismatches == []
+
+
+def test_sanitize_css_matches_former_implementation_on_corpus():
+  mismatches = [
+    css for css in corpus(CSS_FRAGMENTS, 11, 2000, 25)
+    if sanitize_css(css) != cleanup_css(css)
+  ]
+  assert mismatches == []
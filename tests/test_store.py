@@ -0,0 +1,23 @@
+# Description:  This file contains the tests of the store of the submissions.
+# Path:         tests/test_store.py
+# Author:       Capucinoxx
+# Date:         2024
+
+from bson import ObjectId
+
+from app.models import SubmissionType
+from app.store import BackendSubmissionStore
+
+
+
+def test_backend_store_rejects_rounds_not_open():
+  store, team_id = BackendSubmissionStore(), ObjectId()
+  assert store.put(1, team_id, SubmissionType.HTML, '<p>early</p>') is None
+
+  store.begin(1)
+  assert store.put(2, team_id, SubmissionType.HTML, '<p>next</p>') is None
+  assert store.put(1, team_id, SubmissionType.HTML, '<p>kept</p>').html == '<p>kept</p>'
+
+  generation = store.end(1)
+  assert store.put(1, team_id, SubmissionType.CSS, 'p {}') is None
+  assert generation.collect() == {team_id: {SubmissionType.HTML: '<p>kept</p>'}}